@@ -0,0 +1,42 @@
+"""
+Бенчмарк выгрузки: скорость и пиковая память при потоковом экспорте.
+
+Память не должна расти с числом строк: сравните peak RSS на 10k и 1M
+пользователей (benchmarks.generate_data --users 1000000).
+
+Использование: python -m benchmarks.bench_export --kind users --format jsonl --gzip
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.common import peak_rss_mb
+from bot.db.base import engine
+from bot.services.export import EXPORT_FORMATS, EXPORT_KINDS, export_filename, export_to_file
+
+
+async def main(args):
+    rss_before = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, export_filename(args.kind, args.format, args.gzip))
+        started = time.perf_counter()
+        rows = await export_to_file(args.kind, args.format, path, args.gzip)
+        elapsed = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+    print(
+        f"export {args.kind}.{args.format}{'.gz' if args.gzip else ''}: {rows} rows in {elapsed:.2f} s "
+        f"({rows / elapsed if elapsed else 0:.0f} rows/s), file {size_mb:.1f} MB"
+    )
+    print(f"peak RSS: {peak_rss_mb():.1f} MB (before export {rss_before:.1f} MB)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк выгрузки")
+    parser.add_argument("--kind", choices=EXPORT_KINDS, default="users")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    asyncio.run(main(parser.parse_args()))
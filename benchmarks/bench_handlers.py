@@ -0,0 +1,215 @@
+"""
+Бенчмарк горячих обработчиков: /start, /status, pay_done и pay_confirm.
+
+Апдейты проходят через настоящий Dispatcher со всеми middleware, ответы
+уходят в локальный fake Bot API. Нужны данные из benchmarks.generate_data.
+
+pay_done и pay_confirm меняют данные (заявки, продление подписок):
+для одинаковых прогонов перегенерируйте набор с --reset.
+
+В конце --race одновременных регистраций и заявок одного пользователя
+проверяют, что upsert'ы не создают дублей (антифлуд при этом обходится).
+
+Использование: python -m benchmarks.bench_handlers --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from aiogram.types import Update
+from sqlalchemy import func, select, text
+
+from benchmarks.common import BENCH_TELEGRAM_BASE, BenchResult, print_report, run_concurrent
+from benchmarks.fake_bot_api import add_api_arguments, api_from_args, make_bot
+from bot.config import ADMIN_ID
+from bot.db.base import AsyncSessionLocal, engine
+from bot.db.models import Payment, Subscription, User
+from bot.db.repository import create_payment_request, id_in
+from bot.main import create_dispatcher
+from bot.services.user_cache import register_user, user_cache
+
+# Отдельный синтетический пользователь для проверки гонок
+RACE_TELEGRAM_ID = BENCH_TELEGRAM_BASE + 900_000_000
+
+_update_id = 0
+
+
+def _next_id() -> int:
+    global _update_id
+    _update_id += 1
+    return _update_id
+
+
+def _user(telegram_id: int) -> dict:
+    return {"id": telegram_id, "is_bot": False, "first_name": "Bench", "username": f"u{telegram_id}"}
+
+
+def message_update(telegram_id: int, text_: str) -> Update:
+    return Update.model_validate({
+        "update_id": _next_id(),
+        "message": {
+            "message_id": _update_id,
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": _user(telegram_id),
+            "text": text_,
+        },
+    })
+
+
+def callback_update(telegram_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": _next_id(),
+        "callback_query": {
+            "id": str(_update_id),
+            "from": _user(telegram_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": _update_id,
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "text": "bench",
+            },
+        },
+    })
+
+
+async def active_users(limit: int) -> list[int]:
+    """telegram_id синтетических пользователей с активной подпиской"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(User.telegram_id)
+            .join(Subscription, Subscription.user_id == User.id)
+            .where(User.telegram_id > BENCH_TELEGRAM_BASE, Subscription.status == "active")
+            .order_by(User.telegram_id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+async def requested_payments(telegram_ids: list[int]) -> list[int]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Payment.id)
+            .join(User, User.id == Payment.user_id)
+            .where(id_in(User.telegram_id, telegram_ids), Payment.status == "requested")
+        )
+        return list(result.scalars().all())
+
+
+async def clear_today_requests(telegram_ids: list[int]):
+    """Чтобы pay_done шёл по полному пути, а не отвечал «уже отправили сегодня»"""
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "DELETE FROM payments USING users"
+                " WHERE payments.user_id = users.id AND payments.status = 'requested'"
+                " AND users.telegram_id = ANY(:ids)"
+            ),
+            {"ids": telegram_ids},
+        )
+
+
+async def race(telegram_id: int, clicks: int) -> tuple[int, int]:
+    """
+    clicks одновременных /start нового пользователя и столько же заявок
+    от него. Возвращает (строк users, заявок за сегодня) — обе должны быть 1.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "DELETE FROM payments USING users"
+                " WHERE payments.user_id = users.id AND users.telegram_id = :id"
+            ),
+            {"id": telegram_id},
+        )
+        await conn.execute(text("DELETE FROM users WHERE telegram_id = :id"), {"id": telegram_id})
+    user_cache.invalidate(telegram_id)
+
+    async def start():
+        user_cache.invalidate(telegram_id)
+        snapshot, _ = await register_user(telegram_id, f"u{telegram_id}")
+        return snapshot
+
+    snapshots = await asyncio.gather(*(start() for _ in range(clicks)))
+
+    async def click():
+        async with AsyncSessionLocal() as session:
+            await create_payment_request(session, snapshots[0].id, datetime.now(timezone.utc))
+            await session.commit()
+
+    await asyncio.gather(*(click() for _ in range(clicks)))
+
+    async with AsyncSessionLocal() as session:
+        users = await session.scalar(
+            select(func.count()).select_from(User).where(User.telegram_id == telegram_id)
+        )
+        requests = await session.scalar(
+            select(func.count()).select_from(Payment)
+            .where(Payment.user_id == snapshots[0].id, Payment.status == "requested")
+        )
+    return users, requests
+
+
+async def main(args):
+    api = api_from_args(args)
+    await api.start()
+    bot = make_bot(api.url)
+    dp = create_dispatcher()
+
+    async def feed(update: Update):
+        await dp.feed_update(bot, update)
+
+    users = await active_users(args.requests)
+    if not users:
+        raise SystemExit("Нет синтетических пользователей: запустите benchmarks.generate_data")
+    # Пользователей может быть меньше, чем запросов, — идём по кругу
+    cycle = [users[i % len(users)] for i in range(args.requests)]
+    results: list[BenchResult] = []
+
+    user_cache.clear()
+    results.append(await run_concurrent(
+        "/start (cold)", feed, [message_update(uid, "/start") for uid in cycle], args.concurrency
+    ))
+    results.append(await run_concurrent(
+        "/start (warm)", feed, [message_update(uid, "/start") for uid in cycle], args.concurrency
+    ))
+    results.append(await run_concurrent(
+        "/status", feed, [message_update(uid, "/status") for uid in cycle], args.concurrency
+    ))
+
+    await clear_today_requests(users)
+    results.append(await run_concurrent(
+        "pay_done", feed, [callback_update(uid, "pay_done") for uid in users], args.concurrency
+    ))
+
+    payments = await requested_payments(users)
+    results.append(await run_concurrent(
+        "pay_confirm",
+        feed,
+        [callback_update(ADMIN_ID, f"pay_confirm:{payment_id}") for payment_id in payments],
+        args.concurrency,
+    ))
+
+    print_report(results)
+    print(f"Bot API calls: {api.calls}")
+
+    if args.race:
+        users_count, requests_count = await race(RACE_TELEGRAM_ID, args.race)
+        status = "OK" if users_count == requests_count == 1 else "FAIL"
+        print(f"race x{args.race}: users={users_count} requests={requests_count}  {status}")
+
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--race", type=int, default=100, help="одновременных /start и заявок, 0 — пропустить")
+    add_api_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""
+Бенчмарк массового импорта (import_users.py): COPY + один upsert.
+
+Первый прогон вставляет строки, повторный с тем же --seed — обновляет их.
+Импортируемые telegram_id лежат выше диапазона generate_data.
+
+Использование: python -m benchmarks.bench_import --rows 100000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+
+from benchmarks.common import BENCH_TELEGRAM_BASE, peak_rss_mb
+from import_users import import_users
+
+# Отдельный диапазон, чтобы не задевать пользователей generate_data
+IMPORT_TELEGRAM_BASE = BENCH_TELEGRAM_BASE + 500_000_000
+
+
+def write_csv(path: str, rows: int, seed: int):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["telegram_id", "username", "next_payment", "period_days", "status"])
+        for i in range(1, rows + 1):
+            writer.writerow([
+                IMPORT_TELEGRAM_BASE + i,
+                f"imported{i}" if rng.random() < 0.9 else "",
+                (now + timedelta(days=rng.uniform(-5, 30))).isoformat(),
+                30,
+                "active",
+            ])
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "import.csv")
+        write_csv(path, args.rows, args.seed)
+
+        started = time.perf_counter()
+        counts = await import_users(path)
+        elapsed = time.perf_counter() - started
+
+    print(
+        f"import {args.rows} rows in {elapsed:.2f} s ({args.rows / elapsed if elapsed else 0:.0f} rows/s): "
+        f"users +{counts['users_inserted']}/~{counts['users_updated']}, "
+        f"subscriptions +{counts['subscriptions_inserted']}/~{counts['subscriptions_updated']}"
+    )
+    print(f"peak RSS: {peak_rss_mb():.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк импорта")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
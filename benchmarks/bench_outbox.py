@@ -0,0 +1,69 @@
+"""
+Бенчмарк отправки: outbox → SendPipeline → fake Bot API.
+
+Кладёт в outbox N уведомлений синтетическим пользователям и разбирает их
+dispatch_batch, пока не останется готовых к отправке. Ответы 429 и 403
+включаются флагами fake API; повторы с backoff в прогон не попадают.
+
+Использование:
+python -m benchmarks.bench_outbox --messages 5000 --send-rate 1000 --latency-ms 30 --rate-429 0.01
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import BENCH_TELEGRAM_BASE, BenchResult, print_report
+from benchmarks.fake_bot_api import add_api_arguments, api_from_args, make_bot
+from bot.config import SEND_RATE, SEND_WORKERS
+from bot.db.base import AsyncSessionLocal, engine
+from bot.services.outbox import dispatch_batch, enqueue_notifications
+from bot.services.sender import SendPipeline
+
+
+async def main(args):
+    api = api_from_args(args)
+    await api.start()
+    bot = make_bot(api.url)
+    sender = SendPipeline(bot, workers=args.workers, rate=args.send_rate)
+    sender.start()
+
+    async with AsyncSessionLocal() as session:
+        await enqueue_notifications(
+            session,
+            ((BENCH_TELEGRAM_BASE + i, f"bench message {i}", None) for i in range(1, args.messages + 1)),
+        )
+        await session.commit()
+
+    result = BenchResult("outbox batch")
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        sent = await dispatch_batch(sender)
+        if not sent:
+            break
+        result.latencies.append(time.perf_counter() - batch_started)
+    result.seconds = time.perf_counter() - started
+
+    delivered = len(api.sent)
+    result.errors = sum(api.errors.values())
+    result.extra = {
+        "delivered": delivered,
+        "msg/s": f"{delivered / result.seconds:.1f}" if result.seconds else "0",
+        "429": api.errors.get(429, 0),
+        "403": api.errors.get(403, 0),
+    }
+    print_report([result])
+
+    await sender.stop()
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк отправки уведомлений")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=SEND_WORKERS)
+    parser.add_argument("--send-rate", type=float, default=SEND_RATE, help="лимит сообщений в секунду")
+    add_api_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
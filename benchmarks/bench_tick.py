@@ -0,0 +1,229 @@
+"""
+Бенчмарк тика планировщика: загрузка очереди и обработка наступивших дедлайнов.
+
+Тик должен читать из БД только наступившие подписки, а не все активные:
+для каждого прогона печатаются строки, которые тик получил из БД, и число
+запросов. С --sizes 10000,100000,1000000 данные перегенерируются под каждый
+размер (по подписке на пользователя), и видно, растёт ли тик вместе с базой.
+
+С --partitions N запускаются N процессов-воркеров, каждый со своей партицией
+id % N, как у python -m bot.worker. Воркеры загружают очереди, затем
+одновременно разбирают наступившие подписки тиками по --tick-size и
+печатают суммарную пропускную способность (тиков и подписок в секунду).
+Сравните с --partitions 1 на тех же данных.
+
+Тик записывает напоминания в reminder_log и просрочивает подписки.
+--reset-reminders очищает reminder_log синтетических подписок, снимает
+с пользователей отметки о недоступности (их ставит bench_outbox с --rate-403)
+и удаляет неотправленные уведомления перед прогоном;
+просрочки необратимы — для одинаковых прогонов перегенерируйте данные.
+
+Напоминания занимаются только в окне доставки пользователя
+(DELIVERY_WINDOW_START–END по его времени): вне окна тик их не отправит,
+а загрузка разложит дедлайны по слотам окна.
+
+Использование:
+    python -m benchmarks.bench_tick --reset-reminders
+    python -m benchmarks.bench_tick --sizes 10000,100000,1000000
+    python -m benchmarks.bench_tick --partitions 4 --reset-reminders
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event, text
+
+from benchmarks.common import BENCH_TELEGRAM_BASE, peak_rss_mb
+from benchmarks.generate_data import generate
+from bot.db.base import engine
+from bot.services.reminder_queue import ReminderQueue
+from bot.services.scheduler import load_queue, process_due
+
+
+async def reset_reminders():
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "DELETE FROM reminder_log USING subscriptions, users"
+                " WHERE reminder_log.subscription_id = subscriptions.id"
+                " AND subscriptions.user_id = users.id AND users.telegram_id > :base"
+            ),
+            {"base": BENCH_TELEGRAM_BASE},
+        )
+        await conn.execute(
+            text(
+                "UPDATE users SET delivery_state = 'ok', delivery_retry_at = NULL"
+                " WHERE telegram_id > :base AND (delivery_state <> 'ok' OR delivery_retry_at IS NOT NULL)"
+            ),
+            {"base": BENCH_TELEGRAM_BASE},
+        )
+        await conn.execute(
+            text("DELETE FROM notifications WHERE status IN ('pending', 'sending') AND chat_id > :base"),
+            {"base": BENCH_TELEGRAM_BASE},
+        )
+
+
+async def active_subscriptions() -> int:
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SELECT count(*) FROM subscriptions WHERE status = 'active'"))
+
+
+class RowCounter:
+    """Запросы и строки, полученные из БД, пока счётчик включён"""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.enabled = False
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.enabled:
+            return
+        self.statements += 1
+        # rowcount у UPDATE без RETURNING — изменённые строки, а не полученные
+        if cursor.description is not None and cursor.rowcount > 0:
+            self.rows += cursor.rowcount
+
+
+async def tick(partitions, counter: RowCounter) -> dict:
+    queue = ReminderQueue()
+
+    started = time.perf_counter()
+    await load_queue(queue, partitions)
+    loaded = time.perf_counter()
+
+    counter.statements = counter.rows = 0
+    counter.enabled = True
+    due_ids = queue.pop_due(datetime.now(timezone.utc))
+    if due_ids:
+        await process_due(queue, due_ids)
+    finished = time.perf_counter()
+    counter.enabled = False
+
+    return {
+        "queued": len(queue) + len(due_ids),
+        "due": len(due_ids),
+        "load_s": loaded - started,
+        "tick_s": finished - loaded,
+        "rows": counter.rows,
+        "statements": counter.statements,
+    }
+
+
+def print_tick(label: str, result: dict):
+    print(
+        f"{label:<14} queued={result['queued']:<8} due={result['due']:<7} "
+        f"rows={result['rows']:<7} statements={result['statements']:<3} "
+        f"load={result['load_s'] * 1000:>9.1f} ms  tick={result['tick_s'] * 1000:>9.1f} ms"
+    )
+
+
+async def run_sizes(sizes: list[int]):
+    """Один тик на наборах разного размера: строки тика не должны расти вместе с базой"""
+    counter = RowCounter()
+    for size in sizes:
+        print(f"🧪 {size} подписок")
+        await generate(size, subscription_share=1.0, reset=True)
+        result = await tick(None, counter)
+        print_tick(f"active={await active_subscriptions()}", result)
+
+
+async def run_worker(index: int, count: int, tick_size: int):
+    """Процесс-воркер для --partitions: загрузка, сигнал готовности, тики по команде"""
+    counter = RowCounter()
+    queue = ReminderQueue()
+    await load_queue(queue, ((index, count),))
+    print("ready", flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+
+    counter.enabled = True
+    started = time.perf_counter()
+    due_ids = queue.pop_due(datetime.now(timezone.utc))
+    ticks = 0
+    for offset in range(0, len(due_ids), tick_size):
+        await process_due(queue, due_ids[offset:offset + tick_size])
+        ticks += 1
+    seconds = time.perf_counter() - started
+    counter.enabled = False
+
+    print(json.dumps({
+        "ticks": ticks,
+        "due": len(due_ids),
+        "seconds": seconds,
+        "rows": counter.rows,
+        "statements": counter.statements,
+    }), flush=True)
+
+
+async def run_partitions(count: int, tick_size: int):
+    """N воркеров одновременно, каждый в своём процессе"""
+    workers = [
+        await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.bench_tick",
+            "--worker", f"{index}/{count}", "--tick-size", str(tick_size),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        for index in range(count)
+    ]
+    # Все загрузили очереди — стартуем одновременно
+    for worker in workers:
+        line = (await worker.stdout.readline()).decode().strip()
+        if line != "ready":
+            raise SystemExit(f"Воркер не запустился: {line!r}")
+    for worker in workers:
+        worker.stdin.write(b"go\n")
+        await worker.stdin.drain()
+
+    stats = []
+    for index, worker in enumerate(workers):
+        stats.append(json.loads(await worker.stdout.readline()))
+        await worker.wait()
+        result = stats[-1]
+        print(
+            f"worker {index}/{count}  due={result['due']:<7} ticks={result['ticks']:<5} "
+            f"rows={result['rows']:<7} {result['seconds']:>7.2f} s"
+        )
+    # Старт общий, поэтому время кластера — самый медленный воркер
+    wall = max(s["seconds"] for s in stats)
+
+    ticks = sum(s["ticks"] for s in stats)
+    due = sum(s["due"] for s in stats)
+    print(
+        f"workers={count}  {ticks / wall:.1f} ticks/s  {due / wall:.0f} subscriptions/s  "
+        f"(tick size {tick_size}, wall {wall:.2f} s)"
+    )
+
+
+async def main(args):
+    if args.worker:
+        index, count = map(int, args.worker.split("/"))
+        await run_worker(index, count, args.tick_size)
+        await engine.dispose()
+        return
+
+    if args.reset_reminders:
+        await reset_reminders()
+
+    if args.sizes:
+        await run_sizes([int(size) for size in args.sizes.split(",")])
+    elif args.partitions:
+        await run_partitions(args.partitions, args.tick_size)
+    else:
+        print_tick("all", await tick(None, RowCounter()))
+    print(f"peak RSS: {peak_rss_mb():.1f} MB")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк тика планировщика")
+    parser.add_argument("--partitions", type=int, default=0, help="число процессов-воркеров (id %% N)")
+    parser.add_argument("--tick-size", type=int, default=500, help="подписок на тик у воркера")
+    parser.add_argument("--sizes", help="размеры наборов через запятую, например 10000,100000,1000000")
+    parser.add_argument("--reset-reminders", action="store_true")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    asyncio.run(main(parser.parse_args()))
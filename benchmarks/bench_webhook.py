@@ -0,0 +1,141 @@
+"""
+Нагрузочный тест webhook-режима: HTTP → aiohttp → SimpleRequestHandler → обработчики.
+
+Поднимает тот же aiohttp-сервер, что и run_webhook в bot.main, с проверкой
+секретного заголовка, и шлёт ему POST'ы с апдейтами /start, /status и
+pay_done от синтетических пользователей. Ответы бота уходят в fake Bot API.
+Нужны данные из benchmarks.generate_data.
+
+По умолчанию апдейт обрабатывается до ответа на POST, и задержка — это
+время обработчика вместе с HTTP. С --background сервер отвечает сразу,
+как в продакшене: задержка — только приём апдейта, а пропускная
+способность считается до конца обработки всех апдейтов прогона.
+
+Использование: python -m benchmarks.bench_webhook --requests 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import secrets
+import time
+
+from aiohttp import ClientSession, web
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from benchmarks.bench_handlers import active_users, callback_update, clear_today_requests, message_update
+from benchmarks.common import BenchResult, print_report, run_concurrent
+from benchmarks.fake_bot_api import add_api_arguments, api_from_args, make_bot
+from bot.config import WEBHOOK_PATH
+from bot.db.base import engine
+from bot.main import create_dispatcher
+from bot.services.user_cache import user_cache
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateCounter:
+    """Outer middleware: сколько апдейтов диспетчер уже обработал"""
+
+    def __init__(self):
+        self.done = 0
+        self._changed = asyncio.Event()
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            self.done += 1
+            self._changed.set()
+
+    async def wait_for(self, total: int):
+        while self.done < total:
+            self._changed.clear()
+            await self._changed.wait()
+
+
+async def start_webhook_server(dp, bot, secret: str, background: bool) -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=background,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}{WEBHOOK_PATH}"
+
+
+async def main(args):
+    api = api_from_args(args)
+    await api.start()
+    bot = make_bot(api.url)
+    dp = create_dispatcher()
+    counter = UpdateCounter()
+    dp.update.outer_middleware(counter)
+    secret = secrets.token_urlsafe(32)
+    runner, url = await start_webhook_server(dp, bot, secret, args.background)
+
+    users = await active_users(args.requests)
+    if not users:
+        raise SystemExit("Нет синтетических пользователей: запустите benchmarks.generate_data")
+    cycle = [users[i % len(users)] for i in range(args.requests)]
+
+    async with ClientSession(headers={SECRET_HEADER: secret}) as http:
+        async def post(update: Update):
+            async with http.post(
+                url,
+                data=update.model_dump_json(by_alias=True, exclude_none=True),
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                await response.read()
+
+        async def run(name: str, updates: list[Update]) -> BenchResult:
+            expected = counter.done + len(updates)
+            result = await run_concurrent(name, post, updates, args.concurrency)
+            # С --background обработка продолжается после ответов на POST
+            drain_started = time.perf_counter()
+            await counter.wait_for(expected)
+            result.seconds += time.perf_counter() - drain_started
+            return result
+
+        # Апдейт без верного секрета должен отбиваться до обработчиков
+        async with http.post(
+            url,
+            data=message_update(users[0], "/status").model_dump_json(by_alias=True, exclude_none=True),
+            headers={SECRET_HEADER: "wrong", "Content-Type": "application/json"},
+        ) as response:
+            rejected = response.status == 401
+
+        results: list[BenchResult] = []
+        user_cache.clear()
+        results.append(await run("webhook /start", [message_update(uid, "/start") for uid in cycle]))
+        results.append(await run("webhook /status", [message_update(uid, "/status") for uid in cycle]))
+        await clear_today_requests(users)
+        results.append(await run("webhook pay_done", [callback_update(uid, "pay_done") for uid in users]))
+
+    mode = "приём апдейта (--background)" if args.background else "обработка апдейта"
+    print(f"Задержка: {mode}")
+    print_report(results)
+    print(f"Неверный секрет отклонён: {'OK' if rejected else 'FAIL'}")
+    print(f"Bot API calls: {api.calls}")
+
+    await runner.cleanup()
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-эндпоинта")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--background", action="store_true", help="отвечать до обработки, как в продакшене")
+    add_api_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
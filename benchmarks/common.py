@@ -0,0 +1,84 @@
+"""
+Общие части бенчмарков: замер задержек, перцентили, пиковый RSS и отчёт.
+
+Бенчмарки пишут в БД и разбирают весь outbox — запускайте их на отдельной базе.
+"""
+import asyncio
+import math
+import resource
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable
+
+# Диапазон telegram_id синтетических пользователей — не пересекается с реальными
+BENCH_TELEGRAM_BASE = 9_000_000_000
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class BenchResult:
+    name: str
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    def row(self) -> str:
+        throughput = self.count / self.seconds if self.seconds else 0.0
+        line = (
+            f"{self.name:<18} n={self.count:<7} {throughput:>9.1f}/s  "
+            f"p50={percentile(self.latencies, 50) * 1000:>8.2f} ms  "
+            f"p99={percentile(self.latencies, 99) * 1000:>8.2f} ms  "
+            f"errors={self.errors}"
+        )
+        if self.extra:
+            line += "  " + " ".join(f"{k}={v}" for k, v in self.extra.items())
+        return line
+
+
+async def run_concurrent(
+    name: str,
+    call: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    concurrency: int,
+) -> BenchResult:
+    """Вызвать call для каждого элемента, не больше concurrency одновременно"""
+    result = BenchResult(name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(item)
+            except Exception:
+                result.errors += 1
+            finally:
+                result.latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def print_report(results: list[BenchResult]):
+    for result in results:
+        print(result.row())
+    print(f"peak RSS: {peak_rss_mb():.1f} MB")
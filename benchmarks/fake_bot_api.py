@@ -0,0 +1,174 @@
+"""
+Локальная замена Telegram Bot API на aiohttp.
+
+Отвечает на методы, которыми пользуется бот, записывает вызовы sendMessage
+и умеет добавлять задержку и ответы 429/403 с заданной вероятностью.
+
+Отдельно: python -m benchmarks.fake_bot_api --port 8081 --latency-ms 50 --rate-429 0.01
+Бот направляется сюда через make_bot(api.url).
+"""
+import argparse
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+
+from bot.config import BOT_TOKEN
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+@dataclass
+class SentMessage:
+    chat_id: int
+    text: str
+    at: float
+
+
+@dataclass
+class FakeBotAPI:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_429: float = 0.0
+    rate_403: float = 0.0
+    retry_after: int = 1
+    seed: Optional[int] = 42
+
+    sent: list[SentMessage] = field(default_factory=list)
+    calls: dict[str, int] = field(default_factory=dict)
+    errors: dict[int, int] = field(default_factory=dict)
+    url: str = ""
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def reset(self):
+        self.sent.clear()
+        self.calls.clear()
+        self.errors.clear()
+
+    def _error(self, code: int, description: str, **parameters) -> web.Response:
+        self.errors[code] = self.errors.get(code, 0) + 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    def _message(self, chat_id: int, text: Optional[str] = None) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+
+        if self.latency_ms or self.jitter_ms:
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            await asyncio.sleep(max(delay, 0) / 1000)
+
+        if method == "sendMessage":
+            roll = self._random.random()
+            if roll < self.rate_429:
+                return self._error(
+                    429,
+                    f"Too Many Requests: retry after {self.retry_after}",
+                    retry_after=self.retry_after,
+                )
+            if roll < self.rate_429 + self.rate_403:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+
+            chat_id = int(data["chat_id"])
+            self.sent.append(SentMessage(chat_id, data["text"], time.monotonic()))
+            result = self._message(chat_id, data["text"])
+        elif method == "getMe":
+            result = BOT_USER
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._message(int(data.get("chat_id", 0)), data.get("text"))
+        elif method == "sendDocument":
+            result = self._message(int(data["chat_id"]))
+        else:
+            # answerCallbackQuery, deleteWebhook и прочие методы с ответом True
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.url = f"http://{bound_host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def make_bot(api_url: str, token: str = BOT_TOKEN) -> Bot:
+    """Бот, который ходит в локальный API вместо api.telegram.org"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return Bot(
+        token=token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+async def _main(args):
+    api = api_from_args(args)
+    url = await api.start(args.host, args.port)
+    print(f"Fake Bot API listening on {url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"sendMessage: {len(api.sent)}, errors: {api.errors}, calls: {api.calls}")
+    finally:
+        await api.stop()
+
+
+def add_api_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-403", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+
+
+def api_from_args(args) -> FakeBotAPI:
+    return FakeBotAPI(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        rate_403=args.rate_403,
+        retry_after=args.retry_after,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_api_arguments(parser)
+    asyncio.run(_main(parser.parse_args()))
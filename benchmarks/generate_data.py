@@ -0,0 +1,155 @@
+"""
+Синтетические users/subscriptions/payments для бенчмарков.
+
+Строки генерируются на стороне Postgres (generate_series), поэтому
+миллион пользователей заливается за секунды. setseed делает набор
+повторяемым.
+
+Распределение next_payment у подписок:
+- 80% активны: платёж равномерно в ближайшие 30 дней, причём треть
+  привязана к 1-му числу (биллинг «в начале месяца»), а ~3% уже
+  в окне напоминания (сегодня/завтра), половина из них — с напоминанием
+- 5% активны, но платёж уже прошёл — их просрочит ближайший тик
+- 15% истекли от 1 до 180 дней назад
+
+У 20% пользователей свой часовой пояс от Калининграда до Владивостока,
+у остальных — DEFAULT_TIMEZONE.
+
+Использование: python -m benchmarks.generate_data --users 100000 [--reset]
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import BENCH_TELEGRAM_BASE
+from bot.config import DEFAULT_TIMEZONE
+from bot.db.base import engine
+from bot.db.migrations import migrate
+
+RESET = [
+    "DELETE FROM payments USING users"
+    " WHERE payments.user_id = users.id AND users.telegram_id > :base",
+    "DELETE FROM subscriptions USING users"
+    " WHERE subscriptions.user_id = users.id AND users.telegram_id > :base",
+    "DELETE FROM notifications WHERE chat_id > :base",
+    "DELETE FROM users WHERE telegram_id > :base",
+]
+
+USERS = """
+INSERT INTO users (telegram_id, username, created_at, timezone)
+SELECT
+    CAST(:base AS BIGINT) + g,
+    CASE WHEN random() < 0.9 THEN 'user' || g END,
+    now() - random() * interval '730 days',
+    CASE WHEN random() < 0.2 THEN (ARRAY[
+        'Europe/Kaliningrad', 'Asia/Yekaterinburg', 'Asia/Novosibirsk', 'Asia/Vladivostok'
+    ])[1 + floor(random() * 4)::int] END
+FROM generate_series(1, :count) AS g
+ON CONFLICT (telegram_id) DO NOTHING
+"""
+
+SUBSCRIPTIONS = """
+INSERT INTO subscriptions (user_id, next_payment, status, period_days)
+SELECT
+    id,
+    CASE
+        WHEN r < 0.03 THEN date_trunc('day', now()) + floor(random() * 2) * interval '1 day'
+                           + random() * interval '23 hours'
+        WHEN r < 0.30 THEN date_trunc('month', now()) + interval '1 month'
+        WHEN r < 0.80 THEN now() + random() * interval '30 days'
+        WHEN r < 0.85 THEN now() - random() * interval '3 days'
+        ELSE now() - interval '1 day' - random() * interval '179 days'
+    END,
+    CASE WHEN r < 0.85 THEN 'active' ELSE 'expired' END,
+    30
+FROM (
+    SELECT id, random() AS r
+    FROM users
+    WHERE telegram_id > :base AND random() < :share
+) AS u
+ON CONFLICT (user_id) DO NOTHING
+"""
+
+PAYMENTS = """
+INSERT INTO payments (user_id, created_at, status)
+SELECT
+    s.user_id,
+    now() - k * interval '30 days' - random() * interval '2 days',
+    'confirmed'
+FROM subscriptions s
+JOIN users u ON u.id = s.user_id
+CROSS JOIN LATERAL generate_series(1, floor(random() * 6)::int) AS k
+WHERE u.telegram_id > :base
+"""
+
+# Половине подписок в окне напоминания оно уже «отправлено»
+REMINDERS = """
+INSERT INTO reminder_log (subscription_id, next_payment_date, offset_days, sent_at)
+SELECT
+    s.id,
+    (s.next_payment AT TIME ZONE 'UTC')::date,
+    (s.next_payment AT TIME ZONE coalesce(u.timezone, :tz))::date
+        - (now() AT TIME ZONE coalesce(u.timezone, :tz))::date,
+    now() - random() * interval '20 hours'
+FROM subscriptions s
+JOIN users u ON u.id = s.user_id
+WHERE u.telegram_id > :base AND s.status = 'active'
+    AND s.next_payment >= date_trunc('day', now())
+    AND s.next_payment < date_trunc('day', now()) + interval '2 days'
+    AND random() < 0.5
+ON CONFLICT DO NOTHING
+"""
+
+REQUESTED_PAYMENTS = """
+INSERT INTO payments (user_id, created_at, status)
+SELECT s.user_id, now() - random() * interval '6 hours', 'requested'
+FROM subscriptions s
+JOIN users u ON u.id = s.user_id
+WHERE u.telegram_id > :base AND s.status = 'active' AND random() < 0.01
+"""
+
+
+async def generate(users: int, subscription_share: float = 0.85, seed: float = 0.42, reset: bool = False):
+    await migrate()
+    params = {
+        "base": BENCH_TELEGRAM_BASE,
+        "count": users,
+        "share": subscription_share,
+        "tz": DEFAULT_TIMEZONE,
+    }
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+        if reset:
+            for statement in RESET:
+                await conn.execute(text(statement), params)
+
+        for name, statement in [
+            ("users", USERS),
+            ("subscriptions", SUBSCRIPTIONS),
+            ("payments", PAYMENTS),
+            ("reminders", REMINDERS),
+            ("requested payments", REQUESTED_PAYMENTS),
+        ]:
+            started = time.perf_counter()
+            result = await conn.execute(text(statement), params)
+            print(f"  {name:<20} {result.rowcount:>9} rows  {time.perf_counter() - started:6.1f} s")
+
+        await conn.execute(text("ANALYZE users, subscriptions, payments, reminder_log"))
+
+
+async def main(args):
+    print(f"🧪 Генерация {args.users} пользователей")
+    await generate(args.users, args.share, args.seed, args.reset)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетические данные для бенчмарков")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--share", type=float, default=0.85, help="доля пользователей с подпиской")
+    parser.add_argument("--seed", type=float, default=0.42)
+    parser.add_argument("--reset", action="store_true", help="удалить прежние синтетические данные")
+    asyncio.run(main(parser.parse_args()))
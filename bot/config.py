@@ -19,6 +19,76 @@ DATABASE_URL = (
 
 DATABASE_URL_ASYNCPG = os.getenv("DATABASE_URL_ASYNCPG")
 
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Пул соединений SQLAlchemy и кэш prepared statements asyncpg
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # секунд ожидания соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # секунд жизни соединения
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# 0 отключает кэш — нужно за pgbouncer в режиме transaction
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+
+# Очередь отправки сообщений (лимиты Telegram Bot API)
+# Лимит общий для токена: при нескольких отправляющих процессах делите его между ними
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))  # сообщений в секунду на бота
+SEND_PER_CHAT_INTERVAL = float(os.getenv("SEND_PER_CHAT_INTERVAL", "1"))  # секунд между сообщениями в один чат
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "16"))
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "1000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Outbox уведомлений
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "30"))  # секунд, для повторов
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+# Аренда пачки на время отправки: после неё упавший диспетчер уступает пачку другому
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+# Чат не найден (chat not found): не пишем пользователю столько часов
+UNREACHABLE_RETRY_HOURS = float(os.getenv("UNREACHABLE_RETRY_HOURS", "24"))
+
+# Кэш пользователей с подпиской для /start, /status и «Оплачено»
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))  # секунд
+
+# Планировщик: leader — одна реплика по advisory lock,
+# partitioned — воркеры делят подписки по id % N, off — не запускать в боте
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "leader")
+# Выбор лидера планировщика: резервная реплика ждёт advisory lock и раз
+# в столько секунд прерывает ожидание, чтобы проверить своё соединение
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "5"))
+# Партиционированные воркеры: heartbeat и через сколько воркер считается мёртвым
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5"))
+WORKER_TTL = float(os.getenv("WORKER_TTL", "20"))
+
+# Окно доставки напоминаний по местному времени пользователя (часы, [START, END))
+# и часовой пояс для тех, кто свой не указал
+DELIVERY_WINDOW_START = int(os.getenv("DELIVERY_WINDOW_START", "10"))
+DELIVERY_WINDOW_END = int(os.getenv("DELIVERY_WINDOW_END", "20"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+
+# Эндпоинт /metrics для Prometheus; по умолчанию выключен (порт 0).
+# Порт у каждого процесса свой: воркерам на одном хосте — python -m bot.worker --metrics-port N
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Профилирование апдейтов и лог медленных SQL (переключается /profile on|off)
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Антифлуд: token bucket на (пользователь, обработчик)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))  # запросов в секунду
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "5"))  # запас на короткий всплеск
+THROTTLE_MAX_BUCKETS = int(os.getenv("THROTTLE_MAX_BUCKETS", "10000"))
+
 
 def is_admin(telegram_id: int) -> bool:
     return telegram_id == ADMIN_ID
\ No newline at end of file
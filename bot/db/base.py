@@ -5,7 +5,17 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import DeclarativeBase
 
-from bot.config import DATABASE_URL
+from bot.config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+)
+from bot.db.pool import InstrumentedPool, pool_stats
+from bot.db.profiling import install_query_hooks
 
 
 class Base(DeclarativeBase):
@@ -15,10 +25,27 @@ class Base(DeclarativeBase):
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        # кэш самого asyncpg и кэш адаптера SQLAlchemy поверх него
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
 )
+install_query_hooks(engine)
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
     expire_on_commit=False,
     class_=AsyncSession,
 )
+
+
+def db_pool_stats() -> dict:
+    """Состояние пула: занятые соединения, overflow и время ожидания"""
+    return pool_stats(engine.sync_engine.pool)
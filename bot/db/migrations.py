@@ -0,0 +1,209 @@
+"""
+Версионные миграции схемы.
+
+create_all создаёт только отсутствующие таблицы, поэтому индексы и новые
+колонки для уже развёрнутых баз добавляются здесь. Применённые версии
+хранятся в schema_migrations.
+
+Запуск вручную: python -m bot.db.migrations [--status]
+"""
+import asyncio
+import logging
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.config import DEFAULT_TIMEZONE
+from bot.db.base import engine, Base
+from bot.db import models  # noqa: F401 — регистрирует модели в Base.metadata
+
+# Произвольный ключ advisory lock, чтобы реплики не мигрировали одновременно
+MIGRATION_LOCK_KEY = 7_140_001
+
+# Местная дата момента, как local_date() в repository (строковый литерал SQL)
+_DEFAULT_TIMEZONE_SQL = DEFAULT_TIMEZONE.replace("'", "''")
+
+
+def _local_date(moment: str) -> str:
+    return f"(timezone(coalesce(users.timezone, '{_DEFAULT_TIMEZONE_SQL}'), {moment}))::date"
+
+
+# Строки журнала для текущей даты платежа и их число дней по местному календарю
+_CURRENT_PAYMENT = (
+    "subscriptions.id = reminder_log.subscription_id AND users.id = subscriptions.user_id"
+    " AND reminder_log.next_payment_date = (subscriptions.next_payment AT TIME ZONE 'UTC')::date"
+)
+_LOCAL_OFFSET = f"{_local_date('subscriptions.next_payment')} - {_local_date('reminder_log.sent_at')}"
+
+
+# (версия, описание, SQL-команды) — только добавлять в конец
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "indexes for hot query columns", [
+        # Планировщик: активные подписки по дате платежа
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_active_next_payment "
+        "ON subscriptions (next_payment) WHERE status = 'active'",
+        # user_paid: заявки пользователя за сегодня
+        "CREATE INDEX IF NOT EXISTS ix_payments_user_status_created "
+        "ON payments (user_id, status, created_at)",
+        # /payments и /users: последние записи
+        "CREATE INDEX IF NOT EXISTS ix_payments_created_at ON payments (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)",
+        # /find: поиск по подстроке username
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_users_username_trgm "
+        "ON users USING gin (username gin_trgm_ops)",
+        # Диспетчер outbox: готовые уведомления и просроченные аренды (status = 'sending')
+        "CREATE INDEX IF NOT EXISTS ix_notifications_ready "
+        "ON notifications (next_attempt_at) WHERE status IN ('pending', 'sending')",
+    ]),
+    (2, "keyset pagination indexes", [
+        # /users и /payments листаются по (created_at, id); старые индексы
+        # по одному created_at покрываются новыми
+        "CREATE INDEX IF NOT EXISTS ix_users_created_at_id ON users (created_at, id)",
+        "DROP INDEX IF EXISTS ix_users_created_at",
+        "CREATE INDEX IF NOT EXISTS ix_payments_created_at_id ON payments (created_at, id)",
+        "DROP INDEX IF EXISTS ix_payments_created_at",
+    ]),
+    (3, "reminder ledger replaces last_reminder_sent", [
+        # create_all уже создал таблицу; повторяем на случай запуска без него
+        "CREATE TABLE IF NOT EXISTS reminder_log ("
+        " subscription_id INTEGER NOT NULL REFERENCES subscriptions (id) ON DELETE CASCADE,"
+        " next_payment_date DATE NOT NULL,"
+        " offset_days INTEGER NOT NULL,"
+        " sent_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+        " PRIMARY KEY (subscription_id, next_payment_date, offset_days)"
+        ")",
+        # Напоминания, отправленные по старой схеме, не должны уйти повторно.
+        # На новой базе колонки уже нет — переносить нечего
+        "DO $$ BEGIN "
+        "IF EXISTS (SELECT 1 FROM information_schema.columns"
+        " WHERE table_name = 'subscriptions' AND column_name = 'last_reminder_sent') THEN "
+        "INSERT INTO reminder_log (subscription_id, next_payment_date, offset_days, sent_at) "
+        "SELECT id, (next_payment AT TIME ZONE 'UTC')::date,"
+        " (next_payment AT TIME ZONE 'UTC')::date - (last_reminder_sent AT TIME ZONE 'UTC')::date,"
+        " last_reminder_sent "
+        "FROM subscriptions "
+        "WHERE last_reminder_sent IS NOT NULL AND status = 'active' "
+        "ON CONFLICT DO NOTHING; "
+        "END IF; "
+        "END $$",
+        "ALTER TABLE subscriptions DROP COLUMN IF EXISTS last_reminder_sent",
+    ]),
+    (4, "one payment request per user per day", [
+        # Лишние заявки одного дня, накопившиеся до индекса, не дают его создать
+        "UPDATE payments SET status = 'duplicate' WHERE id IN ("
+        " SELECT id FROM ("
+        "  SELECT id, row_number() OVER ("
+        "   PARTITION BY user_id, (created_at AT TIME ZONE 'UTC')::date ORDER BY id"
+        "  ) AS n FROM payments WHERE status = 'requested'"
+        " ) AS ranked WHERE n > 1"
+        ")",
+        # user_paid: INSERT ... ON CONFLICT DO NOTHING вместо проверки SELECT'ом
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_payments_requested_per_day "
+        "ON payments (user_id, ((created_at AT TIME ZONE 'UTC')::date)) "
+        "WHERE status = 'requested'",
+    ]),
+    (5, "pending payment requests index", [
+        # /pending: старые заявки по id и их общее число — без обхода всех платежей
+        "CREATE INDEX IF NOT EXISTS ix_payments_requested "
+        "ON payments (id) WHERE status = 'requested'",
+    ]),
+    (6, "user delivery state", [
+        # Заблокировавшие бота и удалённые аккаунты не получают напоминаний
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_state VARCHAR(16) NOT NULL DEFAULT 'ok'",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_retry_at TIMESTAMPTZ",
+    ]),
+    (7, "user time zone", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS timezone VARCHAR(64)",
+        # claim_reminders считает дни до платежа по местному календарю, а журнал
+        # текущих платежей — в UTC (перенос из миграции 3). Пересчитываем ключ
+        # от времени отправки, иначе напоминание уйдёт повторно
+        "INSERT INTO reminder_log (subscription_id, next_payment_date, offset_days, sent_at) "
+        f"SELECT subscription_id, next_payment_date, {_LOCAL_OFFSET}, sent_at "
+        f"FROM reminder_log, subscriptions, users WHERE {_CURRENT_PAYMENT} "
+        f"AND offset_days <> {_LOCAL_OFFSET} "
+        "ON CONFLICT DO NOTHING",
+        f"DELETE FROM reminder_log USING subscriptions, users WHERE {_CURRENT_PAYMENT} "
+        f"AND offset_days <> {_LOCAL_OFFSET}",
+    ]),
+    (8, "time zones known to the server", [
+        # user_timezone() в SQL берёт пояс отсюда, а неизвестный заменяет
+        # DEFAULT_TIMEZONE; после обновления Postgres миграцию можно повторить
+        "CREATE TABLE IF NOT EXISTS time_zones (name VARCHAR(64) PRIMARY KEY)",
+        "INSERT INTO time_zones (name) SELECT name FROM pg_timezone_names ON CONFLICT DO NOTHING",
+    ]),
+]
+
+logger = logging.getLogger(__name__)
+
+# Исправления данных, о которых нужно знать при деплое; INSERT — только наполнение справочников
+DATA_STATEMENTS = ("UPDATE", "DELETE")
+
+
+async def _ensure_table(conn):
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " name VARCHAR(128) NOT NULL,"
+        " applied_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+
+
+async def run_migrations(db_engine: AsyncEngine = engine, create_tables: bool = False) -> list[int]:
+    """Применить недостающие миграции; возвращает список применённых версий"""
+    applied_now = []
+    async with db_engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        if create_tables:
+            await conn.run_sync(Base.metadata.create_all)
+        await _ensure_table(conn)
+        result = await conn.execute(text("SELECT version FROM schema_migrations"))
+        applied = set(result.scalars().all())
+
+        for version, name, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            for statement in statements:
+                result = await conn.execute(text(statement))
+                # Правка данных, а не схемы: сколько строк затронуто, должно быть видно при деплое
+                if statement.split(None, 1)[0].upper() in DATA_STATEMENTS and result.rowcount > 0:
+                    logger.warning(
+                        f"⚠️ Миграция {version}: изменено строк — {result.rowcount}: {statement[:60]}…"
+                    )
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
+            applied_now.append(version)
+            logger.info(f"🗂 Миграция {version} применена: {name}")
+
+    return applied_now
+
+
+async def migration_status(db_engine: AsyncEngine = engine) -> list[tuple[int, str, bool]]:
+    async with db_engine.begin() as conn:
+        await _ensure_table(conn)
+        result = await conn.execute(text("SELECT version FROM schema_migrations"))
+        applied = set(result.scalars().all())
+    return [(version, name, version in applied) for version, name, _ in MIGRATIONS]
+
+
+async def migrate():
+    """Создать отсутствующие таблицы и применить миграции"""
+    return await run_migrations(create_tables=True)
+
+
+async def _main(args: list[str]):
+    if "--status" in args:
+        for version, name, applied in await migration_status():
+            print(f"{'✅' if applied else '⏳'} {version:>4} {name}")
+    else:
+        applied = await migrate()
+        print(f"✅ Применено миграций: {len(applied)}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
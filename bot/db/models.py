@@ -1,12 +1,14 @@
 from sqlalchemy import (
     BigInteger,
+    Date,
     Integer,
     DateTime,
     ForeignKey,
     String,
+    Text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from typing import Optional
 
 from bot.db.base import Base
@@ -21,6 +23,14 @@ class User(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now()
     )
+    # Можно ли писать пользователю: ok / blocked / deactivated.
+    # delivery_retry_at — до какого момента не писать (чат не найден)
+    delivery_state: Mapped[str] = mapped_column(String(16), default="ok", server_default="ok")
+    delivery_retry_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Часовой пояс IANA (Europe/Moscow); NULL — DEFAULT_TIMEZONE
+    timezone: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     # Добавляем связь с подпиской
     subscription: Mapped[Optional["Subscription"]] = relationship(
@@ -46,10 +56,6 @@ class Subscription(Base):
     next_payment: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     status: Mapped[str] = mapped_column(String(32), default="active")
     period_days: Mapped[int] = mapped_column(Integer, default=30)
-    last_reminder_sent: Mapped[Optional[datetime]] = mapped_column(
-        DateTime(timezone=True), 
-        nullable=True
-    )
     
     # Обратная связь
     user: Mapped["User"] = relationship("User", back_populates="subscription")
@@ -67,4 +73,72 @@ class Payment(Base):
     status: Mapped[str] = mapped_column(String(32))
     
     # Обратная связь
-    user: Mapped["User"] = relationship("User", back_populates="payments")
\ No newline at end of file
+    user: Mapped["User"] = relationship("User", back_populates="payments")
+
+
+class Notification(Base):
+    """Исходящее сообщение в Telegram (outbox), пишется в одной транзакции с изменением"""
+    __tablename__ = "notifications"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text)
+    reply_markup: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON клавиатуры
+    status: Mapped[str] = mapped_column(String(32), default="pending")  # pending / sending / sent / failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(String(256), nullable=True)
+
+
+class SchedulerWorker(Base):
+    """Живой воркер планировщика; по списку живых делятся партиции подписок"""
+    __tablename__ = "scheduler_workers"
+
+    worker_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    # Раскладка эпохи epoch: партиция slot из workers; пишется сразу для всех
+    slot: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    workers: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    epoch: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    # Последняя эпоха, партицию которой воркер уже обрабатывает
+    acked_epoch: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+
+
+class ReminderLog(Base):
+    """
+    Отправленные напоминания: одно на (подписку, дату платежа, за сколько дней).
+
+    Напоминание сначала занимается вставкой сюда, и только потом ставится
+    в outbox, поэтому повторный тик, рестарт или вторая реплика его не продублируют.
+    """
+    __tablename__ = "reminder_log"
+
+    subscription_id: Mapped[int] = mapped_column(
+        ForeignKey("subscriptions.id", ondelete="CASCADE"), primary_key=True
+    )
+    next_payment_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    offset_days: Mapped[int] = mapped_column(Integer, primary_key=True)
+    sent_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class TimeZone(Base):
+    """
+    Часовые пояса, которые знает Postgres (копия pg_timezone_names).
+
+    Имена, допустимые для zoneinfo, не всегда годятся для timezone() в SQL,
+    а сам pg_timezone_names читает каталог поясов при каждом запросе.
+    """
+    __tablename__ = "time_zones"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
@@ -0,0 +1,132 @@
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+import asyncpg
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import DATABASE_URL_ASYNCPG
+from bot.db.models import Subscription
+
+# Канал, в который пишем об изменении next_payment/status подписки
+SUBSCRIPTION_CHANNEL = "subscription_changed"
+# Канал, будящий диспетчер outbox при появлении новых уведомлений
+NOTIFICATION_CHANNEL = "notifications"
+
+logger = logging.getLogger(__name__)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+def subscription_payload(
+    sub_id: int,
+    telegram_id: int,
+    status: str,
+    next_payment: Optional[datetime],
+) -> str:
+    return json.dumps({
+        "id": sub_id,
+        "telegram_id": telegram_id,
+        "status": status,
+        "next_payment": _iso(next_payment),
+    })
+
+
+def user_payload(telegram_id: int) -> str:
+    """Изменился сам пользователь (например, доставка), а не подписка: только для кэшей"""
+    return json.dumps({"telegram_id": telegram_id})
+
+
+# Массовое изменение подписок (импорт, пакетный сдвиг дат): слушатели
+# перечитывают состояние целиком вместо тысяч отдельных сообщений
+RELOAD_PAYLOAD = json.dumps({"reload": True})
+
+
+def is_reload(data: dict) -> bool:
+    return data.get("reload", False)
+
+
+async def notify_subscription_changed(session: AsyncSession, sub: Subscription, telegram_id: int):
+    """
+    Сообщить планировщику и кэшу пользователей об изменении подписки.
+
+    NOTIFY доставляется только после commit, поэтому вызывается
+    внутри той же транзакции, что и само изменение.
+    """
+    payload = subscription_payload(sub.id, telegram_id, sub.status, sub.next_payment)
+    await session.execute(select(func.pg_notify(SUBSCRIPTION_CHANNEL, payload)))
+
+
+async def notify_subscriptions_changed(session: AsyncSession, payloads: list[str]):
+    """То же для пачки подписок — одним запросом"""
+    if not payloads:
+        return
+    await session.execute(
+        text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+        {"channel": SUBSCRIPTION_CHANNEL, "payloads": payloads},
+    )
+
+
+async def notify_users_changed(session: AsyncSession, telegram_ids: Iterable[int]):
+    """Сбросить пользователей в кэшах всех реплик после commit"""
+    await notify_subscriptions_changed(session, [user_payload(telegram_id) for telegram_id in telegram_ids])
+
+
+async def notify_subscriptions_reload(session: AsyncSession):
+    """Попросить планировщики и кэши перечитать все подписки после commit"""
+    await session.execute(select(func.pg_notify(SUBSCRIPTION_CHANNEL, RELOAD_PAYLOAD)))
+
+
+async def notify_outbox(session: AsyncSession):
+    """Разбудить диспетчеры outbox после commit текущей транзакции"""
+    await session.execute(select(func.pg_notify(NOTIFICATION_CHANNEL, "")))
+
+
+async def connect() -> asyncpg.Connection:
+    """
+    Отдельное долгоживущее соединение для LISTEN и advisory lock.
+
+    Короткие TCP keepalive на стороне сервера: если процесс или хост
+    пропадёт, Postgres закроет сессию и освободит её блокировки. Молчащее
+    соединение обрывается через idle + interval × count = 8 секунд, а с
+    неподтверждёнными данными (например, NOTIFY) — через tcp_user_timeout.
+    """
+    return await asyncpg.connect(
+        DATABASE_URL_ASYNCPG,
+        server_settings={
+            "tcp_keepalives_idle": "5",
+            "tcp_keepalives_interval": "1",
+            "tcp_keepalives_count": "3",
+            "tcp_user_timeout": "8000",
+        },
+    )
+
+
+async def listen(
+    channel: str,
+    callback: Callable[[str], None],
+    on_close: Optional[Callable[[], None]] = None,
+    conn: Optional[asyncpg.Connection] = None,
+) -> asyncpg.Connection:
+    """Подписаться на LISTEN канала на отдельном (или переданном) соединении"""
+    if conn is None:
+        conn = await connect()
+
+    def _on_notify(connection, pid, channel, payload):
+        try:
+            callback(payload)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки NOTIFY {channel}: {e}")
+
+    await conn.add_listener(channel, _on_notify)
+    if on_close is not None:
+        conn.add_termination_listener(lambda connection: on_close())
+    return conn
@@ -0,0 +1,82 @@
+"""
+Профилирование запросов: счётчик SQL на апдейт и лог медленных запросов.
+
+Включается и выключается на лету (/profile on|off). Выключенные хуки
+сводятся к одной проверке флага.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.config import PROFILE_ENABLED, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateProfile:
+    """Что успел сделать с БД один апдейт"""
+    __slots__ = ("handler", "statements", "db_time")
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.statements = 0
+        self.db_time = 0.0
+
+
+class _Settings:
+    enabled = PROFILE_ENABLED
+    slow_query_ms = SLOW_QUERY_MS
+
+
+settings = _Settings()
+
+# Профиль текущего апдейта; SQLAlchemy переносит контекст в свой greenlet
+current_profile: ContextVar[Optional[UpdateProfile]] = ContextVar("current_profile", default=None)
+
+
+def set_profiling(enabled: bool):
+    settings.enabled = enabled
+    logger.info(f"⏱ Профилирование {'включено' if enabled else 'выключено'}")
+
+
+def set_handler(name: str):
+    """Записать в профиль имя обработчика, выбранного роутером"""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.handler = name
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время старта — на контексте выполнения самого запроса: он живёт ровно
+    # один запрос, и упавший запрос не оставляет ничего на соединении
+    if settings.enabled and context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        # Профилирование включили посреди запроса
+        return
+    elapsed = time.perf_counter() - start
+
+    profile = current_profile.get()
+    if profile is not None:
+        profile.statements += 1
+        profile.db_time += elapsed
+
+    if elapsed * 1000 >= settings.slow_query_ms:
+        handler = profile.handler if profile is not None else "фон"
+        logger.warning(
+            f"🐢 Медленный запрос {elapsed * 1000:.1f} мс [{handler}]: "
+            f"{' '.join(statement.split())} | параметры: {parameters!r:.500}"
+        )
+
+
+def install_query_hooks(db_engine: AsyncEngine):
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,620 @@
+"""
+Запросы к БД, которыми пользуются обработчики, планировщик и скрипты.
+
+Связь User ↔ Subscription один-к-одному, поэтому она грузится joinedload
+одним запросом, а не двумя, как при selectinload.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Sequence
+
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Row,
+    Select,
+    and_,
+    any_,
+    cast,
+    delete,
+    extract,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    text,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Result
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncResult
+from sqlalchemy.orm import joinedload
+
+from bot.config import DEFAULT_TIMEZONE, DELIVERY_WINDOW_END, DELIVERY_WINDOW_START
+from bot.db.models import Payment, ReminderLog, Subscription, TimeZone, User
+
+
+def id_in(column, ids: Sequence[int]):
+    """column = ANY(:ids) — один параметр-массив вместо IN со списком"""
+    return column == any_(literal(list(ids), ARRAY(column.type)))
+
+
+# Позиция в списке, упорядоченном по (created_at, id)
+Cursor = tuple[datetime, int]
+
+
+async def keyset_page(
+    session: AsyncSession,
+    stmt: Select,
+    created_at,
+    id_column,
+    limit: int,
+    cursor: Optional[Cursor] = None,
+    backward: bool = False,
+) -> tuple[list, bool]:
+    """
+    Страница по ключу (created_at, id) от новых к старым — без OFFSET,
+    поэтому любая страница стоит как первая.
+
+    Вперёд — строки старше cursor, назад — новее. Возвращает строки в порядке
+    от новых к старым и признак того, что в направлении запроса есть ещё.
+    """
+    key = tuple_(created_at, id_column)
+    if backward:
+        if cursor is not None:
+            stmt = stmt.where(key > tuple_(*cursor))
+        stmt = stmt.order_by(created_at.asc(), id_column.asc())
+    else:
+        if cursor is not None:
+            stmt = stmt.where(key < tuple_(*cursor))
+        stmt = stmt.order_by(created_at.desc(), id_column.desc())
+
+    result = await session.execute(stmt.limit(limit + 1))
+    rows = list(result.scalars().all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, has_more
+
+
+# --- Пользователи ---
+
+async def get_user_with_subscription(session: AsyncSession, telegram_id: int) -> Optional[User]:
+    result = await session.execute(
+        select(User)
+        .options(joinedload(User.subscription))
+        .where(User.telegram_id == telegram_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_user_with_subscription_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
+    result = await session.execute(
+        select(User)
+        .options(joinedload(User.subscription))
+        .where(User.id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def upsert_user(session: AsyncSession, telegram_id: int, username: Optional[str]) -> Row:
+    """
+    Зарегистрировать пользователя или обновить его username — одним запросом
+    вместе с чтением подписки. Одновременные /start не упираются в UNIQUE.
+
+    Возвращает (id, telegram_id, username, timezone, delivery_state,
+    delivery_retry_at, inserted, subscription_id, status, next_payment,
+    period_days); колонки подписки — NULL, если её нет.
+    """
+    stmt = insert(User).values(
+        telegram_id=telegram_id,
+        username=username,
+        created_at=datetime.now(timezone.utc),
+    )
+    # xmax = 0 у вставленной строки отличает её от обновлённой
+    upserted = (
+        stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            # /start от пользователя значит, что писать ему снова можно
+            set_={
+                "username": stmt.excluded.username,
+                "delivery_state": "ok",
+                "delivery_retry_at": None,
+            },
+        )
+        .returning(
+            User.id,
+            User.telegram_id,
+            User.username,
+            User.timezone,
+            User.delivery_state,
+            User.delivery_retry_at,
+            literal_column("xmax = 0").label("inserted"),
+        )
+        .cte("upserted")
+    )
+    result = await session.execute(
+        select(
+            upserted,
+            Subscription.id.label("subscription_id"),
+            Subscription.status,
+            Subscription.next_payment,
+            Subscription.period_days,
+        ).outerjoin(Subscription, Subscription.user_id == upserted.c.id)
+    )
+    return result.one()
+
+
+async def set_delivery_state(
+    session: AsyncSession,
+    telegram_ids: Sequence[int],
+    state: str,
+    retry_at: Optional[datetime] = None,
+):
+    """Отметить, можно ли писать пользователям (см. User.delivery_state)"""
+    await session.execute(
+        update(User)
+        .where(id_in(User.telegram_id, telegram_ids))
+        .values(delivery_state=state, delivery_retry_at=retry_at)
+    )
+
+
+async def set_user_timezone(session: AsyncSession, telegram_id: int, name: str) -> bool:
+    """Сменить пояс пользователя; False — такого пояса не знает Postgres"""
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id, select(TimeZone.name).where(TimeZone.name == name).exists())
+        .values(timezone=name)
+    )
+    return result.rowcount > 0
+
+
+async def find_user_by_username(session: AsyncSession, fragment: str) -> Optional[User]:
+    """Поиск по подстроке username (использует trigram-индекс)"""
+    result = await session.execute(
+        select(User)
+        .options(joinedload(User.subscription))
+        .where(User.username.ilike(f"%{fragment}%"))
+        .order_by(User.created_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_users_page(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[Cursor] = None,
+    backward: bool = False,
+) -> tuple[list[User], bool]:
+    """Страница пользователей, новые первыми (см. keyset_page)"""
+    stmt = select(User).options(
+        joinedload(User.subscription).load_only(Subscription.status, Subscription.next_payment)
+    )
+    return await keyset_page(session, stmt, User.created_at, User.id, limit, cursor, backward)
+
+
+# --- Платежи ---
+
+async def get_payments_page(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[Cursor] = None,
+    backward: bool = False,
+) -> tuple[list[Payment], bool]:
+    """Страница платежей, новые первыми (см. keyset_page)"""
+    stmt = select(Payment).options(joinedload(Payment.user).load_only(User.telegram_id))
+    return await keyset_page(session, stmt, Payment.created_at, Payment.id, limit, cursor, backward)
+
+
+async def get_payment_with_user(session: AsyncSession, payment_id: int) -> Optional[Payment]:
+    """Платёж вместе с пользователем и его подпиской — одним запросом"""
+    result = await session.execute(
+        select(Payment)
+        .options(joinedload(Payment.user).joinedload(User.subscription))
+        .where(Payment.id == payment_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def create_payment_request(session: AsyncSession, user_id: int, created_at: datetime) -> Optional[int]:
+    """
+    Заявка на оплату, не больше одной в сутки (UTC): дубль отсекает
+    уникальный частичный индекс ux_payments_requested_per_day, а не
+    предварительный SELECT. Возвращает id заявки или None, если она уже есть.
+    """
+    return await session.scalar(
+        insert(Payment)
+        .values(user_id=user_id, status="requested", created_at=created_at)
+        .on_conflict_do_nothing()
+        .returning(Payment.id)
+    )
+
+
+async def get_pending_payments(session: AsyncSession, limit: int) -> Sequence[Row]:
+    """
+    Самые старые заявки на оплату: (id, created_at, telegram_id, username,
+    total, max_id). total и max_id — по всем заявкам, а не только по limit.
+    """
+    result = await session.execute(
+        select(
+            Payment.id,
+            Payment.created_at,
+            User.telegram_id,
+            User.username,
+            func.count().over().label("total"),
+            func.max(Payment.id).over().label("max_id"),
+        )
+        .join(User, User.id == Payment.user_id)
+        .where(Payment.status == "requested")
+        .order_by(Payment.id)
+        .limit(limit)
+    )
+    return result.all()
+
+
+# Подтверждение пачки заявок одним запросом:
+# - заявки блокируются по порядку id (без взаимоблокировок между
+#   одновременными нажатиями); уже подтверждённые другой транзакцией
+#   перепроверяются после ожидания и выпадают
+# - подписка продлевается на столько месяцев, сколько заявок пользователя
+#   подтверждено, а у кого её нет — создаётся. Один INSERT ... ON CONFLICT:
+#   подписку, созданную параллельным подтверждением, он продлит, а не упадёт
+#   на уникальности subscriptions.user_id
+CONFIRM_PAYMENTS = """
+WITH locked AS (
+    SELECT id, user_id FROM payments
+    WHERE {selection} AND status = 'requested'
+    ORDER BY id
+    FOR UPDATE
+),
+confirmed AS (
+    UPDATE payments SET status = 'confirmed'
+    FROM locked
+    WHERE payments.id = locked.id
+    RETURNING payments.user_id
+),
+per_user AS (
+    SELECT user_id, count(*)::int AS months FROM confirmed GROUP BY user_id
+),
+upserted AS (
+    INSERT INTO subscriptions (user_id, next_payment, status, period_days)
+    SELECT user_id, now() + make_interval(months => months), 'active', 30
+    FROM per_user
+    ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET next_payment = subscriptions.next_payment + make_interval(
+            months => (SELECT months FROM per_user WHERE per_user.user_id = excluded.user_id)
+        ),
+        status = 'active'
+    RETURNING id, user_id, status, next_payment
+)
+SELECT s.id, users.telegram_id, s.status, s.next_payment, per_user.months
+FROM upserted AS s
+JOIN per_user USING (user_id)
+JOIN users ON users.id = s.user_id
+"""
+
+
+async def confirm_payments(
+    session: AsyncSession,
+    payment_ids: Optional[Sequence[int]] = None,
+    max_id: Optional[int] = None,
+) -> Sequence[Row]:
+    """
+    Подтвердить заявки payment_ids (или все с id <= max_id) и продлить
+    подписки — один запрос в транзакции вызывающего.
+    Возвращает (subscription_id, telegram_id, status, next_payment, months)
+    по каждой затронутой подписке; months — сколько заявок подтверждено.
+    """
+    if payment_ids is not None:
+        selection, params = "id = ANY(CAST(:ids AS integer[]))", {"ids": list(payment_ids)}
+    else:
+        selection, params = "id <= :max_id", {"max_id": max_id}
+    result = await session.execute(text(CONFIRM_PAYMENTS.format(selection=selection)), params)
+    return result.all()
+
+
+# --- Подписки для планировщика ---
+
+def in_partition(column, partitions: Optional[Sequence[tuple[int, int]]]):
+    """column % N = k для одной из партиций (k, N); без партиций — все строки"""
+    if partitions is None:
+        return true()
+    return or_(*(column % count == index for index, count in partitions))
+
+
+async def stream_active_subscriptions(
+    session: AsyncSession,
+    partitions: Optional[Sequence[tuple[int, int]]] = None,
+) -> AsyncResult:
+    """Активные подписки (id, next_payment, timezone) потоком"""
+    return await session.stream(
+        select(Subscription.id, Subscription.next_payment, User.timezone)
+        .join(User, User.id == Subscription.user_id)
+        .where(
+            Subscription.status == "active",
+            in_partition(Subscription.id, partitions),
+        )
+        .execution_options(yield_per=1000)
+    )
+
+
+def deliverable(users, now):
+    """
+    Пользователю можно писать: бот не заблокирован, аккаунт не удалён и
+    пауза после «chat not found» прошла. users — User или User.__table__.c
+    """
+    return and_(
+        users.delivery_state == "ok",
+        or_(users.delivery_retry_at.is_(None), users.delivery_retry_at <= now),
+    )
+
+
+def user_timezone(users):
+    """
+    Часовой пояс пользователя для SQL; NULL или пояс, которого Postgres
+    не знает, — DEFAULT_TIMEZONE: иначе timezone() уронит весь запрос
+    """
+    known = select(TimeZone.name).where(TimeZone.name == users.timezone).scalar_subquery()
+    return func.coalesce(known, DEFAULT_TIMEZONE)
+
+
+def local_date(users, moment):
+    """Дата момента по местному времени пользователя"""
+    return cast(func.timezone(user_timezone(users), moment), Date)
+
+
+def payment_date(column):
+    """Дата платежа в UTC — ключ напоминаний в reminder_log"""
+    return cast(func.timezone("UTC", column), Date)
+
+
+async def claim_reminders(
+    session: AsyncSession,
+    ids: Sequence[int],
+    offsets: Sequence[int],
+    sent_at: datetime,
+) -> Sequence[Row]:
+    """
+    Занять напоминания для активных подписок из ids, у которых до платежа
+    осталось ровно offsets дней по местному календарю пользователя и у
+    которого сейчас идёт окно доставки. Возвращает (id, next_payment,
+    telegram_id, offset_days, timezone) только для впервые занятых.
+
+    Один INSERT ... ON CONFLICT DO NOTHING RETURNING: уже отправленное
+    напоминание (в этом тике, до рестарта или другой репликой) просто
+    не вставится. Параллельная вставка того же ключа ждёт commit первой.
+    Недоступным пользователям напоминания не занимаются вовсе.
+    """
+    now = literal(sent_at, DateTime(timezone=True))
+    offset_days = local_date(User, Subscription.next_payment) - local_date(User, now)
+    local_hour = extract("hour", func.timezone(user_timezone(User), now))
+    claimed = (
+        insert(ReminderLog)
+        .from_select(
+            ["subscription_id", "next_payment_date", "offset_days", "sent_at"],
+            select(
+                Subscription.id,
+                payment_date(Subscription.next_payment),
+                offset_days,
+                now,
+            )
+            .join(User, User.id == Subscription.user_id)
+            .where(
+                id_in(Subscription.id, ids),
+                Subscription.status == "active",
+                offset_days.in_(list(offsets)),
+                local_hour >= DELIVERY_WINDOW_START,
+                local_hour < DELIVERY_WINDOW_END,
+                deliverable(User, now),
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(ReminderLog.subscription_id, ReminderLog.offset_days)
+        .cte("claimed")
+    )
+    result = await session.execute(
+        select(
+            Subscription.id,
+            Subscription.next_payment,
+            User.telegram_id,
+            claimed.c.offset_days,
+            User.timezone,
+        )
+        .join(claimed, claimed.c.subscription_id == Subscription.id)
+        .join(User, User.id == Subscription.user_id)
+    )
+    return result.all()
+
+
+async def clear_reminder_log(session: AsyncSession, sub_ids: Sequence[int]):
+    """Забыть отправленные напоминания подписок — они уйдут снова"""
+    await session.execute(delete(ReminderLog).where(id_in(ReminderLog.subscription_id, sub_ids)))
+
+
+async def purge_reminder_log(session: AsyncSession, before: date) -> int:
+    """Удалить записи о напоминаниях по платежам раньше before"""
+    result = await session.execute(
+        delete(ReminderLog).where(ReminderLog.next_payment_date < before)
+    )
+    return result.rowcount
+
+
+async def expire_subscriptions(
+    session: AsyncSession,
+    ids: Sequence[int],
+    now: datetime,
+) -> Sequence[Row]:
+    """
+    Одним UPDATE переводит в expired активные подписки из ids, у которых
+    день платежа по местному времени пользователя уже прошёл.
+    Возвращает (id, telegram_id, deliverable, timezone): статус меняется
+    у всех, а уведомление нужно только тем, кому можно писать.
+    """
+    # UPDATE ... FROM users на уровне таблиц: ORM-вариант теряет
+    # в RETURNING колонки второй таблицы
+    subs, users = Subscription.__table__, User.__table__
+    result: Result = await session.execute(
+        update(subs)
+        .where(
+            subs.c.user_id == users.c.id,
+            id_in(subs.c.id, ids),
+            subs.c.status == "active",
+            local_date(users.c, subs.c.next_payment) < local_date(users.c, literal(now, DateTime(timezone=True))),
+        )
+        .values(status="expired")
+        .returning(
+            subs.c.id,
+            users.c.telegram_id,
+            deliverable(users.c, func.now()).label("deliverable"),
+            users.c.timezone,
+        )
+    )
+    return result.all()
+
+
+async def get_subscription_states(session: AsyncSession, ids: Sequence[int]) -> Sequence[Row]:
+    """
+    (id, status, next_payment, timezone, delivery_state, delivery_retry_at,
+    reminded) для пересчёта дедлайнов; reminded — offset_days напоминаний
+    по текущей дате платежа из reminder_log (NULL, если их нет)
+    """
+    reminded = (
+        select(func.array_agg(ReminderLog.offset_days))
+        .where(
+            ReminderLog.subscription_id == Subscription.id,
+            ReminderLog.next_payment_date == payment_date(Subscription.next_payment),
+        )
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        select(
+            Subscription.id,
+            Subscription.status,
+            Subscription.next_payment,
+            User.timezone,
+            User.delivery_state,
+            User.delivery_retry_at,
+            reminded.label("reminded"),
+        )
+        .join(User, User.id == Subscription.user_id)
+        .where(id_in(Subscription.id, ids))
+    )
+    return result.all()
+
+
+# --- Выгрузки ---
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_query(kind: str) -> Select:
+    """Плоские колонки для выгрузки: без ORM-объектов и identity map"""
+    if kind == "users":
+        return (
+            select(
+                User.id,
+                User.telegram_id,
+                User.username,
+                User.created_at,
+                Subscription.status.label("subscription_status"),
+                Subscription.next_payment,
+            )
+            .outerjoin(Subscription, Subscription.user_id == User.id)
+            .order_by(User.id)
+        )
+    if kind == "subscriptions":
+        return (
+            select(
+                Subscription.id,
+                Subscription.user_id,
+                User.telegram_id,
+                Subscription.status,
+                Subscription.period_days,
+                Subscription.next_payment,
+            )
+            .join(User, User.id == Subscription.user_id)
+            .order_by(Subscription.id)
+        )
+    if kind == "payments":
+        return (
+            select(
+                Payment.id,
+                Payment.user_id,
+                User.telegram_id,
+                Payment.status,
+                Payment.created_at,
+            )
+            .join(User, User.id == Payment.user_id)
+            .order_by(Payment.id)
+        )
+    raise ValueError(f"Неизвестная выгрузка: {kind}")
+
+
+async def stream_export(session: AsyncSession, kind: str) -> AsyncResult:
+    """Строки выгрузки серверным курсором, пачками по EXPORT_BATCH_SIZE"""
+    return await session.stream(
+        export_query(kind).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+async def stream_users_with_subscription(session: AsyncSession) -> AsyncResult:
+    """Все пользователи (telegram_id, username, next_payment) потоком, новые первыми"""
+    return await session.stream(
+        select(User.telegram_id, User.username, Subscription.next_payment)
+        .outerjoin(Subscription, Subscription.user_id == User.id)
+        .order_by(User.created_at.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+async def shift_payment_dates(
+    session: AsyncSession,
+    telegram_ids: Optional[Sequence[int]] = None,
+    due_before: Optional[datetime] = None,
+    set_to: Optional[datetime] = None,
+    shift: Optional[timedelta] = None,
+    dry_run: bool = False,
+) -> Sequence[Row]:
+    """
+    Одним UPDATE сдвинуть next_payment подписок.
+
+    Подписки выбираются по telegram_ids и/или активные с next_payment раньше
+    due_before; без фильтра — ValueError, чтобы случайно не сдвинуть все.
+    Дата либо ставится в set_to, либо сдвигается на shift.
+    Возвращает (id, telegram_id, status, next_payment).
+
+    dry_run — тот же выбор SELECT'ом без блокировок: что изменилось бы.
+    Отправленные напоминания вызывающий сбрасывает сам (clear_reminder_log).
+    """
+    if telegram_ids is None and due_before is None:
+        raise ValueError("Нужен telegram_ids или due_before")
+
+    subs, users = Subscription.__table__, User.__table__
+    conditions = [subs.c.user_id == users.c.id]
+    if telegram_ids is not None:
+        conditions.append(id_in(users.c.telegram_id, telegram_ids))
+    if due_before is not None:
+        conditions += [subs.c.status == "active", subs.c.next_payment < due_before]
+    next_payment = set_to if set_to is not None else subs.c.next_payment + shift
+
+    if dry_run:
+        if set_to is not None:
+            next_payment = literal(set_to, DateTime(timezone=True))
+        result: Result = await session.execute(
+            select(subs.c.id, users.c.telegram_id, subs.c.status, next_payment.label("next_payment"))
+            .where(*conditions)
+        )
+        return result.all()
+
+    result = await session.execute(
+        update(subs)
+        .where(*conditions)
+        .values(next_payment=next_payment)
+        .returning(subs.c.id, users.c.telegram_id, subs.c.status, subs.c.next_payment)
+    )
+    return result.all()
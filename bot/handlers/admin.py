@@ -1,13 +1,28 @@
-from aiogram import Router
-from aiogram.types import Message
+from aiogram import Router, F
+from aiogram.types import CallbackQuery, FSInputFile, Message
 from aiogram.filters import Command, CommandObject
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta, timezone
+from typing import Optional
+import os
+import tempfile
 
 from bot.config import ADMIN_ID
-from bot.db.base import AsyncSessionLocal
-from bot.db.models import User, Subscription, Payment
+from bot.db.base import AsyncSessionLocal, db_pool_stats
+from bot.db.models import Payment, User, Subscription
+from bot.db.repository import (
+    Cursor,
+    find_user_by_username,
+    get_payments_page,
+    get_users_page,
+    get_user_with_subscription,
+)
+from bot.db.notify import notify_subscription_changed
+from bot.db.profiling import set_profiling, settings as profiling
+from bot.keyboards.admin import page_keyboard
+from bot.services.export import EXPORT_FORMATS, EXPORT_KINDS, export_filename, export_to_file
+from bot.services.outbox import enqueue_notification
+from bot.services.paging import decode_cursor, encode_cursor, fit_page
+from bot.services.user_cache import user_cache
 
 admin_router = Router()
 
@@ -32,12 +47,7 @@ async def activate_handler(message: Message, command: CommandObject):
     async with AsyncSessionLocal() as session:
         try:
             # Ищем пользователя
-            result = await session.execute(
-                select(User)
-                .options(selectinload(User.subscription))
-                .where(User.telegram_id == target_id)
-            )
-            user = result.scalar_one_or_none()
+            user = await get_user_with_subscription(session, target_id)
 
             # Если нет — создаём
             if not user:
@@ -53,15 +63,14 @@ async def activate_handler(message: Message, command: CommandObject):
 
             # Если нет подписки — создаём
             if not user.subscription:
-                subscription = Subscription(
+                sub = Subscription(
                     user_id=user.id,
                     status="active",
                     period_days=30,
                     next_payment=now + timedelta(days=30),
                 )
-                session.add(subscription)
-                await session.commit()
-                await session.refresh(subscription)
+                session.add(sub)
+                await session.flush()
 
             else:
                 sub = user.subscription
@@ -77,9 +86,19 @@ async def activate_handler(message: Message, command: CommandObject):
                     sub.next_payment += timedelta(days=30)
 
                 sub.status = "active"
-                await session.commit()
 
-            sub = user.subscription
+            await notify_subscription_changed(session, sub, user.telegram_id)
+
+            # Уведомляем пользователя через outbox, в той же транзакции
+            if target_id != message.from_user.id:
+                await enqueue_notification(
+                    session,
+                    target_id,
+                    "✅ Ваша VPN подписка активирована!\n\n"
+                    f"Следующий платёж: {sub.next_payment:%d.%m.%Y}"
+                )
+            await session.commit()
+            user_cache.invalidate(user.telegram_id)
 
             await message.answer(
                 f"✅ Подписка {target_user_text} активирована\n\n"
@@ -88,80 +107,119 @@ async def activate_handler(message: Message, command: CommandObject):
                 f"Статус: {sub.status}"
             )
 
-            # Уведомляем пользователя
-            if target_id != message.from_user.id:
-                try:
-                    await message.bot.send_message(
-                        chat_id=target_id,
-                        text=(
-                            "✅ Ваша VPN подписка активирована!\n\n"
-                            f"Следующий платёж: {sub.next_payment:%d.%m.%Y}"
-                        )
-                    )
-                except Exception:
-                    pass
-
         except Exception as e:
             await message.answer(f"❌ Ошибка: {str(e)[:200]}")
             
+USERS_PAGE_SIZE = 20
+PAYMENTS_PAGE_SIZE = 10
+
+
+def _payment_entry(p: Payment) -> str:
+    return (
+        f"💰 ID: {p.id}\n"
+        f"   Пользователь: {p.user.telegram_id}\n"
+        f"   Статус: {p.status}\n"
+        f"   Дата: {p.created_at:%d.%m.%Y %H:%M}\n"
+        + "─" * 20 + "\n"
+    )
+
+
+def _user_entry(user: User) -> str:
+    status = user.subscription.status if user.subscription else "нет подписки"
+    lines = [
+        f"👤 ID: {user.telegram_id}\n",
+        f"   Username: @{user.username or 'нет'}\n",
+        f"   Статус: {status}\n",
+        f"   Создан: {user.created_at:%d.%m.%Y}\n",
+    ]
+    if user.subscription:
+        lines.append(f"   Платёж: {user.subscription.next_payment:%d.%m.%Y}\n")
+    lines.append("─" * 20 + "\n")
+    return "".join(lines)
+
+
+# Вид списка -> (загрузка страницы, размер, заголовок, запись)
+PAGES = {
+    "users": (get_users_page, USERS_PAGE_SIZE, "📋 Пользователи:\n\n", _user_entry),
+    "payments": (get_payments_page, PAYMENTS_PAGE_SIZE, "📋 Платежи:\n\n", _payment_entry),
+}
+
+
+async def _build_page(kind: str, cursor: Optional[Cursor] = None, backward: bool = False):
+    """Текст и клавиатура страницы списка; None, если записей нет"""
+    load, size, header, entry = PAGES[kind]
+
+    async with AsyncSessionLocal() as session:
+        rows, has_more = await load(session, size, cursor, backward)
+        if not rows:
+            return None
+        # Что не влезло в сообщение, уйдёт на следующую страницу
+        text, count = fit_page(header, (entry(row) for row in rows))
+
+    shown = rows[:count]
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more or count < len(rows)
+
+    keyboard = page_keyboard(
+        kind,
+        encode_cursor((shown[0].created_at, shown[0].id)),
+        encode_cursor((shown[-1].created_at, shown[-1].id)),
+        has_prev,
+        has_next,
+    )
+    return text, keyboard
+
+
 @admin_router.message(Command("payments"))
 async def list_payments(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
-    
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Payment)
-            .join(User)
-            .order_by(Payment.created_at.desc())
-            .limit(10)
-        )
-        payments = result.scalars().all()
-        
-        if not payments:
-            await message.answer("📭 Платежей нет")
-            return
-            
-        text = "📋 Последние платежи:\n\n"
-        for p in payments:
-            text += f"💰 ID: {p.id}\n"
-            text += f"   Пользователь: {p.user.telegram_id}\n"
-            text += f"   Статус: {p.status}\n"
-            text += f"   Дата: {p.created_at:%d.%m.%Y %H:%M}\n"
-            text += "─" * 20 + "\n"
-        
-        await message.answer(text)
+
+    page = await _build_page("payments")
+    if page is None:
+        await message.answer("📭 Платежей нет")
+        return
+
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard)
 
 @admin_router.message(Command("users"))
 async def list_users(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .order_by(User.created_at.desc())
-            .limit(20)
-        )
-        users = result.scalars().all()
+    page = await _build_page("users")
+    if page is None:
+        await message.answer("📭 Пользователей нет")
+        return
 
-        if not users:
-            await message.answer("📭 Пользователей нет")
-            return
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard)
 
-        text = "📋 Последние пользователи:\n\n"
-        for user in users:
-            status = user.subscription.status if user.subscription else "нет подписки"
-            text += f"👤 ID: {user.telegram_id}\n"
-            text += f"   Username: @{user.username or 'нет'}\n"
-            text += f"   Статус: {status}\n"
-            text += f"   Создан: {user.created_at:%d.%m.%Y}\n"
-            if user.subscription:
-                text += f"   Платёж: {user.subscription.next_payment:%d.%m.%Y}\n"
-            text += "─" * 20 + "\n"
+@admin_router.callback_query(F.data.startswith(("users_page:", "payments_page:")))
+async def turn_page(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("Нет прав")
+        return
 
-        await message.answer(text)
+    # <вид>_page:<prev|next>:<курсор>
+    try:
+        prefix, direction, cursor = callback.data.split(":", 2)
+        kind = prefix.removesuffix("_page")
+        page = await _build_page(kind, decode_cursor(cursor), backward=direction == "prev")
+    except ValueError:
+        await callback.answer("Неверный формат данных")
+        return
+
+    if page is None:
+        await callback.answer("Записей больше нет")
+        return
+
+    text, keyboard = page
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
 
 @admin_router.message(Command("find"))
 async def find_user(message: Message, command: CommandObject):
@@ -176,19 +234,9 @@ async def find_user(message: Message, command: CommandObject):
 
     async with AsyncSessionLocal() as session:
         if search.isdigit():
-            result = await session.execute(
-                select(User)
-                .options(selectinload(User.subscription))
-                .where(User.telegram_id == int(search))
-            )
+            user = await get_user_with_subscription(session, int(search))
         else:
-            result = await session.execute(
-                select(User)
-                .options(selectinload(User.subscription))
-                .where(User.username.ilike(f"%{search}%"))
-            )
-
-        user = result.scalar_one_or_none()
+            user = await find_user_by_username(session, search)
 
         if not user:
             await message.answer("👤 Пользователь не найден")
@@ -206,4 +254,69 @@ async def find_user(message: Message, command: CommandObject):
             text += f"Период: {user.subscription.period_days} дней\n"
             text += f"Статус: {user.subscription.status}"
 
-        await message.answer(text)
\ No newline at end of file
+        await message.answer(text)
+
+@admin_router.message(Command("pool"))
+async def pool_status(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    stats = db_pool_stats()
+    cache = user_cache.stats()
+    await message.answer(
+        f"🗄 Пул соединений БД:\n\n"
+        f"Размер: {stats['size']}\n"
+        f"Занято: {stats['checked_out']}\n"
+        f"Свободно: {stats['checked_in']}\n"
+        f"Overflow: {stats['overflow']}\n"
+        f"Выдач: {stats['checkouts']}, таймаутов: {stats['timeouts']}\n"
+        f"Ожидание: сред. {stats['wait_avg_ms']:.1f} мс, макс. {stats['wait_max_ms']:.1f} мс\n\n"
+        f"👥 Кэш пользователей: {cache['size']} записей, "
+        f"попаданий {cache['hits']}, промахов {cache['misses']} ({cache['hit_rate']:.0%})"
+    )
+
+@admin_router.message(Command("export"))
+async def export_data(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = (command.args or "").split()
+    kind = args[0] if args else None
+    fmt = next((a for a in args[1:] if a in EXPORT_FORMATS), "csv")
+    compress = "gz" in args[1:]
+    if kind not in EXPORT_KINDS:
+        await message.answer(
+            "Используйте: /export <users|subscriptions|payments> [csv|jsonl] [gz]"
+        )
+        return
+
+    filename = export_filename(kind, fmt, compress)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        try:
+            count = await export_to_file(kind, fmt, path, compress)
+        except Exception as e:
+            await message.answer(f"❌ Ошибка выгрузки: {str(e)[:200]}")
+            return
+
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📦 {kind}: {count} строк",
+        )
+
+@admin_router.message(Command("profile"))
+async def profile_toggle(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    arg = (command.args or "").strip().lower()
+    if arg in ("on", "off"):
+        set_profiling(arg == "on")
+    elif arg:
+        await message.answer("Используйте: /profile [on|off]")
+        return
+
+    await message.answer(
+        f"⏱ Профилирование: {'включено' if profiling.enabled else 'выключено'}\n"
+        f"Порог медленного запроса: {profiling.slow_query_ms:.0f} мс"
+    )
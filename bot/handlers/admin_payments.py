@@ -1,14 +1,17 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta 
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message
+from typing import Optional
 import logging
 
 from bot.db.base import AsyncSessionLocal
-from bot.db.models import Payment, Subscription, User
+from bot.db.repository import confirm_payments, get_payment_with_user, get_pending_payments
+from bot.db.notify import notify_subscriptions_changed, subscription_payload
 from bot.config import ADMIN_ID
+from bot.keyboards.admin import parse_pending_keyboard, pending_keyboard
+from bot.services.outbox import enqueue_notification, enqueue_notifications
+from bot.services.user_cache import user_cache
 
 admin_payments_router = Router()
 logger = logging.getLogger(__name__)
@@ -16,6 +19,43 @@ logger = logging.getLogger(__name__)
 def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_ID
 
+def _confirmed_text(next_payment, months: int) -> str:
+    period = "на месяц" if months == 1 else f"на {months} мес."
+    return (
+        "✅ Ваш платеж подтвержден!\n\n"
+        f"Подписка продлена {period}. Следующий платеж: {next_payment:%d.%m.%Y}\n"
+        "Спасибо!"
+    )
+
+
+async def _confirm(payment_ids: Optional[list[int]] = None, max_id: Optional[int] = None):
+    """
+    Подтвердить заявки и продлить подписки одной транзакцией.
+
+    Уведомления пользователям пишутся в outbox одной пачкой, и диспетчер
+    рассылает их параллельно уже после commit. Возвращает строки confirm_payments.
+    """
+    async with AsyncSessionLocal() as session:
+        rows = await confirm_payments(session, payment_ids, max_id)
+        if not rows:
+            return rows
+        await notify_subscriptions_changed(
+            session,
+            [subscription_payload(sub_id, telegram_id, status, next_payment)
+             for sub_id, telegram_id, status, next_payment, _ in rows],
+        )
+        await enqueue_notifications(
+            session,
+            [(telegram_id, _confirmed_text(next_payment, months), None)
+             for _, telegram_id, _, next_payment, months in rows],
+        )
+        await session.commit()
+
+    for row in rows:
+        user_cache.invalidate(row.telegram_id)
+    return rows
+
+
 @admin_payments_router.callback_query(F.data.startswith("pay_confirm:"))
 async def confirm_payment(callback: CallbackQuery):
     # Проверка прав админа
@@ -29,67 +69,127 @@ async def confirm_payment(callback: CallbackQuery):
     except (ValueError, IndexError):
         await callback.answer("Неверный формат данных")
         return
-    
+
+    # Повторное нажатие не продлит подписку второй раз: заявка уже не requested
+    rows = await _confirm([payment_id])
+    if not rows:
+        await callback.answer("Платеж не найден или уже обработан")
+        return
+
+    logger.info(f"✅ Платеж {payment_id} подтвержден для пользователя {rows[0].telegram_id}")
+    await callback.message.edit_text("✅ Оплата подтверждена, подписка продлена")
+
+
+PENDING_LIMIT = 30  # Кнопок в клавиатуре Telegram не больше 100
+
+
+def _pending_label(row) -> str:
+    who = f"@{row.username}" if row.username else str(row.telegram_id)
+    return f"#{row.id} {who} · {row.created_at:%d.%m %H:%M}"
+
+
+async def _build_pending(selected: frozenset[int] = frozenset()):
+    """Текст и клавиатура /pending; None, если заявок нет"""
     async with AsyncSessionLocal() as session:
-        payment = await session.get(Payment, payment_id)
-        if not payment:
-            await callback.answer("Платеж не найден")
-            return
-        
-        # Загружаем пользователя с подпиской
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .where(User.id == payment.user_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("Пользователь не найден")
-            return
-        
-        # Обновляем подписку
-        now = datetime.now()
-        if not user.subscription:
-            # Создаем новую подписку
-            next_month = now + relativedelta(months=1)
-            sub = Subscription(
-                user_id=user.id,
-                next_payment=next_month,
-                status="active",
-                period_days=30,
-                last_reminder_sent=None
-            )
-            session.add(sub)
+        rows = await get_pending_payments(session, PENDING_LIMIT)
+    if not rows:
+        return None
+
+    total, max_id = rows[0].total, rows[0].max_id
+    text = f"💸 Заявки на оплату: {total}\n"
+    if total > len(rows):
+        text += f"Показаны первые {len(rows)}, «Подтвердить все» подтвердит все {total}.\n"
+    text += "\nОтметьте заявки и нажмите «Подтвердить выбранные»."
+
+    entries = [(row.id, _pending_label(row)) for row in rows]
+    # Отметки остаются только у заявок, которые всё ещё ждут подтверждения
+    keep = selected & {payment_id for payment_id, _ in entries}
+    return text, pending_keyboard(entries, keep, total, max_id)
+
+
+async def _show_pending(callback: CallbackQuery, prefix: str = "", selected: frozenset[int] = frozenset()):
+    page = await _build_pending(selected)
+    if page is None:
+        await callback.message.edit_text(prefix + "📭 Заявок на оплату нет")
+        return
+    text, keyboard = page
+    await callback.message.edit_text(prefix + text, reply_markup=keyboard)
+
+
+@admin_payments_router.message(Command("pending"))
+async def list_pending(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+
+    page = await _build_pending()
+    if page is None:
+        await message.answer("📭 Заявок на оплату нет")
+        return
+
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard)
+
+
+@admin_payments_router.callback_query(F.data.startswith("pend_toggle:"))
+async def toggle_pending(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав")
+        return
+
+    try:
+        payment_id = int(callback.data.split(":")[1])
+        entries, selected, total, max_id = parse_pending_keyboard(callback.message.reply_markup)
+    except (ValueError, IndexError, AttributeError):
+        await callback.answer("Неверный формат данных")
+        return
+
+    selected ^= {payment_id}
+    await callback.message.edit_reply_markup(
+        reply_markup=pending_keyboard(entries, selected, total, max_id)
+    )
+    await callback.answer()
+
+
+@admin_payments_router.callback_query(F.data == "pend_refresh")
+async def refresh_pending(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав")
+        return
+
+    _, selected, _, _ = parse_pending_keyboard(callback.message.reply_markup)
+    try:
+        await _show_pending(callback, selected=frozenset(selected))
+    except TelegramBadRequest:
+        pass  # Ничего не изменилось — Telegram не даёт отредактировать в то же самое
+    await callback.answer()
+
+
+@admin_payments_router.callback_query(F.data.startswith(("pend_confirm", "pend_all:")))
+async def confirm_pending(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав")
+        return
+
+    try:
+        if callback.data == "pend_confirm":
+            _, selected, _, _ = parse_pending_keyboard(callback.message.reply_markup)
+            if not selected:
+                await callback.answer("Ничего не выбрано")
+                return
+            rows = await _confirm(payment_ids=sorted(selected))
         else:
-            # Продлеваем существующую подписку
-            user.subscription.next_payment = user.subscription.next_payment + relativedelta(months=1)
-            user.subscription.status = "active"
-            user.subscription.last_reminder_sent = None
-        
-        payment.status = "confirmed"
-        await session.commit()
-        
-        # Обновляем сообщение админу
-        await callback.message.edit_text("✅ Оплата подтверждена, подписка продлена")
-        
-        # Уведомляем пользователя
-        try:
-            # Нужно получить обновленную подписку для показа даты
-            await session.refresh(user.subscription)
-            
-            await callback.bot.send_message(
-                chat_id=user.telegram_id,
-                text=(
-                    "✅ Ваш платеж подтвержден!\n\n"
-                    f"Подписка продлена на месяц. Следующий платеж: {user.subscription.next_payment:%d.%m.%Y}\n"
-                    "Спасибо!"
-                )
-            )
-            logger.info(f"✅ Платеж {payment_id} подтвержден для пользователя {user.telegram_id}")
-            
-        except Exception as e:
-            logger.error(f"Не удалось уведомить пользователя {user.telegram_id}: {e}")
+            rows = await _confirm(max_id=int(callback.data.split(":")[1]))
+    except (ValueError, IndexError, AttributeError):
+        await callback.answer("Неверный формат данных")
+        return
+
+    confirmed = sum(row.months for row in rows)
+    logger.info(f"✅ Подтверждено заявок: {confirmed}, продлено подписок: {len(rows)}")
+    await _show_pending(
+        callback,
+        prefix=f"✅ Подтверждено заявок: {confirmed}, продлено подписок: {len(rows)}\n\n",
+    )
+    await callback.answer(f"Подтверждено: {confirmed}")
 
 @admin_payments_router.callback_query(F.data.startswith("pay_reject:"))
 async def reject_payment(callback: CallbackQuery):
@@ -105,30 +205,25 @@ async def reject_payment(callback: CallbackQuery):
         return
 
     async with AsyncSessionLocal() as session:
-        payment = await session.get(Payment, payment_id)
+        # Платеж вместе с user, чтобы получить telegram_id
+        payment = await get_payment_with_user(session, payment_id)
         if not payment:
             await callback.answer("Платеж не найден")
             return
             
-        # Загружаем user чтобы получить telegram_id
-        result = await session.execute(
-            select(User).where(User.id == payment.user_id)
-        )
-        user = result.scalar_one_or_none()
+        user = payment.user
         
         payment.status = "rejected"
+
+        # Отправляем сообщение пользователю через outbox
+        if user:
+            await enqueue_notification(
+                session,
+                user.telegram_id,
+                "❌ Оплата не подтверждена.\n"
+                "Если это ошибка — напиши администратору."
+            )
+            logger.info(f"❌ Платеж {payment_id} отклонен для пользователя {user.telegram_id}")
         await session.commit()
 
         await callback.message.edit_text("❌ Оплата отклонена")
-
-        # Отправляем сообщение пользователю
-        if user:
-            try:
-                await callback.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text="❌ Оплата не подтверждена.\n"
-                         "Если это ошибка — напиши администратору."
-                )
-                logger.info(f"❌ Платеж {payment_id} отклонен для пользователя {user.telegram_id}")
-            except Exception as e:
-                logger.error(f"Не удалось отправить сообщение пользователю {user.telegram_id}: {e}")
\ No newline at end of file
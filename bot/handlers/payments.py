@@ -1,31 +1,27 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from sqlalchemy import select, and_
-from sqlalchemy.orm import selectinload
 from datetime import datetime, timezone
 import logging
 
 from bot.db.base import AsyncSessionLocal
-from bot.db.models import Payment, User
+from bot.db.repository import create_payment_request
 from bot.config import ADMIN_ID
 from bot.keyboards.admin import payment_admin_keyboard
+from bot.services.outbox import enqueue_notification
+from bot.services.user_cache import get_user_snapshot
 
 payments_router = Router()
 logger = logging.getLogger(__name__)
 
-@payments_router.callback_query(F.data == "pay_done")
+# Заявка нужна раз в день: частые нажатия отсекаются антифлудом без запросов к БД
+@payments_router.callback_query(F.data == "pay_done", flags={"throttle": (0.2, 2)})
 async def user_paid(callback: CallbackQuery):
     """Пользователь нажал 'Я оплатил'"""
     
     async with AsyncSessionLocal() as session:
         try:
             # Находим пользователя с подпиской
-            result = await session.execute(
-                select(User)
-                .options(selectinload(User.subscription))
-                .where(User.telegram_id == callback.from_user.id)
-            )
-            user = result.scalar_one_or_none()
+            user = await get_user_snapshot(callback.from_user.id)
             
             if not user:
                 await callback.answer("Сначала напишите /start")
@@ -36,32 +32,29 @@ async def user_paid(callback: CallbackQuery):
                 await callback.answer("У вас нет активной подписки")
                 return
             
-            # Проверяем, не отправил ли уже заявку сегодня
-            today = datetime.now(timezone.utc).date()
-            existing_payment = await session.scalar(
-                select(Payment)
-                .where(
-                    and_(
-                        Payment.user_id == user.id,
-                        Payment.status == "requested",
-                        Payment.created_at >= datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-                    )
-                )
-            )
-            
-            if existing_payment:
+            # Заявка раз в сутки: дубль отсекает уникальный индекс, а не SELECT,
+            # поэтому одновременные нажатия не создадут вторую
+            created_at = datetime.now(timezone.utc)
+            payment_id = await create_payment_request(session, user.id, created_at)
+
+            if payment_id is None:
                 await callback.answer("Вы уже отправили заявку сегодня")
                 return
-            
-            # Создаем новую заявку
-            payment = Payment(
-                user_id=user.id,
-                status="requested",
-                created_at=datetime.now(timezone.utc)
-            )
-            session.add(payment)
+
+            # Уведомляем админа через outbox, в той же транзакции
+            if ADMIN_ID:
+                await enqueue_notification(
+                    session,
+                    ADMIN_ID,
+                    (
+                        f"💸 Новый платеж!\n"
+                        f"Пользователь: @{callback.from_user.username or 'без username'}\n"
+                        f"ID: {callback.from_user.id}\n"
+                        f"Дата: {created_at:%d.%m.%Y %H:%M}"
+                    ),
+                    payment_admin_keyboard(payment_id),
+                )
             await session.commit()
-            payment_id = payment.id
 
             try:
                 await callback.message.edit_reply_markup(reply_markup=None)
@@ -69,22 +62,6 @@ async def user_paid(callback: CallbackQuery):
                 pass
             
             await callback.answer("✅ Заявка отправлена! Админ проверит оплату.")
-            
-            # Уведомляем админа
-            if ADMIN_ID:
-                try:
-                    await callback.bot.send_message(
-                        chat_id=ADMIN_ID,
-                        text=(
-                            f"💸 Новый платеж!\n"
-                            f"Пользователь: @{callback.from_user.username or 'без username'}\n"
-                            f"ID: {callback.from_user.id}\n"
-                            f"Дата: {payment.created_at:%d.%m.%Y %H:%M}"
-                        ),
-                        reply_markup=payment_admin_keyboard(payment_id)
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка уведомления админа: {e}")
                     
         except Exception as e:
             logger.error(f"Ошибка в обработке платежа: {e}")
@@ -1,83 +1,102 @@
 from aiogram import Router
 from aiogram.types import Message
-from aiogram.filters import Command, CommandStart
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from aiogram.filters import Command, CommandObject, CommandStart
 from datetime import datetime, timezone
 
-from bot.config import is_admin
+from bot.config import DEFAULT_TIMEZONE, DELIVERY_WINDOW_END, DELIVERY_WINDOW_START, is_admin
 from bot.db.base import AsyncSessionLocal
-from bot.db.models import User, Subscription
+from bot.db.notify import notify_subscriptions_changed, subscription_payload
+from bot.db.repository import set_user_timezone
 from bot.keyboards.payment import pay_keyboard
+from bot.services.delivery_window import is_valid_timezone
+from bot.services.user_cache import get_user_snapshot, register_user, user_cache
 
 router = Router()
 
 @router.message(CommandStart())
 async def start_handler(message: Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+    user, created = await register_user(message.from_user.id, message.from_user.username)
 
-        if not user:
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-            )
-            session.add(user)
-            await session.commit()
-            
-            await message.answer(
-                "👋 Привет!\n\n"
-                "Этот бот напоминает об оплате VPN подписки.\n\n"
-                "Напиши администратору для активации подписки(@T_Yukky).\n"
-                "Когда подойдет время оплаты — я пришлю тебе напоминание с кнопкой.\n\n"
-                "После оплаты нажми кнопку 'Я оплатил', и админ подтвердит платеж."
-            )
-            return
+    if created:
+        await message.answer(
+            "👋 Привет!\n\n"
+            "Этот бот напоминает об оплате VPN подписки.\n\n"
+            "Напиши администратору для активации подписки(@T_Yukky).\n"
+            "Когда подойдет время оплаты — я пришлю тебе напоминание с кнопкой.\n\n"
+            "После оплаты нажми кнопку 'Я оплатил', и админ подтвердит платеж."
+        )
+        return
 
-        if is_admin(message.from_user.id):
-            await message.answer("👑 Админ-панель доступна через команды /activate, /users, /find, /payments")
-            return
+    if is_admin(message.from_user.id):
+        await message.answer("👑 Админ-панель доступна через команды /activate, /users, /find, /payments, /pending")
+        return
 
-        if user.subscription is None:
-            await message.answer("ℹ️ У тебя пока нет активной подписки.")
-            return
+    if user.subscription is None:
+        await message.answer("ℹ️ У тебя пока нет активной подписки.")
+        return
 
-        sub = user.subscription
-        days_left = (sub.next_payment - datetime.now(timezone.utc)).days
-        
-        # Всегда показываем статус, НЕ показываем кнопку
-        status_emoji = "✅" if sub.status == "active" else "❌"
-        await message.answer(
-            f"{status_emoji} <b>Текущий статус подписки</b>\n\n"
-            f"📅 Следующий платёж: <b>{sub.next_payment:%d.%m.%Y}</b>\n"
-            f"📌 Статус: <b>{sub.status}</b>\n"
-            f"⏳ Осталось дней: <b>{max(0, days_left)}</b>\n\n"
-            f"<i>Я пришлю напоминание за 3 дня до платежа</i>"
-        )
+    sub = user.subscription
+    days_left = (sub.next_payment - datetime.now(timezone.utc)).days
+    
+    # Всегда показываем статус, НЕ показываем кнопку
+    status_emoji = "✅" if sub.status == "active" else "❌"
+    await message.answer(
+        f"{status_emoji} <b>Текущий статус подписки</b>\n\n"
+        f"📅 Следующий платёж: <b>{sub.next_payment:%d.%m.%Y}</b>\n"
+        f"📌 Статус: <b>{sub.status}</b>\n"
+        f"⏳ Осталось дней: <b>{max(0, days_left)}</b>\n\n"
+        f"<i>Я пришлю напоминание за 3 дня до платежа</i>"
+    )
 
 @router.message(Command("status"))
 async def status_handler(message: Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .where(User.telegram_id == message.from_user.id)
+    user = await get_user_snapshot(message.from_user.id)
+
+    if not user or not user.subscription:
+        await message.answer("У вас нет активной подписки")
+        return
+
+    sub = user.subscription
+    days_left = (sub.next_payment - datetime.now(timezone.utc)).days
+    
+    await message.answer(
+        f"📅 Следующий платёж: <b>{sub.next_payment:%d.%m.%Y}</b>\n"
+        f"⏳ Осталось дней: <b>{max(0, days_left)}</b>"
+    )
+
+@router.message(Command("timezone"))
+async def timezone_handler(message: Message, command: CommandObject):
+    """Часовой пояс для напоминаний: /timezone Asia/Yekaterinburg"""
+    user = await get_user_snapshot(message.from_user.id)
+    if not user:
+        await message.answer("Сначала напишите /start")
+        return
+
+    name = (command.args or "").strip()
+    if not name:
+        await message.answer(
+            f"🕒 Ваш часовой пояс: <b>{user.timezone or DEFAULT_TIMEZONE}</b>\n"
+            f"Напоминания приходят с {DELIVERY_WINDOW_START}:00 до {DELIVERY_WINDOW_END}:00 по местному времени.\n\n"
+            f"Сменить: /timezone Asia/Yekaterinburg"
         )
-        user = result.scalar_one_or_none()
+        return
 
-        if not user or not user.subscription:
-            await message.answer("У вас нет активной подписки")
-            return
+    if not is_valid_timezone(name):
+        await message.answer("❌ Не знаю такого часового пояса. Пример: Europe/Moscow, Asia/Novosibirsk")
+        return
 
+    async with AsyncSessionLocal() as session:
+        if not await set_user_timezone(session, user.telegram_id, name):
+            await message.answer("❌ Этот часовой пояс не поддерживается. Пример: Europe/Moscow, Asia/Novosibirsk")
+            return
+        # Планировщик пересчитает время напоминаний по новому поясу
         sub = user.subscription
-        days_left = (sub.next_payment - datetime.now(timezone.utc)).days
-        
-        await message.answer(
-            f"📅 Следующий платёж: <b>{sub.next_payment:%d.%m.%Y}</b>\n"
-            f"⏳ Осталось дней: <b>{max(0, days_left)}</b>"
-        )
\ No newline at end of file
+        if sub is not None:
+            await notify_subscriptions_changed(
+                session,
+                [subscription_payload(sub.id, user.telegram_id, sub.status, sub.next_payment)],
+            )
+        await session.commit()
+    user_cache.invalidate(user.telegram_id)
+
+    await message.answer(f"✅ Часовой пояс: <b>{name}</b>")
@@ -15,4 +15,60 @@ def payment_admin_keyboard(payment_id: int):
             ]
         ]
     )
- 
\ No newline at end of file
+ 
+
+def page_keyboard(kind: str, first: str, last: str, has_prev: bool, has_next: bool):
+    """Кнопки «новее/старше» для списков /users и /payments; None, если листать некуда"""
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"{kind}_page:prev:{first}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Старше ➡️", callback_data=f"{kind}_page:next:{last}"))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+PENDING_SELECTED = "✅"
+PENDING_UNSELECTED = "⬜"
+
+
+def pending_keyboard(entries: list[tuple[int, str]], selected: set[int], total: int, max_id: int):
+    """
+    Заявки /pending с переключателями выбора и действиями над ними.
+
+    Выбор хранится в самой клавиатуре (отметки в тексте кнопок), поэтому
+    переключение не ходит в БД и работает на любой реплике.
+    """
+    rows = [
+        [InlineKeyboardButton(
+            text=f"{PENDING_SELECTED if payment_id in selected else PENDING_UNSELECTED} {label}",
+            callback_data=f"pend_toggle:{payment_id}",
+        )]
+        for payment_id, label in entries
+    ]
+    rows.append([InlineKeyboardButton(
+        text=f"✅ Подтвердить выбранные ({len(selected)})", callback_data="pend_confirm"
+    )])
+    rows.append([InlineKeyboardButton(
+        text=f"☑️ Подтвердить все ({total})", callback_data=f"pend_all:{max_id}:{total}"
+    )])
+    rows.append([InlineKeyboardButton(text="🔄 Обновить", callback_data="pend_refresh")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def parse_pending_keyboard(markup: InlineKeyboardMarkup):
+    """Обратно из клавиатуры /pending: (entries, selected, total, max_id)"""
+    entries, selected, total, max_id = [], set(), 0, 0
+    for row in markup.inline_keyboard:
+        for button in row:
+            data = button.callback_data or ""
+            if data.startswith("pend_toggle:"):
+                payment_id = int(data.split(":")[1])
+                mark, label = button.text.split(" ", 1)
+                entries.append((payment_id, label))
+                if mark == PENDING_SELECTED:
+                    selected.add(payment_id)
+            elif data.startswith("pend_all:"):
+                _, max_id, total = data.split(":")
+    return entries, selected, int(total), int(max_id)
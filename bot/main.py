@@ -1,20 +1,40 @@
+import argparse
 import asyncio
+import signal
 import asyncpg
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.enums import ParseMode
-
-from bot.config import BOT_TOKEN, DATABASE_URL
-from bot.db.base import engine, Base
-from bot.db import models  
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot.config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    SCHEDULER_MODE,
+)
+from bot.db.migrations import migrate
 
 from bot.handlers.start import router as start_router
 from bot.handlers.payments import payments_router 
 from bot.handlers.admin_payments import admin_payments_router
 from bot.handlers.admin import admin_router  
 
+from bot.middlewares.metrics import HandlerMetricsMiddleware
+from bot.middlewares.profiling import ProfilingMiddleware
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.services.metrics import start_metrics_server
 from bot.services.scheduler import subscription_watcher
+from bot.services.partitions import PartitionMembership
+from bot.services.sender import SendPipeline
+from bot.services.outbox import outbox_dispatcher
+from bot.services.user_cache import cache_invalidation_listener
 from bot.config import DATABASE_URL_ASYNCPG
 
 async def wait_for_db(url):
@@ -33,12 +53,78 @@ async def wait_for_db(url):
 
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    print("DB initialized")
+    applied = await migrate()
+    print(f"DB initialized, migrations applied: {len(applied)}")
+
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+
+    # Профилирование апдейта целиком: время, число SQL и время в БД
+    dp.update.outer_middleware(ProfilingMiddleware())
+
+    # Антифлуд первым: отклонённый апдейт не доходит ни до обработчика, ни до БД
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+
+    # Метрики по каждому обработчику всех роутеров
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+    dp.include_router(start_router)
+    dp.include_router(payments_router)
+    dp.include_router(admin_payments_router)
+    dp.include_router(admin_router)
+
+    return dp
+
+
+async def run_polling(dp: Dispatcher, bot: Bot):
+    # Telegram не отдаёт getUpdates, пока установлен webhook
+    await bot.delete_webhook()
+    print("Bot started, polling...")
+    await dp.start_polling(bot)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("Для webhook-режима нужны WEBHOOK_URL и WEBHOOK_SECRET")
+
+    app = web.Application()
+    # Заголовок X-Telegram-Bot-Api-Secret-Token проверяется до разбора апдейта
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"Bot started, webhook on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
 
+    try:
+        await stop.wait()
+    finally:
+        # Дожидаемся обработки уже принятых апдейтов и закрываем сессию бота
+        await runner.cleanup()
 
-async def main():
+
+async def main(mode: str = BOT_MODE):
     print("BOT TOKEN =", BOT_TOKEN)
 
     await wait_for_db(DATABASE_URL_ASYNCPG)
@@ -49,18 +135,30 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
-    asyncio.create_task(subscription_watcher(bot))
+    await start_metrics_server()
 
-    dp = Dispatcher()
+    sender = SendPipeline(bot)
+    sender.start()
+    asyncio.create_task(outbox_dispatcher(sender))
+    if SCHEDULER_MODE == "leader":
+        asyncio.create_task(subscription_watcher())
+    elif SCHEDULER_MODE == "partitioned":
+        membership = PartitionMembership()
+        asyncio.create_task(membership.run())
+        asyncio.create_task(subscription_watcher(membership))
+    asyncio.create_task(cache_invalidation_listener())
 
-    dp.include_router(start_router)
-    dp.include_router(payments_router)
-    dp.include_router(admin_payments_router)
-    dp.include_router(admin_router)
+    dp = create_dispatcher()
 
-    print("Bot started, polling...")
-    await dp.start_polling(bot)
+    if mode == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await run_polling(dp, bot)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=BOT_MODE)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.mode))
@@ -0,0 +1,34 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.db.profiling import set_handler
+from bot.services.metrics import HANDLER_DURATION, HANDLER_ERRORS
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время и ошибки каждого обработчика.
+
+    Внутренний middleware: регистрируется на Dispatcher и срабатывает
+    для обработчиков всех вложенных роутеров, уже после фильтров.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        set_handler(name)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(name).observe(time.perf_counter() - start)
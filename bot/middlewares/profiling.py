@@ -0,0 +1,42 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.db.profiling import UpdateProfile, current_profile, settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на Update: время обработки апдейта целиком,
+    число SQL-запросов и время в БД внутри него.
+
+    Много запросов на один апдейт — верный признак N+1.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not settings.enabled:
+            return await handler(event, data)
+
+        # Имя обработчика уточнит внутренний middleware после роутинга
+        profile = UpdateProfile(event.event_type)
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_profile.reset(token)
+            logger.info(
+                f"⏱ {profile.handler}: {elapsed * 1000:.1f} мс, "
+                f"SQL: {profile.statements} запросов за {profile.db_time * 1000:.1f} мс"
+            )
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.config import THROTTLE_BURST, THROTTLE_MAX_BUCKETS, THROTTLE_RATE, is_admin
+from bot.services.metrics import THROTTLED
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите немного"
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Token bucket на пару (пользователь, обработчик).
+
+    Срабатывает после фильтров, но до обработчика, поэтому отклонённый
+    апдейт не открывает сессию БД. Лимит обработчика можно переопределить
+    флагом: flags={"throttle": (rate, burst)}.
+
+    Вёдра хранятся в LRU: при переполнении вытесняются давно не
+    использованные — к этому моменту они всё равно снова полные.
+    """
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: int = THROTTLE_BURST,
+        max_buckets: int = THROTTLE_MAX_BUCKETS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[tuple[int, str], _Bucket] = OrderedDict()
+
+    def allow(self, key: tuple[int, str], rate: float, burst: int) -> tuple[bool, _Bucket]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(burst, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return True, bucket
+        return False, bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or is_admin(user.id):
+            return await handler(event, data)
+
+        name = data["handler"].callback.__name__
+        rate, burst = get_flag(data, "throttle", default=(self.rate, self.burst))
+        allowed, bucket = self.allow((user.id, name), rate, burst)
+        if allowed:
+            return await handler(event, data)
+
+        THROTTLED.labels(name).inc()
+        if isinstance(event, CallbackQuery):
+            # Callback нужно закрыть, иначе у пользователя крутится индикатор
+            await event.answer(THROTTLED_TEXT)
+        elif isinstance(event, Message) and not bucket.warned:
+            # На флуд сообщениями отвечаем один раз, дальше молча отбрасываем
+            bucket.warned = True
+            await event.answer(THROTTLED_TEXT)
@@ -0,0 +1,71 @@
+"""
+Окно доставки: когда пользователю можно писать по его местному времени.
+
+Сообщения одного дня не уходят разом в полночь: каждой подписке
+достаётся свой момент внутри окна DELIVERY_WINDOW_START–END, стабильный
+по её id, поэтому отправки равномерно растянуты на всё окно.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, available_timezones
+
+from bot.config import DEFAULT_TIMEZONE, DELIVERY_WINDOW_END, DELIVERY_WINDOW_START
+
+# Служебные файлы каталога поясов: zoneinfo их открывает, а timezone() в Postgres — нет
+_SYSTEM_ZONES = {"localtime", "posixrules"}
+_SYSTEM_PREFIXES = ("posix/", "right/")
+
+
+@lru_cache(maxsize=1)
+def _known_timezones() -> frozenset[str]:
+    return frozenset(
+        name for name in available_timezones()
+        if name not in _SYSTEM_ZONES and not name.startswith(_SYSTEM_PREFIXES)
+    )
+
+
+def is_valid_timezone(name: str) -> bool:
+    """Пояс IANA из базы zoneinfo; знает ли его Postgres, проверяет set_user_timezone"""
+    return name in _known_timezones()
+
+
+@lru_cache(maxsize=512)
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    """Часовой пояс пользователя; без пояса или с неизвестным — DEFAULT_TIMEZONE"""
+    if name and is_valid_timezone(name):
+        return ZoneInfo(name)
+    return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def local_time(day: date, hours: int, zone: ZoneInfo) -> datetime:
+    """hours:00 местного времени дня day (24 — полночь следующего дня), в UTC"""
+    # Сложение с aware-datetime идёт по местным часам, поэтому переходы
+    # на летнее время не сдвигают окно
+    return (datetime.combine(day, time(), tzinfo=zone) + timedelta(hours=hours)).astimezone(timezone.utc)
+
+
+def delivery_window(day: date, zone: ZoneInfo) -> tuple[datetime, datetime]:
+    return (
+        local_time(day, DELIVERY_WINDOW_START, zone),
+        local_time(day, DELIVERY_WINDOW_END, zone),
+    )
+
+
+def _spread(key: int) -> float:
+    """Стабильная доля [0, 1) для ключа — мультипликативный хэш Кнута"""
+    return (key * 2654435761 % 2**32) / 2**32
+
+
+def send_slot(key: int, day: date, zone: ZoneInfo) -> datetime:
+    """Момент отправки для key внутри окна дня day"""
+    start, end = delivery_window(day, zone)
+    return start + (end - start) * _spread(key)
+
+
+def next_send_time(key: int, zone: ZoneInfo, now: datetime) -> datetime:
+    """Ближайший слот для сообщения, которое может подождать окна: сегодня или завтра"""
+    today = now.astimezone(zone).date()
+    if now < delivery_window(today, zone)[1]:
+        return max(send_slot(key, today, zone), now)
+    return send_slot(key, today + timedelta(days=1), zone)
@@ -0,0 +1,82 @@
+"""
+Потоковая выгрузка пользователей, подписок и платежей в CSV или JSON Lines.
+
+Строки читаются серверным курсором пачками, каждая пачка форматируется
+и сразу дописывается в файл, поэтому память не зависит от размера таблиц.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from typing import IO
+
+from bot.db.base import AsyncSessionLocal
+from bot.db.repository import stream_export
+
+EXPORT_KINDS = ("users", "subscriptions", "payments")
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _format_csv(columns: list[str], rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_value(v) for v in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _format_jsonl(columns: list[str], rows, header: bool) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+FORMATTERS = {"csv": _format_csv, "jsonl": _format_jsonl}
+
+
+def export_filename(kind: str, fmt: str, compress: bool) -> str:
+    return f"{kind}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}" + (".gz" if compress else "")
+
+
+def open_export(path: str, compress: bool) -> IO[str]:
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+async def export_rows(kind: str, fmt: str, out: IO[str]) -> int:
+    """Записать выгрузку в открытый текстовый файл; возвращает число строк"""
+    formatter = FORMATTERS[fmt]
+    count = 0
+
+    async with AsyncSessionLocal() as session:
+        result = await stream_export(session, kind)
+        columns = list(result.keys())
+        header = True
+        async for rows in result.partitions():
+            chunk = formatter(columns, rows, header)
+            # Запись и gzip — в потоке, чтобы не держать event loop
+            await asyncio.to_thread(out.write, chunk)
+            header = False
+            count += len(rows)
+
+        if header and fmt == "csv":
+            await asyncio.to_thread(out.write, formatter(columns, [], True))
+
+    return count
+
+
+async def export_to_file(kind: str, fmt: str, path: str, compress: bool = False) -> int:
+    out = open_export(path, compress)
+    try:
+        return await export_rows(kind, fmt, out)
+    finally:
+        await asyncio.to_thread(out.close)
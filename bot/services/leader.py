@@ -0,0 +1,48 @@
+import logging
+
+import asyncpg
+
+from bot.config import LEADER_RETRY_INTERVAL
+
+# Ключ advisory lock планировщика: держит ровно одна реплика
+SCHEDULER_LOCK_KEY = 7_140_002
+
+logger = logging.getLogger(__name__)
+
+
+async def try_acquire(conn: asyncpg.Connection, key: int) -> bool:
+    return await conn.fetchval("SELECT pg_try_advisory_lock($1)", key)
+
+
+async def wait_for_leadership(
+    conn: asyncpg.Connection,
+    key: int = SCHEDULER_LOCK_KEY,
+    retry_interval: float = LEADER_RETRY_INTERVAL,
+):
+    """
+    Ждать, пока эта реплика не станет лидером.
+
+    Блокировка сессионная: она живёт, пока открыто conn, и освобождается
+    Postgres'ом, как только соединение лидера закрывается или рвётся.
+    Резервная реплика не опрашивает блокировку, а ждёт в pg_advisory_lock
+    и получает её сразу после освобождения. lock_timeout = retry_interval
+    только прерывает ожидание, чтобы оборванное соединение резервной
+    реплики не висело в нём бесконечно.
+
+    Перехват лидерства: если процесс лидера упал или закрыл соединение —
+    доли секунды; если пропали хост или сеть лидера — пока Postgres не
+    заметит обрыв по TCP keepalive, не дольше ~8 секунд (см. connect()).
+    """
+    if not await try_acquire(conn, key):
+        logger.info("⏸ Планировщик работает на другой реплике, ждём своей очереди")
+        await conn.execute(
+            "SELECT set_config('lock_timeout', $1, false)", f"{max(1, int(retry_interval * 1000))}ms"
+        )
+        while True:
+            try:
+                await conn.execute("SELECT pg_advisory_lock($1)", key)
+                break
+            except asyncpg.LockNotAvailableError:
+                continue
+        await conn.execute("RESET lock_timeout")
+    logger.info("👑 Эта реплика стала лидером планировщика")
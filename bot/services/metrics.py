@@ -0,0 +1,228 @@
+"""
+Метрики в формате Prometheus и HTTP-эндпоинт /metrics.
+
+Всё выполняется в одном event loop, поэтому счётчики — обычные числа
+без блокировок. Дочерние метрики с метками создаются один раз и
+кэшируются: наблюдение — это поиск в dict и пара сложений.
+"""
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from aiohttp import web
+
+from bot.config import METRICS_HOST, METRICS_PORT
+from bot.db.base import db_pool_stats
+from bot.services.user_cache import user_cache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> list[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {child.value}"]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # Последняя ячейка — значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = _labels(self.labelnames, values, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {child.sum}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """Значения снимаются функцией в момент запроса /metrics"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._collect = collect
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {self._collect()}",
+        ]
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Обработчики ---
+
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Время обработки апдейта обработчиком", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler", "error"]
+)
+
+THROTTLED = Counter(
+    "bot_throttled_total", "Апдейтов отклонено антифлудом", ["handler"]
+)
+
+# --- Планировщик ---
+
+SCHEDULER_TICK_DURATION = Histogram(
+    "bot_scheduler_tick_duration_seconds", "Длительность тика планировщика"
+)
+SCHEDULER_ROWS_SCANNED = Counter(
+    "bot_scheduler_rows_scanned_total", "Подписок проверено планировщиком"
+)
+SCHEDULER_REMINDERS = Counter(
+    "bot_scheduler_reminders_total", "Напоминаний поставлено в outbox"
+)
+SCHEDULER_EXPIRED = Counter(
+    "bot_scheduler_expired_total", "Подписок переведено в expired"
+)
+
+# --- Отправка в Telegram ---
+
+SEND_DURATION = Histogram(
+    "bot_send_message_duration_seconds", "Время вызова bot.send_message"
+)
+SEND_FAILURES = Counter(
+    "bot_send_message_failures_total", "Ошибки bot.send_message по типу", ["error"]
+)
+SEND_UNDELIVERABLE = Counter(
+    "bot_send_undeliverable_total", "Получателей помечено недоступными", ["state"]
+)
+
+
+# --- Пул соединений БД и кэш пользователей (снимаются при запросе) ---
+
+for _key, _doc in [
+    ("size", "Размер пула соединений"),
+    ("checked_out", "Соединений выдано"),
+    ("overflow", "Соединений сверх pool_size"),
+    ("checkouts", "Всего выдач соединений"),
+    ("timeouts", "Таймаутов ожидания соединения"),
+    ("wait_avg_ms", "Среднее ожидание соединения, мс"),
+    ("wait_max_ms", "Максимальное ожидание соединения, мс"),
+]:
+    GaugeCallback(f"bot_db_pool_{_key}", _doc, lambda key=_key: db_pool_stats()[key])
+
+GaugeCallback("bot_user_cache_size", "Записей в кэше пользователей", lambda: user_cache.stats()["size"])
+GaugeCallback("bot_user_cache_hit_rate", "Доля попаданий в кэш пользователей", lambda: user_cache.stats()["hit_rate"])
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(
+    host: str = METRICS_HOST,
+    port: int = METRICS_PORT,
+) -> Optional[web.AppRunner]:
+    """Поднять /metrics на отдельном порту; порт 0 — метрики выключены"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
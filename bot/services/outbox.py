@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import Row, bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETENTION_DAYS,
+    UNREACHABLE_RETRY_HOURS,
+)
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import Notification
+from bot.db.notify import NOTIFICATION_CHANNEL, listen, notify_outbox, notify_users_changed
+from bot.db.repository import id_in, set_delivery_state
+from bot.services.metrics import SEND_UNDELIVERABLE
+from bot.services.sender import SendPipeline, classify_send_error
+from bot.services.user_cache import user_cache
+
+MAX_BACKOFF = timedelta(hours=1)
+PURGE_INTERVAL = timedelta(hours=1)
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+async def enqueue_notifications(
+    session: AsyncSession,
+    messages: Iterable[tuple],
+):
+    """
+    Записать уведомления в outbox в рамках текущей транзакции.
+
+    messages — (chat_id, text, reply_markup) и необязательный четвёртый
+    элемент send_at: не отправлять раньше этого момента.
+    Отправит их диспетчер после commit; при rollback они пропадут
+    вместе с изменением, о котором сообщают.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "chat_id": chat_id,
+            "text": text,
+            "reply_markup": markup.model_dump_json(exclude_none=True) if markup else None,
+            "next_attempt_at": send_at[0] if send_at else now,
+        }
+        for chat_id, text, markup, *send_at in messages
+    ]
+    if not rows:
+        return
+    await session.execute(insert(Notification), rows)
+    await notify_outbox(session)
+
+
+async def enqueue_notification(
+    session: AsyncSession,
+    chat_id: int,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+):
+    await enqueue_notifications(session, [(chat_id, text, reply_markup)])
+
+
+def _backoff(attempts: int) -> timedelta:
+    return min(timedelta(seconds=5 * 2 ** attempts), MAX_BACKOFF)
+
+
+async def claim_batch(now: datetime) -> tuple[list[Row], datetime]:
+    """
+    Взять в аренду пачку готовых уведомлений: status = 'sending',
+    next_attempt_at = конец аренды. Короткая транзакция — на время отправки
+    ни соединение, ни блокировки строк не держатся.
+
+    Другие диспетчеры аренду не трогают (SKIP LOCKED и next_attempt_at в
+    будущем); если процесс упадёт посреди отправки, по истечении аренды
+    пачку заберёт другой. Возвращает (строки, конец аренды).
+    """
+    leased_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    ready = (
+        select(Notification.id)
+        .where(
+            Notification.status.in_(("pending", "sending")),
+            Notification.next_attempt_at <= now,
+        )
+        .order_by(Notification.next_attempt_at, Notification.id)
+        .limit(OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Notification)
+            .where(Notification.id.in_(ready.scalar_subquery()))
+            .values(
+                status="sending",
+                attempts=Notification.attempts + 1,
+                next_attempt_at=leased_until,
+            )
+            .returning(
+                Notification.id,
+                Notification.chat_id,
+                Notification.text,
+                Notification.reply_markup,
+                Notification.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        batch = sorted(result.all(), key=lambda n: n.id)
+        await session.commit()
+    return batch, leased_until
+
+
+async def dispatch_batch(sender: SendPipeline) -> int:
+    """
+    Отправить одну пачку готовых уведомлений.
+
+    Три шага: аренда пачки (claim_batch), отправка без открытой сессии
+    и запись результатов второй короткой транзакцией. Результат пишется
+    только пока аренда наша: если её перехватил другой диспетчер,
+    строку ведёт он.
+
+    Если пользователь заблокировал бота, удалил аккаунт или чат не найден,
+    уведомление не повторяется, а пользователь помечается недоступным —
+    планировщик перестаёт ставить ему сообщения.
+    """
+    batch, leased_until = await claim_batch(datetime.now(timezone.utc))
+    if not batch:
+        return 0
+
+    results = await sender.send_many(
+        (
+            n.chat_id,
+            n.text,
+            {"reply_markup": InlineKeyboardMarkup.model_validate_json(n.reply_markup)}
+            if n.reply_markup else {},
+        )
+        for n in batch
+    )
+
+    now = datetime.now(timezone.utc)
+    sent: list[int] = []
+    outcomes: list[dict] = []
+    undeliverable: dict[str, set[int]] = {}
+    for notification, outcome in zip(batch, results):
+        if not isinstance(outcome, Exception):
+            sent.append(notification.id)
+            continue
+
+        error = str(outcome)[:256]
+        reason = classify_send_error(outcome)
+        if reason is not None:
+            status, next_attempt_at = "failed", now
+            undeliverable.setdefault(reason, set()).add(notification.chat_id)
+        elif notification.attempts >= OUTBOX_MAX_ATTEMPTS:
+            status, next_attempt_at = "failed", now
+            logger.error(f"❌ Уведомление {notification.id} для {notification.chat_id} не доставлено: {outcome}")
+        else:
+            status, next_attempt_at = "pending", now + _backoff(notification.attempts)
+            logger.warning(f"⚠️ Повтор уведомления {notification.id} для {notification.chat_id}: {outcome}")
+        outcomes.append({
+            "n_id": notification.id,
+            "n_status": status,
+            "n_error": error,
+            "n_next_attempt_at": next_attempt_at,
+        })
+
+    notifications = Notification.__table__
+    ours = (notifications.c.status == "sending", notifications.c.next_attempt_at == leased_until)
+    async with AsyncSessionLocal() as session:
+        if sent:
+            await session.execute(
+                update(notifications)
+                .where(id_in(notifications.c.id, sent), *ours)
+                .values(status="sent", sent_at=now)
+            )
+        if outcomes:
+            await session.execute(
+                update(notifications)
+                .where(notifications.c.id == bindparam("n_id"), *ours)
+                .values(
+                    status=bindparam("n_status"),
+                    last_error=bindparam("n_error"),
+                    next_attempt_at=bindparam("n_next_attempt_at"),
+                ),
+                outcomes,
+            )
+
+        for reason, chat_ids in undeliverable.items():
+            # Чат не найден — возможно, временно: пробуем снова через паузу
+            if reason == "unreachable":
+                await set_delivery_state(
+                    session, list(chat_ids), "ok", now + timedelta(hours=UNREACHABLE_RETRY_HOURS)
+                )
+            else:
+                await set_delivery_state(session, list(chat_ids), reason)
+            SEND_UNDELIVERABLE.labels(reason).inc(len(chat_ids))
+            logger.info(f"🚫 Недоступны ({reason}): {len(chat_ids)} пользователей")
+        # Снимки этих пользователей устарели и в кэшах других реплик
+        await notify_users_changed(session, set().union(*undeliverable.values()))
+
+        await session.commit()
+
+    # Свой кэш — сразу, не дожидаясь NOTIFY
+    for chat_ids in undeliverable.values():
+        for chat_id in chat_ids:
+            user_cache.invalidate(chat_id)
+    return len(batch)
+
+
+async def purge_delivered():
+    """Удалить давно доставленные уведомления"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(Notification).where(
+                Notification.status == "sent",
+                Notification.sent_at < datetime.now(timezone.utc) - timedelta(days=OUTBOX_RETENTION_DAYS),
+            )
+        )
+        await session.commit()
+
+
+async def outbox_dispatcher(sender: SendPipeline):
+    """Фоновая задача, разбирающая outbox уведомлений"""
+    logger.info("📤 Диспетчер уведомлений запущен")
+    wakeup = asyncio.Event()
+    next_purge = datetime.now(timezone.utc)
+
+    while True:
+        conn = None
+        try:
+            conn = await listen(NOTIFICATION_CHANNEL, lambda _: wakeup.set(), on_close=wakeup.set)
+
+            while not conn.is_closed():
+                wakeup.clear()
+                if await dispatch_batch(sender) >= OUTBOX_BATCH_SIZE:
+                    continue
+
+                if datetime.now(timezone.utc) >= next_purge:
+                    await purge_delivered()
+                    next_purge = datetime.now(timezone.utc) + PURGE_INTERVAL
+
+                # Новые уведомления будят через NOTIFY, повторы — по таймеру
+                try:
+                    await asyncio.wait_for(wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка в диспетчере уведомлений: {e}")
+
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+        await asyncio.sleep(RECONNECT_DELAY)
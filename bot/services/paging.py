@@ -0,0 +1,42 @@
+from datetime import datetime, timezone, timedelta
+from typing import Iterable
+
+from bot.db.repository import Cursor
+
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def fit_page(header: str, entries: Iterable[str], limit: int = MESSAGE_LIMIT) -> tuple[str, int]:
+    """
+    Собрать текст страницы из заголовка и записей, пока он влезает в limit.
+
+    Возвращает текст и число вошедших записей: следующая страница
+    начинается с первой невошедшей, поэтому записи не теряются.
+    """
+    parts = [header]
+    length = len(header)
+    count = 0
+    for entry in entries:
+        if length + len(entry) > limit and count:
+            break
+        parts.append(entry)
+        length += len(entry)
+        count += 1
+    return "".join(parts)[:limit], count
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Курсор для callback_data (лимит Telegram — 64 байта)"""
+    created_at, row_id = cursor
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return f"{(created_at - _EPOCH) // _MICROSECOND}:{row_id}"
+
+
+def decode_cursor(value: str) -> Cursor:
+    micros, row_id = value.split(":")
+    return _EPOCH + timedelta(microseconds=int(micros)), int(row_id)
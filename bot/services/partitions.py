@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from bot.config import WORKER_HEARTBEAT_INTERVAL, WORKER_TTL
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import SchedulerWorker
+
+logger = logging.getLogger(__name__)
+
+# (номер партиции, число партиций)
+Partition = tuple[int, int]
+# Партиции, которые воркер обрабатывает сейчас: своя и, пока перебалансировка
+# не завершена, прежние
+Partitions = tuple[Partition, ...]
+
+# Ключ advisory lock: раздача партиций идёт по одной транзакции за раз
+PARTITION_LOCK_KEY = 7_140_003
+
+
+def owns(partitions: Optional[Partitions], sub_id: int) -> bool:
+    """Относится ли подписка к одной из партиций; без партиций — все подписки"""
+    if partitions is None:
+        return True
+    return any(sub_id % count == index for index, count in partitions)
+
+
+class PartitionMembership:
+    """
+    Членство воркера в группе планировщиков.
+
+    Каждый воркер пишет heartbeat в scheduler_workers и удаляет просроченных.
+    Партиции (id % N == k по месту в отсортированном списке живых) раздаёт
+    тот, кто первым заметил смену состава: под advisory lock одной транзакцией
+    для всех сразу, с новой эпохой. Поэтому два воркера никогда не видят
+    разные раскладки одной эпохи.
+
+    Остальные узнают новую партицию на своём heartbeat. Чтобы в это время
+    у остатка не было «ничьей» минуты, воркер обрабатывает и прежние
+    партиции, пока все живые воркеры не подтвердят новую эпоху: перекрытие
+    безвредно (reminder_log), а промежутка без владельца нет.
+
+    Подписки ушедшего воркера ждут heartbeat нового владельца, а пропавшего —
+    ещё и истечения его записи (WORKER_TTL). Новый владелец загружает их
+    вместе с уже открытыми окнами доставки, поэтому теряются только
+    напоминания, чьё окно успело закрыться за это время.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.partition: Optional[Partition] = None
+        self.partitions: Optional[Partitions] = None
+        self.epoch = 0
+        self._ready = asyncio.Event()
+        self._listeners: list[Callable[[], None]] = []
+
+    def on_change(self, callback: Callable[[], None]):
+        self._listeners.append(callback)
+
+    async def wait_ready(self) -> Partitions:
+        await self._ready.wait()
+        return self.partitions
+
+    async def heartbeat(self) -> tuple[Partition, int, bool]:
+        """Обновить heartbeat; возвращает (партиция, эпоха, подтвердили ли её все)"""
+        now = datetime.now(timezone.utc)
+        workers = SchedulerWorker.__table__
+        async with AsyncSessionLocal() as session:
+            await session.execute(select(func.pg_advisory_xact_lock(PARTITION_LOCK_KEY)))
+            await session.execute(
+                insert(workers)
+                .values(worker_id=self.worker_id, heartbeat_at=now)
+                .on_conflict_do_update(index_elements=[workers.c.worker_id], set_={"heartbeat_at": now})
+            )
+            await session.execute(
+                delete(workers).where(workers.c.heartbeat_at < now - timedelta(seconds=WORKER_TTL))
+            )
+            rows = (await session.execute(select(workers).order_by(workers.c.worker_id))).all()
+
+            epoch = max(row.epoch for row in rows)
+            if any(
+                row.epoch != epoch or row.slot != index or row.workers != len(rows)
+                for index, row in enumerate(rows)
+            ):
+                # Состав изменился: новая раскладка для всех живых воркеров сразу
+                epoch += 1
+                await session.execute(
+                    update(workers)
+                    .where(workers.c.worker_id == bindparam("w_id"))
+                    .values(slot=bindparam("w_slot"), workers=len(rows), epoch=epoch),
+                    [{"w_id": row.worker_id, "w_slot": index} for index, row in enumerate(rows)],
+                )
+            await session.execute(
+                update(workers).where(workers.c.worker_id == self.worker_id).values(acked_epoch=epoch)
+            )
+            settled = all(row.acked_epoch == epoch for row in rows if row.worker_id != self.worker_id)
+            await session.commit()
+
+        index = [row.worker_id for row in rows].index(self.worker_id)
+        return (index, len(rows)), epoch, settled
+
+    async def refresh(self):
+        """Один heartbeat; при смене партиций уведомляет подписчиков"""
+        partition, epoch, settled = await self.heartbeat()
+        # Прежние партиции отпускаем, только когда новую раскладку обрабатывают все
+        partitions = (partition,) if settled else tuple(dict.fromkeys((partition, *(self.partitions or ()))))
+        if partition != self.partition:
+            logger.info(f"🧩 Воркер {self.worker_id}: партиция {partition[0]} из {partition[1]} (эпоха {epoch})")
+        self.partition, self.epoch = partition, epoch
+        if partitions != self.partitions:
+            self.partitions = partitions
+            self._ready.set()
+            for callback in self._listeners:
+                callback()
+
+    async def run(self):
+        """Фоновая задача heartbeat"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Ошибка heartbeat воркера {self.worker_id}: {e}")
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    async def leave(self):
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(SchedulerWorker).where(SchedulerWorker.worker_id == self.worker_id)
+            )
+            await session.commit()
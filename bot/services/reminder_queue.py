@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+from datetime import datetime, timezone, timedelta
+from typing import Collection, Optional
+from zoneinfo import ZoneInfo
+
+from bot.services.delivery_window import delivery_window, local_time, send_slot
+
+
+def _aware(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def next_deadline(
+    sub_id: int,
+    next_payment: datetime,
+    zone: ZoneInfo,
+    now: datetime,
+    remind_before_days: list[int],
+    include_open: bool = True,
+    done_days: Collection[int] = (),
+    not_before: Optional[datetime] = None,
+) -> datetime:
+    """
+    Ближайший момент, когда подписке понадобится внимание планировщика:
+    слот напоминания в окне доставки (по местному времени пользователя)
+    или полночь после дня платежа, когда подписка считается просроченной.
+
+    include_open — попробовать сейчас, если окно дня напоминания уже идёт
+    и слот пройден: было ли оно отправлено, решит reminder_log.
+    done_days — напоминания, которые уже есть в reminder_log: их окна не ждём.
+    not_before — раньше писать пользователю нельзя (пауза после «chat not
+    found»): напоминание переносится на конец паузы, если окно ещё идёт.
+    """
+    payment_day = _aware(next_payment).astimezone(zone).date()
+    candidates = [max(local_time(payment_day + timedelta(days=1), 0, zone), now)]
+
+    for days in remind_before_days:
+        if days in done_days:
+            continue
+        day = payment_day - timedelta(days=days)
+        slot = send_slot(sub_id, day, zone)
+        window_end = delivery_window(day, zone)[1]
+        if not_before is not None:
+            slot = max(slot, _aware(not_before))
+        if now < slot:
+            if slot < window_end:
+                candidates.append(slot)
+        elif include_open and now < window_end:
+            candidates.append(now)
+
+    return min(candidates)
+
+
+class ReminderQueue:
+    """
+    Min-heap ближайших дедлайнов подписок.
+
+    Устаревшие записи в куче не удаляются, а пропускаются при извлечении:
+    актуальный дедлайн подписки хранится в _deadlines.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int]] = []
+        self._deadlines: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def clear(self):
+        self._heap.clear()
+        self._deadlines.clear()
+        self.wakeup()
+
+    def push(self, sub_id: int, deadline: datetime):
+        current = self._deadlines.get(sub_id)
+        if current == deadline:
+            return
+        self._deadlines[sub_id] = deadline
+        heapq.heappush(self._heap, (deadline, sub_id))
+        self.wakeup()
+
+    def remove(self, sub_id: int):
+        self._deadlines.pop(sub_id, None)
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _drop_stale(self):
+        while self._heap:
+            deadline, sub_id = self._heap[0]
+            if self._deadlines.get(sub_id) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def earliest(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[int]:
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, sub_id = heapq.heappop(self._heap)
+            del self._deadlines[sub_id]
+            due.append(sub_id)
+
+    async def wait(self, max_sleep: float):
+        """Спать до ближайшего дедлайна или до изменения очереди"""
+        earliest = self.earliest()
+        timeout = max_sleep
+        if earliest is not None:
+            timeout = min(timeout, (earliest - datetime.now(timezone.utc)).total_seconds())
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
@@ -1,174 +1,284 @@
 import asyncio
-from datetime import datetime, timezone, timedelta  
-from sqlalchemy import select, and_
-from sqlalchemy.orm import selectinload
+import json
+from datetime import date, datetime, timezone, timedelta
 import logging
+import time
+from typing import Optional
 
 from bot.db.base import AsyncSessionLocal
-from bot.db.models import Subscription, User
+from bot.db.repository import (
+    claim_reminders,
+    expire_subscriptions,
+    get_subscription_states,
+    purge_reminder_log,
+    stream_active_subscriptions,
+)
+from bot.db.notify import (
+    SUBSCRIPTION_CHANNEL,
+    connect,
+    is_reload,
+    listen,
+    notify_subscriptions_changed,
+    subscription_payload,
+)
 from bot.keyboards.payment import pay_keyboard
+from bot.services.leader import wait_for_leadership
+from bot.services.metrics import (
+    SCHEDULER_EXPIRED,
+    SCHEDULER_REMINDERS,
+    SCHEDULER_ROWS_SCANNED,
+    SCHEDULER_TICK_DURATION,
+)
+from bot.services.partitions import PartitionMembership, Partitions, owns
+from bot.services.delivery_window import get_zone, next_send_time
+from bot.services.reminder_queue import ReminderQueue, next_deadline
+from bot.services.outbox import enqueue_notifications
 
 # Константы
-#CHECK_INTERVAL = 86400  # Проверяем каждые 10 секунд
-CHECK_INTERVAL = 10  # Проверяем каждые 10 секунд
-REMIND_BEFORE_DAYS = [1, 0]  # Напоминаем за 3, 1 и 0 дней до платежа
+REMIND_BEFORE_DAYS = [1, 0]  # Напоминаем за 1 и 0 дней до платежа
+REMINDER_LOG_DAYS = 30  # Сколько дней хранить записи об отправленных напоминаниях
+RETRY_DELAY = timedelta(minutes=1)  # Повтор после ошибки БД
+MAX_SLEEP = 3600  # Проверяем, живо ли LISTEN-соединение, хотя бы раз в час
+RECONNECT_DELAY = 5
 
 logger = logging.getLogger(__name__)
 
-async def subscription_watcher(bot):
-    """Фоновая задача для отправки напоминаний"""
+
+def reminder_text(next_payment: datetime, remind_day: int) -> str:
+    if remind_day > 0:
+        return (
+            f"⏰ Напоминание!\n\n"
+            f"До следующего платежа по VPN подписке осталось {remind_day} дней.\n"
+            f"Дата платежа: {next_payment:%d.%m.%Y}\n\n"
+            f"После оплаты нажмите кнопку ниже:"
+        )
+    return (
+        f"🚨 СРОЧНО!\n\n"
+        f"Сегодня последний день оплаты VPN подписки!\n"
+        f"Дата платежа: {next_payment:%d.%m.%Y}\n\n"
+        f"После оплаты нажмите кнопку ниже:"
+    )
+
+
+def schedule_subscription(queue: ReminderQueue, sub_id, status, next_payment, timezone_name, now):
+    if status != "active" or next_payment is None:
+        queue.remove(sub_id)
+        return
+    queue.push(sub_id, next_deadline(sub_id, next_payment, get_zone(timezone_name), now, REMIND_BEFORE_DAYS))
+
+
+def reschedule_after_tick(queue: ReminderQueue, state, now: datetime):
+    """
+    Следующий дедлайн подписки после тика. Отправленные напоминания
+    (занятые этим тиком или раньше) видны в reminder_log и пропускаются;
+    не занятое из-за паузы доставки ждёт её конца, если окно дня ещё идёт.
+    """
+    if state.status != "active" or state.next_payment is None:
+        queue.remove(state.id)
+        return
+    zone = get_zone(state.timezone)
+    # Заблокировавшим бота напоминания не нужны до следующего /start
+    done_days = REMIND_BEFORE_DAYS if state.delivery_state != "ok" else (state.reminded or ())
+    deadline = next_deadline(
+        state.id, state.next_payment, zone, now, REMIND_BEFORE_DAYS,
+        done_days=done_days, not_before=state.delivery_retry_at,
+    )
+    if deadline <= now:
+        # Тик только что не занял напоминание, и ничего не изменилось:
+        # повтор сейчас не поможет, ждём следующего окна
+        deadline = next_deadline(
+            state.id, state.next_payment, zone, now, REMIND_BEFORE_DAYS,
+            include_open=False, done_days=done_days, not_before=state.delivery_retry_at,
+        )
+    queue.push(state.id, deadline)
+
+
+def _on_subscription_changed(
+    queue: ReminderQueue,
+    payload: str,
+    partitions: Optional[Partitions] = None,
+    reload: Optional[asyncio.Event] = None,
+):
+    """Обработчик NOTIFY от /activate, confirm_payment и скриптов"""
+    data = json.loads(payload)
+    if is_reload(data):
+        # Перезагрузка очереди — асинхронная, её выполнит цикл планировщика
+        if reload is not None:
+            reload.set()
+            queue.wakeup()
+        return
+    if "id" not in data:
+        # Изменился пользователь, а не подписка — это для кэшей
+        return
+    if not owns(partitions, data["id"]):
+        return
+    if data["status"] != "active" or data["next_payment"] is None:
+        queue.remove(data["id"])
+        return
+    # Часового пояса в сообщении нет: подписку проверит ближайший тик
+    # и сам пересчитает дедлайн по состоянию из БД
+    queue.push(data["id"], datetime.now(timezone.utc))
+
+
+async def load_queue(queue: ReminderQueue, partitions: Optional[Partitions] = None):
+    """
+    Полный проход по активным подпискам (своих партиций) — при старте и
+    перебалансировке. Дедлайны, наступившие до загрузки (пока подписки
+    были у другого воркера), срабатывают сразу, если окно ещё идёт.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await stream_active_subscriptions(session, partitions)
+        now = datetime.now(timezone.utc)
+        queue.clear()
+        async for sub_id, next_payment, timezone_name in result:
+            schedule_subscription(queue, sub_id, "active", next_payment, timezone_name, now)
+    logger.info(f"📋 В очереди напоминаний {len(queue)} подписок")
+
+
+async def purge_old_reminders(today: date):
+    """Чистка reminder_log: напоминания по давно прошедшим платежам больше не нужны"""
+    try:
+        async with AsyncSessionLocal() as session:
+            removed = await purge_reminder_log(session, today - timedelta(days=REMINDER_LOG_DAYS))
+            await session.commit()
+        if removed:
+            logger.info(f"🧹 Удалено старых записей о напоминаниях: {removed}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка очистки reminder_log: {e}")
+
+
+EXPIRED_TEXT = (
+    "❌ Ваша VPN подписка истекла!\n\n"
+    "Для продления обратитесь к администратору."
+)
+
+
+async def process_due(queue: ReminderQueue, due_ids: list[int]):
+    """
+    Поставить в outbox напоминания и просрочки для подписок, чей дедлайн наступил.
+
+    Всё делается одной транзакцией: запись в reminder_log, смена статуса
+    и запись уведомлений. Отправляет их диспетчер outbox.
+
+    Напоминания занимаются только в окне доставки пользователя и в свой
+    слот, поэтому отправки дня растянуты по окну. Подписка истекает в
+    местную полночь, а сообщение об этом ждёт слота в окне.
+    """
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    SCHEDULER_ROWS_SCANNED.inc(len(due_ids))
+
+    async with AsyncSessionLocal() as session:
+        # Напоминание сначала занимается в reminder_log: уже отправленные
+        # (этим тиком, до рестарта или другим воркером) не вернутся
+        reminders = await claim_reminders(session, due_ids, REMIND_BEFORE_DAYS, now)
+
+        # Просроченные подписки (день платежа уже прошел) сразу меняют статус
+        expired = await expire_subscriptions(session, due_ids, now)
+
+        messages = []
+        for sub_id, next_payment, telegram_id, remind_day, timezone_name in reminders:
+            local_payment = next_payment.astimezone(get_zone(timezone_name))
+            messages.append((telegram_id, reminder_text(local_payment, remind_day), pay_keyboard))
+        for sub_id, telegram_id, can_send, timezone_name in expired:
+            if can_send:
+                send_at = next_send_time(sub_id, get_zone(timezone_name), now)
+                messages.append((telegram_id, EXPIRED_TEXT, None, send_at))
+        await enqueue_notifications(session, messages)
+
+        # Просрочки меняют статус — сообщаем кэшам пользователей на всех репликах
+        await notify_subscriptions_changed(
+            session,
+            [subscription_payload(sub_id, telegram_id, "expired", None) for sub_id, telegram_id, *_ in expired],
+        )
+
+        await session.commit()
+        SCHEDULER_REMINDERS.inc(len(reminders))
+        SCHEDULER_EXPIRED.inc(len(expired))
+
+        if messages:
+            logger.info(f"📨 В очередь: {len(reminders)} напоминаний, {len(expired)} просрочек")
+
+        # Пересчитываем следующие дедлайны по актуальному состоянию
+        # вместе с тем, что уже записано в reminder_log
+        states = await get_subscription_states(session, due_ids)
+        now = datetime.now(timezone.utc)
+        for state in states:
+            reschedule_after_tick(queue, state, now)
+
+    SCHEDULER_TICK_DURATION.observe(time.perf_counter() - started)
+
+
+async def subscription_watcher(membership: Optional[PartitionMembership] = None):
+    """
+    Фоновая задача для отправки напоминаний.
+
+    Без membership тики выполняет одна реплика-лидер; с membership воркер
+    обрабатывает только свою партицию подписок и перезагружает очередь,
+    когда состав воркеров меняется.
+    """
     logger.info("🔄 Напоминания о платежах запущены")
-    
+    queue = ReminderQueue()
+    reload = asyncio.Event()
+    partitions: Optional[Partitions] = None
+    purged_on: Optional[date] = None
+    if membership is not None:
+        membership.on_change(queue.wakeup)
+
     while True:
+        conn = None
         try:
-            async with AsyncSessionLocal() as session:
-                # ИСПРАВЛЕНО: используем timezone-aware datetime
-                now = datetime.now(timezone.utc)
-                today = now.date()
-                
-                # Находим подписки, по которым нужно отправить напоминание
-                result = await session.execute(
-                    select(Subscription)
-                    .join(User)
-                    .options(selectinload(Subscription.user))
-                    .where(Subscription.status == "active")
-                )
-                
-                all_subs = result.scalars().all()
-                
-                for sub in all_subs:
-                    # Приводим next_payment к naive datetime если нужно
-                    next_payment_naive = sub.next_payment
-                    if sub.next_payment.tzinfo is not None:
-                        # Предполагаем что дата в базе в MSK (UTC+3)
-                        next_payment_naive = sub.next_payment.replace(tzinfo=None)
-                    
-                    # Теперь вычитаем правильно
-                    days_left = (sub.next_payment.date() - today).days
-                    
-                    # Проверяем, нужно ли отправлять напоминание
-                    should_remind = False
-                    remind_day = None
-                    
-                    for days in REMIND_BEFORE_DAYS:
-                        if days_left == days:
-                            should_remind = True
-                            remind_day = days
-                            break
-                    
-                    if should_remind:
-                        # ИСПРАВЛЕНИЕ: Проверяем, не отправляли ли уже напоминание для ЭТОГО КОНКРЕТНОГО ДНЯ
-                        # Например, если отправляли напоминание за 3 дня, это не должно мешать отправить за 1 день
-                        
-                        # Создаем идентификатор для этого конкретного напоминания
-                        reminder_id = f"{sub.id}_{remind_day}"
-                        
-                        # Проверяем, когда последний раз отправляли напоминание для этого дня
-                        last_reminder_sent = sub.last_reminder_sent
-                        
-                        if last_reminder_sent:
-                            # Приводим last_reminder_sent к timezone-aware если нужно
-                            if last_reminder_sent.tzinfo is None:
-                                last_sent_aware = last_reminder_sent.replace(tzinfo=timezone.utc)
-                            else:
-                                last_sent_aware = last_reminder_sent
-                            
-                            last_sent_date = last_sent_aware.date()
-                            
-                            # ВАЖНОЕ ИСПРАВЛЕНИЕ: 
-                            # Не пропускаем если отправляли сегодня, а проверяем ДЛЯ КАКОГО ДНЯ отправляли
-                            # Для этого добавим поле в базу или будем использовать словарь в памяти
-                            # Но для простоты сделаем так: если напоминание за 0 дней, а мы уже отправляли за 0 дней - пропускаем
-                            # Если напоминание за 1 день, а мы уже отправляли за 1 день - пропускаем
-                            # и т.д.
-                            
-                            # Вместо этого, давайте хранить последний отправленный день в отдельном поле
-                            # Но если нет такого поля, используем упрощенную логику:
-                            # Отправляем напоминание, если не отправляли сегодня ИЛИ если это другое напоминание (за другой день)
-                            
-                            # Простое решение: отправляем каждый раз при проверке, если подходит по дням
-                            # Но чтобы не спамить каждые 10 секунд, добавим минимальный интервал между одинаковыми напоминаниями
-                            # Например, не отправлять одно и то же напоминание чаще чем раз в 12 часов
-                            
-                            time_since_last = now - last_sent_aware
-                            if time_since_last < timedelta(hours=12):
-                                # Не отправляем одинаковые напоминания чаще чем раз в 12 часов
-                                logger.debug(f"Пропускаем {sub.user.telegram_id}, уже отправляли {remind_day} дней назад, прошло {time_since_last}")
-                                continue
-                        
-                        # Отправляем напоминание
-                        try:
-                            if remind_day > 0:
-                                message_text = (
-                                    f"⏰ Напоминание!\n\n"
-                                    f"До следующего платежа по VPN подписке осталось {remind_day} дней.\n"
-                                    f"Дата платежа: {sub.next_payment:%d.%m.%Y}\n\n"
-                                    f"После оплаты нажмите кнопку ниже:"
-                                )
-                            else:
-                                message_text = (
-                                    f"🚨 СРОЧНО!\n\n"
-                                    f"Сегодня последний день оплаты VPN подписки!\n"
-                                    f"Дата платежа: {sub.next_payment:%d.%m.%Y}\n\n"
-                                    f"После оплаты нажмите кнопку ниже:"
-                                )
-                            
-                            await bot.send_message(
-                                chat_id=sub.user.telegram_id,
-                                text=message_text,
-                                reply_markup=pay_keyboard
-                            )
-                            
-                            # Обновляем дату последнего напоминания
-                            sub.last_reminder_sent = now
-                            await session.commit()
-                            
-                            logger.info(f"📨 Отправлено напоминание пользователю {sub.user.telegram_id}, дней до платежа: {remind_day}")
-                            
-                        except Exception as e:
-                            logger.error(f"❌ Ошибка отправки пользователю {sub.user.telegram_id}: {e}")
-                            continue
-                
-                # Проверяем просроченные подписки (next_payment уже прошел)
-                result = await session.execute(
-                    select(Subscription)
-                    .join(User)
-                    .options(selectinload(Subscription.user))
-                    .where(
-                        and_(
-                            Subscription.status == "active",
-                            # Сравниваем timezone-aware даты
-                            Subscription.next_payment < datetime.combine(
-                                today,
-                                datetime.min.time(),
-                                tzinfo=timezone.utc
-                            )
-
-                        )
-                    )
-                )
-                
-                expired_subs = result.scalars().all()
-                
-                for sub in expired_subs:
-                    # Меняем статус на expired
-                    sub.status = "expired"
-                    
-                    # Уведомляем пользователя
+            conn = await connect()
+            if membership is None:
+                # Тики выполняет только реплика, держащая advisory lock
+                await wait_for_leadership(conn)
+            else:
+                partitions = await membership.wait_ready()
+
+            # Сначала LISTEN, потом загрузка — чтобы не пропустить изменения
+            await listen(
+                SUBSCRIPTION_CHANNEL,
+                lambda payload: _on_subscription_changed(queue, payload, partitions, reload),
+                on_close=queue.wakeup,
+                conn=conn,
+            )
+            reload.clear()
+            await load_queue(queue, partitions)
+
+            while not conn.is_closed():
+                if membership is not None and membership.partitions != partitions:
+                    partitions = membership.partitions
+                    reload.set()
+                if reload.is_set():
+                    reload.clear()
+                    await load_queue(queue, partitions)
+                    continue
+
+                today = datetime.now(timezone.utc).date()
+                if purged_on != today:
+                    purged_on = today
+                    await purge_old_reminders(today)
+
+                due_ids = queue.pop_due(datetime.now(timezone.utc))
+                if due_ids:
                     try:
-                        await bot.send_message(
-                            chat_id=sub.user.telegram_id,
-                            text=(
-                                "❌ Ваша VPN подписка истекла!\n\n"
-                                "Для продления обратитесь к администратору."
-                            ),
-                        )
+                        await process_due(queue, due_ids)
                     except Exception as e:
-                        logger.error(f"❌ Не удалось уведомить о просрочке {sub.user.telegram_id}: {e}")
-                
-                await session.commit()
-                
+                        # Не теряем подписки из очереди при сбое БД
+                        logger.error(f"❌ Ошибка обработки напоминаний: {e}")
+                        retry_at = datetime.now(timezone.utc) + RETRY_DELAY
+                        for sub_id in due_ids:
+                            queue.push(sub_id, retry_at)
+                    continue
+                await queue.wait(MAX_SLEEP)
+
+            logger.warning("⚠️ LISTEN-соединение планировщика закрыто, перезапускаем")
+
         except Exception as e:
             logger.error(f"❌ Ошибка в scheduler: {e}")
-        
-        await asyncio.sleep(CHECK_INTERVAL)
\ No newline at end of file
+
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+        await asyncio.sleep(RECONNECT_DELAY)
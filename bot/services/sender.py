@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from typing import Any, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from bot.config import (
+    SEND_RATE,
+    SEND_PER_CHAT_INTERVAL,
+    SEND_WORKERS,
+    SEND_QUEUE_SIZE,
+    SEND_MAX_RETRIES,
+)
+from bot.services.metrics import SEND_DURATION, SEND_FAILURES
+
+logger = logging.getLogger(__name__)
+
+
+def classify_send_error(error: Exception) -> Optional[str]:
+    """
+    Постоянная причина недоставки: blocked (пользователь заблокировал бота),
+    deactivated (аккаунт удалён) или unreachable (чат не найден).
+    None — ошибка временная, сообщение стоит повторить.
+    """
+    if isinstance(error, TelegramForbiddenError):
+        return "deactivated" if "deactivated" in error.message else "blocked"
+    if isinstance(error, TelegramBadRequest) and "chat not found" in error.message:
+        return "unreachable"
+    return None
+
+
+class _RateLimiter:
+    """Равномерно раздаёт слоты отправки: не больше rate сообщений в секунду"""
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+class SendPipeline:
+    """
+    Очередь исходящих сообщений с пулом воркеров.
+
+    Соблюдает общий лимит Telegram (~30 сообщений/с), интервал между
+    сообщениями в один чат и RetryAfter. Очередь ограничена, поэтому
+    одновременно в работе не больше SEND_QUEUE_SIZE + SEND_WORKERS сообщений.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = SEND_WORKERS,
+        rate: float = SEND_RATE,
+        per_chat_interval: float = SEND_PER_CHAT_INTERVAL,
+        queue_size: int = SEND_QUEUE_SIZE,
+        max_retries: int = SEND_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self._workers_count = workers
+        self._limiter = _RateLimiter(rate)
+        self._per_chat_interval = per_chat_interval
+        self._max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._chat_next: dict[int, float] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        for _ in range(self._workers_count):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        await self._queue.join()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь; результат — future с Message или ошибкой"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((chat_id, text, kwargs, future))
+        return future
+
+    async def send_many(self, messages: Iterable[tuple[int, str, dict]]) -> list[Any]:
+        """Отправить пачку; в результате Message или исключение для каждого сообщения"""
+        futures = [await self.send(chat_id, text, **kwargs) for chat_id, text, kwargs in messages]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        ready_at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, ready_at) + self._per_chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, t in self._chat_next.items() if t < now]:
+            del self._chat_next[chat_id]
+
+    async def _deliver(self, chat_id: int, text: str, kwargs: dict):
+        attempt = 0
+        while True:
+            await self._wait_for_chat(chat_id)
+            await self._limiter.acquire()
+            start = time.perf_counter()
+            try:
+                return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except Exception as e:
+                SEND_FAILURES.labels(type(e).__name__).inc()
+                if not isinstance(e, TelegramRetryAfter):
+                    raise
+                # Лимит общий для бота — притормаживаем всех воркеров
+                logger.warning(f"⏳ Telegram просит подождать {e.retry_after} с")
+                self._limiter.pause(e.retry_after)
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+            finally:
+                SEND_DURATION.observe(time.perf_counter() - start)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, future = await self._queue.get()
+            try:
+                message = await self._deliver(chat_id, text, kwargs)
+                if not future.done():
+                    future.set_result(message)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+                if len(self._chat_next) > 10000:
+                    self._forget_idle_chats()
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from bot.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import User
+from bot.db.notify import SUBSCRIPTION_CHANNEL, is_reload, listen
+from bot.db.repository import get_user_with_subscription, upsert_user
+
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class SubscriptionSnapshot:
+    id: int
+    status: str
+    next_payment: datetime
+    period_days: int
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """Неизменяемый снимок пользователя с подпиской для чтения в обработчиках"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    subscription: Optional[SubscriptionSnapshot]
+    delivery_state: str = "ok"  # см. User.delivery_state
+    delivery_retry_at: Optional[datetime] = None
+    timezone: Optional[str] = None  # None — DEFAULT_TIMEZONE
+
+    @property
+    def deliverable(self) -> bool:
+        """Писать можно: бот не заблокирован и пауза после «chat not found» прошла"""
+        return self.delivery_state == "ok" and (
+            self.delivery_retry_at is None or self.delivery_retry_at <= datetime.now(timezone.utc)
+        )
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        sub = user.subscription
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            subscription=SubscriptionSnapshot(
+                id=sub.id,
+                status=sub.status,
+                next_payment=sub.next_payment,
+                period_days=sub.period_days,
+            ) if sub else None,
+            delivery_state=user.delivery_state,
+            delivery_retry_at=user.delivery_retry_at,
+            timezone=user.timezone,
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "UserSnapshot":
+        """Из строки upsert_user"""
+        return cls(
+            id=row.id,
+            telegram_id=row.telegram_id,
+            username=row.username,
+            subscription=SubscriptionSnapshot(
+                id=row.subscription_id,
+                status=row.status,
+                next_payment=row.next_payment,
+                period_days=row.period_days,
+            ) if row.subscription_id is not None else None,
+            delivery_state=row.delivery_state,
+            delivery_retry_at=row.delivery_retry_at,
+            timezone=row.timezone,
+        )
+
+
+class UserCache:
+    """
+    LRU-кэш снимков пользователей по telegram_id с TTL.
+
+    Все операции синхронные и выполняются в одном event loop, поэтому
+    блокировки не нужны; одновременные промахи по одному ключу
+    ждут одну и ту же загрузку.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, UserSnapshot]] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, telegram_id: int) -> Optional[UserSnapshot]:
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, snapshot: UserSnapshot):
+        self._entries[snapshot.telegram_id] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot.telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+        # Загрузка, начатая до изменения, не должна попасть в кэш
+        self._loading.pop(telegram_id, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+
+    async def get_or_load(
+        self,
+        telegram_id: int,
+        loader: Callable[[int], Awaitable[Optional[UserSnapshot]]],
+    ) -> Optional[UserSnapshot]:
+        """Вернуть снимок из кэша или загрузить его; отсутствие пользователя не кэшируется"""
+        snapshot = self.get(telegram_id)
+        if snapshot is not None:
+            return snapshot
+
+        pending = self._loading.get(telegram_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[telegram_id] = future
+        try:
+            snapshot = await loader(telegram_id)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # чтобы не было предупреждения, если никто не ждал
+            raise
+        finally:
+            # invalidate() во время загрузки снимает future — результат устарел
+            fresh = self._loading.get(telegram_id) is future
+            if fresh:
+                del self._loading[telegram_id]
+
+        if fresh and snapshot is not None:
+            self.put(snapshot)
+        future.set_result(snapshot)
+        return snapshot
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+user_cache = UserCache()
+
+
+async def load_user_snapshot(telegram_id: int) -> Optional[UserSnapshot]:
+    async with AsyncSessionLocal() as session:
+        user = await get_user_with_subscription(session, telegram_id)
+        return UserSnapshot.from_user(user) if user else None
+
+
+async def get_user_snapshot(telegram_id: int) -> Optional[UserSnapshot]:
+    """Пользователь с подпиской — из кэша или из БД"""
+    return await user_cache.get_or_load(telegram_id, load_user_snapshot)
+
+
+async def register_user(telegram_id: int, username: Optional[str]) -> tuple[UserSnapshot, bool]:
+    """
+    Снимок пользователя для /start; при промахе кэша пользователь
+    регистрируется (или обновляет username) тем же запросом, что и читается.
+    Тот же запрос снимает отметку о недоступности: раз пользователь пишет
+    боту, писать ему снова можно — поэтому из кэша отвечаем, только если
+    снимать нечего и username не сменился. Возвращает (снимок, новый ли
+    пользователь).
+    """
+    snapshot = user_cache.get(telegram_id)
+    if (
+        snapshot is not None
+        and snapshot.username == username
+        and snapshot.delivery_state == "ok"
+        and snapshot.delivery_retry_at is None
+    ):
+        return snapshot, False
+
+    async with AsyncSessionLocal() as session:
+        row = await upsert_user(session, telegram_id, username)
+        await session.commit()
+    snapshot = UserSnapshot.from_row(row)
+    user_cache.put(snapshot)
+    return snapshot, row.inserted
+
+
+def _on_subscription_changed(payload: str):
+    data = json.loads(payload)
+    if is_reload(data):
+        user_cache.clear()
+        return
+    telegram_id = data.get("telegram_id")
+    if telegram_id is not None:
+        user_cache.invalidate(telegram_id)
+
+
+async def cache_invalidation_listener():
+    """Сбрасывать записи кэша по NOTIFY — в том числе от других реплик и скриптов"""
+    while True:
+        conn = None
+        closed = asyncio.Event()
+        try:
+            conn = await listen(SUBSCRIPTION_CHANNEL, _on_subscription_changed, on_close=closed.set)
+            # Пока соединение не было открыто, изменения могли пройти мимо
+            user_cache.clear()
+            await closed.wait()
+            logger.warning("⚠️ LISTEN-соединение кэша закрыто, переподключаемся")
+        except Exception as e:
+            logger.error(f"❌ Ошибка в слушателе кэша пользователей: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(RECONNECT_DELAY)
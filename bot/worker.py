@@ -0,0 +1,72 @@
+"""
+Отдельный воркер планировщика напоминаний.
+
+Запускается в нескольких экземплярах рядом с ботом (SCHEDULER_MODE=off
+или partitioned): воркеры делят подписки по id % N и сами разбирают outbox.
+
+Запуск: python -m bot.worker [--metrics-port N]
+"""
+import argparse
+import asyncio
+import signal
+
+from aiogram import Bot
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from bot.config import BOT_TOKEN, DATABASE_URL_ASYNCPG, METRICS_PORT
+from bot.main import init_db, wait_for_db
+from bot.services.metrics import start_metrics_server
+from bot.services.outbox import outbox_dispatcher
+from bot.services.partitions import PartitionMembership
+from bot.services.scheduler import subscription_watcher
+from bot.services.sender import SendPipeline
+
+
+async def main(metrics_port: int = METRICS_PORT):
+    await wait_for_db(DATABASE_URL_ASYNCPG)
+    await init_db()
+
+    bot = Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    metrics = await start_metrics_server(port=metrics_port)
+
+    sender = SendPipeline(bot)
+    sender.start()
+
+    membership = PartitionMembership()
+    tasks = [
+        asyncio.create_task(membership.run()),
+        asyncio.create_task(subscription_watcher(membership)),
+        asyncio.create_task(outbox_dispatcher(sender)),
+    ]
+    print(f"Scheduler worker {membership.worker_id} started")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Остальные воркеры заберут партицию сразу, не дожидаясь WORKER_TTL
+        await membership.leave()
+        await sender.stop()
+        await bot.session.close()
+        if metrics is not None:
+            await metrics.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # Несколько воркеров на одном хосте не могут делить один порт
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="порт /metrics, 0 — выключить")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.metrics_port))
@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+import sys
+
+from bot.db.base import engine
+from bot.services.export import (
+    EXPORT_FORMATS,
+    EXPORT_KINDS,
+    export_filename,
+    export_rows,
+    export_to_file,
+)
+
+
+async def main(args):
+    if args.output == "-":
+        count = await export_rows(args.kind, args.format, sys.stdout)
+        path = "stdout"
+    else:
+        path = args.output or export_filename(args.kind, args.format, args.gzip)
+        count = await export_to_file(args.kind, args.format, path, args.gzip)
+    await engine.dispose()
+    print(f"✅ Выгружено {count} строк: {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # Использование: python export_data.py users --format jsonl --gzip
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка данных бота")
+    parser.add_argument("kind", choices=EXPORT_KINDS)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="сжать файл")
+    parser.add_argument("-o", "--output", help="путь к файлу или - для stdout")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Массовый импорт пользователей и подписок из CSV.
+
+Колонки: telegram_id, username, next_payment, period_days, status
+(пустые period_days и status — 30 и active).
+
+Файл целиком заливается COPY во временную таблицу, а затем одним
+INSERT ... ON CONFLICT попадает в users и subscriptions.
+
+Использование: python import_users.py customers.csv [--no-header]
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+
+from bot.config import DATABASE_URL_ASYNCPG
+from bot.db.notify import RELOAD_PAYLOAD, SUBSCRIPTION_CHANNEL
+
+COLUMNS = ["telegram_id", "username", "next_payment", "period_days", "status"]
+
+CREATE_STAGING = """
+CREATE TEMP TABLE import_staging (
+    telegram_id BIGINT NOT NULL,
+    username VARCHAR(64),
+    next_payment TIMESTAMPTZ NOT NULL,
+    period_days INTEGER,
+    status VARCHAR(32)
+) ON COMMIT DROP
+"""
+
+# Повторы telegram_id в файле схлопываются (побеждает последняя строка),
+# иначе ON CONFLICT попытается обновить одну строку дважды.
+# xmax = 0 у вставленных строк отличает их от обновлённых.
+UPSERT = """
+WITH src AS (
+    SELECT DISTINCT ON (telegram_id)
+        telegram_id,
+        NULLIF(username, '') AS username,
+        next_payment,
+        COALESCE(period_days, 30) AS period_days,
+        COALESCE(NULLIF(status, ''), 'active') AS status
+    FROM import_staging
+    ORDER BY telegram_id, ctid DESC
+),
+upserted_users AS (
+    INSERT INTO users (telegram_id, username, created_at)
+    SELECT telegram_id, username, now() FROM src
+    ON CONFLICT (telegram_id) DO UPDATE
+        SET username = COALESCE(EXCLUDED.username, users.username)
+    RETURNING id, telegram_id, (xmax = 0) AS inserted
+),
+upserted_subscriptions AS (
+    INSERT INTO subscriptions (user_id, next_payment, period_days, status)
+    SELECT u.id, s.next_payment, s.period_days, s.status
+    FROM src s
+    JOIN upserted_users u USING (telegram_id)
+    ON CONFLICT (user_id) DO UPDATE
+        SET next_payment = EXCLUDED.next_payment,
+            period_days = EXCLUDED.period_days,
+            status = EXCLUDED.status
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    (SELECT count(*) FILTER (WHERE inserted) FROM upserted_users) AS users_inserted,
+    (SELECT count(*) FILTER (WHERE NOT inserted) FROM upserted_users) AS users_updated,
+    (SELECT count(*) FILTER (WHERE inserted) FROM upserted_subscriptions) AS subscriptions_inserted,
+    (SELECT count(*) FILTER (WHERE NOT inserted) FROM upserted_subscriptions) AS subscriptions_updated
+"""
+
+
+async def import_users(path: str, header: bool = True) -> asyncpg.Record:
+    conn = await asyncpg.connect(DATABASE_URL_ASYNCPG)
+    try:
+        async with conn.transaction():
+            await conn.execute(CREATE_STAGING)
+            await conn.copy_to_table(
+                "import_staging",
+                source=path,
+                columns=COLUMNS,
+                format="csv",
+                header=header,
+            )
+            counts = await conn.fetchrow(UPSERT)
+            # Боты перечитают подписки после commit — одним сообщением на весь импорт
+            await conn.execute("SELECT pg_notify($1, $2)", SUBSCRIPTION_CHANNEL, RELOAD_PAYLOAD)
+        return counts
+    finally:
+        await conn.close()
+
+
+async def main(args):
+    started = time.perf_counter()
+    counts = await import_users(args.path, header=not args.no_header)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Импорт завершён за {elapsed:.1f} с")
+    print(f"   Пользователи: добавлено {counts['users_inserted']}, обновлено {counts['users_updated']}")
+    print(
+        f"   Подписки: добавлено {counts['subscriptions_inserted']}, "
+        f"обновлено {counts['subscriptions_updated']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт пользователей и подписок из CSV")
+    parser.add_argument("path", help="CSV: telegram_id, username, next_payment, period_days, status")
+    parser.add_argument("--no-header", action="store_true", help="в файле нет строки заголовка")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from benchmarks.bench_handlers import callback_update, message_update
+from bot.config import ADMIN_ID
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import Payment
+from bot.main import create_dispatcher
+
+
+@pytest.fixture(scope="module")
+def dispatcher():
+    # Роутеры — модульные объекты и подключаются к одному диспетчеру
+    return create_dispatcher()
+
+
+def selects(sql_log) -> list[str]:
+    """Чтения данных; SELECT pg_notify(...) — это NOTIFY, а не чтение"""
+    return [
+        statement for statement, _ in sql_log
+        if statement.lstrip().upper().startswith("SELECT") and "pg_notify" not in statement
+    ]
+
+
+async def test_status_reads_user_in_one_query(make_user, sql_log, fake_bot, dispatcher):
+    api, bot = fake_bot
+    await make_user(501, "alice", next_payment=datetime.now(timezone.utc) + timedelta(days=10))
+    sql_log.clear()
+
+    await dispatcher.feed_update(bot, message_update(501, "/status"))
+
+    assert len(sql_log) == 1
+    assert "Следующий платёж" in api.sent[-1].text
+
+
+async def test_pay_done_reads_user_in_one_query(make_user, sql_log, fake_bot, dispatcher):
+    api, bot = fake_bot
+    await make_user(502, "bob", next_payment=datetime.now(timezone.utc) + timedelta(days=1))
+    sql_log.clear()
+
+    await dispatcher.feed_update(bot, callback_update(502, "pay_done"))
+
+    assert len(selects(sql_log)) == 1
+    async with AsyncSessionLocal() as session:
+        requests = await session.scalar(
+            select(func.count()).select_from(Payment).where(Payment.status == "requested")
+        )
+    assert requests == 1
+
+
+@pytest.mark.parametrize("search", ["503", "caro"])
+async def test_find_reads_user_in_one_query(make_user, sql_log, fake_bot, dispatcher, search):
+    api, bot = fake_bot
+    await make_user(503, "carol", next_payment=datetime.now(timezone.utc) + timedelta(days=5))
+    sql_log.clear()
+
+    await dispatcher.feed_update(bot, message_update(ADMIN_ID, f"/find {search}"))
+
+    assert len(sql_log) == 1
+    assert "@carol" in api.sent[-1].text
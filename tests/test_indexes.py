@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+from bot.db.base import AsyncSessionLocal, engine
+from bot.db.migrations import MIGRATIONS
+from bot.db.repository import (
+    claim_reminders,
+    create_payment_request,
+    expire_subscriptions,
+    find_user_by_username,
+    get_payments_page,
+    get_pending_payments,
+    get_user_with_subscription,
+    shift_payment_dates,
+    stream_active_subscriptions,
+)
+from bot.services.outbox import claim_batch
+
+# 20 000 пользователей: 30% подписок активны, 1% платежей — заявки, outbox разобран
+SEED = [
+    "INSERT INTO users (telegram_id, username, created_at) "
+    "SELECT 1000000 + g, 'user' || g, now() - g * interval '1 minute' FROM generate_series(1, 20000) g",
+    "INSERT INTO subscriptions (user_id, next_payment, status, period_days) "
+    "SELECT id, now() + (id % 60 - 30) * interval '1 day', "
+    "CASE WHEN id % 10 < 3 THEN 'active' ELSE 'expired' END, 30 FROM users",
+    "INSERT INTO payments (user_id, created_at, status) "
+    "SELECT id, now() - (id % 300) * interval '1 day', "
+    "CASE WHEN id % 100 = 0 THEN 'requested' ELSE 'confirmed' END FROM users",
+    "INSERT INTO notifications (chat_id, text, status, attempts, next_attempt_at, created_at) "
+    "SELECT telegram_id, 'text', 'sent', 1, now() - interval '1 day', now() - interval '1 day' FROM users",
+    "ANALYZE",
+]
+
+
+@pytest.fixture
+async def seeded(db):
+    async with engine.begin() as conn:
+        for statement in SEED:
+            await conn.execute(text(statement))
+
+
+async def explain(statement: str, parameters) -> str:
+    async with AsyncSessionLocal() as session:
+        conn = await session.connection()
+        result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return "\n".join(row[0] for row in result)
+
+
+async def plan(sql_log, call) -> str:
+    """EXPLAIN последнего запроса, который отправил call, с теми же параметрами"""
+    async with AsyncSessionLocal() as session:
+        sql_log.clear()
+        await call(session)
+        await session.rollback()
+    return await explain(*sql_log[-1])
+
+
+async def _stream_active(session):
+    result = await stream_active_subscriptions(session)
+    await result.fetchmany(1)
+    await result.close()
+
+
+async def test_due_subscriptions_use_active_subscriptions_index(seeded, sql_log):
+    due_before = datetime.now(timezone.utc) + timedelta(days=2)
+    explained = await plan(
+        sql_log, lambda session: shift_payment_dates(session, due_before=due_before, shift=timedelta(days=1))
+    )
+    assert "ix_subscriptions_active_next_payment" in explained
+
+
+# Тик планировщика получает наступившие подписки списком id
+DUE_IDS = list(range(1, 20000, 400))
+
+
+async def test_all_migrations_applied(db):
+    async with AsyncSessionLocal() as session:
+        applied = (await session.execute(text("SELECT version FROM schema_migrations"))).scalars().all()
+    assert sorted(applied) == [version for version, _, _ in MIGRATIONS]
+
+
+async def test_scheduler_load_uses_active_subscriptions_index(seeded, sql_log):
+    explained = await plan(sql_log, _stream_active)
+    assert "ix_subscriptions_active_next_payment" in explained
+    assert "Seq Scan on subscriptions" not in explained
+
+
+async def test_reminder_claim_looks_up_due_subscriptions_by_id(seeded, sql_log):
+    now = datetime.now(timezone.utc)
+    explained = await plan(sql_log, lambda session: claim_reminders(session, DUE_IDS, [1, 0], now))
+    assert "subscriptions_pkey" in explained
+    assert "Seq Scan on subscriptions" not in explained
+    assert "Seq Scan on users" not in explained
+
+
+async def test_expiry_looks_up_due_subscriptions_by_id(seeded, sql_log):
+    now = datetime.now(timezone.utc)
+    explained = await plan(sql_log, lambda session: expire_subscriptions(session, DUE_IDS, now))
+    assert "subscriptions_pkey" in explained
+    assert "Seq Scan on subscriptions" not in explained
+    assert "Seq Scan on users" not in explained
+
+
+async def test_outbox_claim_uses_ready_index(seeded, sql_log):
+    sql_log.clear()
+    await claim_batch(datetime.now(timezone.utc))
+    explained = await explain(*sql_log[-1])
+    assert "ix_notifications_ready" in explained
+    assert "Seq Scan on notifications" not in explained
+
+
+async def test_user_paid_lookup_uses_unique_indexes(seeded, sql_log):
+    explained = await plan(sql_log, lambda session: get_user_with_subscription(session, 1005000))
+    assert "users_telegram_id_key" in explained
+    assert "subscriptions_user_id_key" in explained
+
+
+async def test_payment_request_is_single_insert(seeded, sql_log):
+    # Дубль за сутки отсекает ux_payments_requested_per_day при вставке, без чтения payments
+    explained = await plan(
+        sql_log, lambda session: create_payment_request(session, 5000, datetime.now(timezone.utc))
+    )
+    assert "Conflict Resolution: NOTHING" in explained
+    assert "Scan on payments" not in explained
+
+
+async def test_pending_payments_use_requested_index(seeded, sql_log):
+    explained = await plan(sql_log, lambda session: get_pending_payments(session, 30))
+    assert "ix_payments_requested" in explained
+    assert "Seq Scan on payments" not in explained
+
+
+async def test_payments_page_uses_keyset_index(seeded, sql_log):
+    explained = await plan(sql_log, lambda session: get_payments_page(session, 10))
+    assert "ix_payments_created_at_id" in explained
+
+
+async def test_username_search_uses_trigram_index(seeded, sql_log):
+    explained = await plan(sql_log, lambda session: find_user_by_username(session, "ser1234"))
+    assert "ix_users_username_trgm" in explained
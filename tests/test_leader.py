@@ -0,0 +1,65 @@
+import asyncio
+import time
+from functools import partial
+from typing import Optional
+
+import pytest
+from sqlalchemy import text
+
+from bot.db.base import AsyncSessionLocal
+from bot.services import scheduler
+from bot.services.leader import SCHEDULER_LOCK_KEY, wait_for_leadership
+
+
+async def lock_holders(granted: bool = True) -> list[int]:
+    """pid сессий, держащих (или ждущих) advisory lock планировщика"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            text(
+                "SELECT pid FROM pg_locks"
+                " WHERE locktype = 'advisory' AND classid = 0 AND objid = :key AND granted = :granted"
+            ),
+            {"key": SCHEDULER_LOCK_KEY, "granted": granted},
+        )
+        return list(result.scalars().all())
+
+
+async def wait_for_leader(previous: Optional[int] = None, timeout: float = 10) -> int:
+    """Дождаться лидера (другого, чем previous); лидер всегда не больше одного"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        holders = await lock_holders()
+        assert len(holders) <= 1
+        if holders and holders[0] != previous:
+            return holders[0]
+        await asyncio.sleep(0.1)
+    raise AssertionError("лидер планировщика не выбран")
+
+
+@pytest.mark.parametrize("retry_interval", [0.1, 30])
+async def test_one_watcher_leads_and_the_other_takes_over(db, monkeypatch, retry_interval):
+    monkeypatch.setattr(
+        scheduler, "wait_for_leadership", partial(wait_for_leadership, retry_interval=retry_interval)
+    )
+    watchers = [asyncio.create_task(scheduler.subscription_watcher()) for _ in range(2)]
+    try:
+        leader = await wait_for_leader()
+
+        # Второй наблюдатель ждёт блокировку в Postgres, а не опрашивает её
+        await asyncio.sleep(1)
+        assert await lock_holders() == [leader]
+        assert len(await lock_holders(granted=False)) == 1
+
+        # Соединение лидера рвётся — Postgres снимает его блокировку
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": leader})
+        terminated = time.perf_counter()
+
+        assert await wait_for_leader(previous=leader) != leader
+        # Перехват не ждёт следующей попытки: с retry_interval 30 — тоже за доли секунды
+        assert time.perf_counter() - terminated < 1
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
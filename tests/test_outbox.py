@@ -0,0 +1,116 @@
+import asyncio
+import json
+from typing import Optional
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+from sqlalchemy import select
+
+from bot.db.base import AsyncSessionLocal, db_pool_stats
+from bot.db.models import Notification, User
+from bot.db.notify import SUBSCRIPTION_CHANNEL, listen
+from bot.services import scheduler
+from bot.services.outbox import dispatch_batch, enqueue_notifications
+from bot.services.reminder_queue import ReminderQueue
+
+
+class FakeSender:
+    """Вместо SendPipeline: отвечает заданными результатами и смотрит, что творится в БД во время отправки"""
+
+    def __init__(self, failures: Optional[dict[int, Exception]] = None, during_send=None):
+        self.failures = failures or {}
+        self.during_send = during_send
+        self.sent: list[int] = []
+        self.checked_out = None
+
+    async def send_many(self, messages):
+        messages = list(messages)
+        self.checked_out = db_pool_stats()["checked_out"]
+        if self.during_send is not None:
+            await self.during_send()
+        results = []
+        for chat_id, text, kwargs in messages:
+            if chat_id in self.failures:
+                results.append(self.failures[chat_id])
+            else:
+                self.sent.append(chat_id)
+                results.append(text)
+        return results
+
+
+async def _enqueue(chat_ids):
+    async with AsyncSessionLocal() as session:
+        await enqueue_notifications(session, [(chat_id, f"message {chat_id}", None) for chat_id in chat_ids])
+        await session.commit()
+
+
+async def _statuses() -> dict[int, str]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(Notification.chat_id, Notification.status))
+        return dict(result.all())
+
+
+async def test_dispatch_sends_without_holding_a_connection(db):
+    await _enqueue([101, 102, 103])
+    concurrent = []
+
+    async def second_dispatcher():
+        # Пачка в аренде: другой диспетчер её не видит и не ждёт блокировок
+        concurrent.append(await dispatch_batch(FakeSender()))
+
+    sender = FakeSender(during_send=second_dispatcher)
+    assert await dispatch_batch(sender) == 3
+
+    assert sender.checked_out == 0
+    assert concurrent == [0]
+    assert sorted(sender.sent) == [101, 102, 103]
+    assert await _statuses() == {101: "sent", 102: "sent", 103: "sent"}
+
+
+async def test_failed_send_is_retried_later(db):
+    await _enqueue([111, 112])
+
+    await dispatch_batch(FakeSender(failures={112: RuntimeError("Bad Gateway")}))
+
+    assert await _statuses() == {111: "sent", 112: "pending"}
+    # Повтор — после паузы, а не в следующей пачке
+    assert await dispatch_batch(FakeSender()) == 0
+
+
+async def test_dispatch_marks_blocked_users(make_user):
+    await make_user(201)
+    await make_user(202)
+    await _enqueue([201, 202])
+
+    blocked = TelegramForbiddenError(
+        method=SendMessage(chat_id=202, text="message 202"),
+        message="Forbidden: bot was blocked by the user",
+    )
+    await dispatch_batch(FakeSender(failures={202: blocked}))
+
+    assert await _statuses() == {201: "sent", 202: "failed"}
+    async with AsyncSessionLocal() as session:
+        states = dict((await session.execute(select(User.telegram_id, User.delivery_state))).all())
+    assert states == {201: "ok", 202: "blocked"}
+
+
+async def test_blocked_users_are_announced_to_other_replicas(make_user):
+    await make_user(301)
+    await _enqueue([301])
+    received = asyncio.Queue()
+    conn = await listen(SUBSCRIPTION_CHANNEL, received.put_nowait)
+    try:
+        blocked = TelegramForbiddenError(
+            method=SendMessage(chat_id=301, text="message 301"),
+            message="Forbidden: bot was blocked by the user",
+        )
+        await dispatch_batch(FakeSender(failures={301: blocked}))
+        payload = await asyncio.wait_for(received.get(), 5)
+    finally:
+        await conn.close()
+
+    # Кэш любой реплики сбросит пользователя, а планировщик сообщение пропустит
+    assert json.loads(payload) == {"telegram_id": 301}
+    queue = ReminderQueue()
+    scheduler._on_subscription_changed(queue, payload)
+    assert len(queue) == 0
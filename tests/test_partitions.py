@@ -0,0 +1,58 @@
+from sqlalchemy import select
+
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import SchedulerWorker
+from bot.services.partitions import PartitionMembership, owns
+
+IDS = range(120)
+
+
+def unowned(workers: list[PartitionMembership]) -> list[int]:
+    """Подписки, которые сейчас не обрабатывает ни один воркер"""
+    return [sub_id for sub_id in IDS if not any(owns(w.partitions, sub_id) for w in workers)]
+
+
+async def test_rebalance_leaves_no_unowned_subscriptions(db):
+    a, b, c, d = (PartitionMembership(worker_id) for worker_id in "abcd")
+    for worker in (a, b):
+        await worker.refresh()
+    await a.refresh()
+    assert (a.partitions, b.partitions) == (((0, 2),), ((1, 2),))
+
+    # Новые воркеры приходят, остальные узнают об этом на своём heartbeat —
+    # в любой момент у каждой подписки есть владелец
+    live = [a, b]
+    for newcomer in (c, d):
+        live.append(newcomer)
+        await newcomer.refresh()
+        assert unowned(live) == []
+        for worker in live:
+            await worker.refresh()
+            assert unowned(live) == []
+
+    # Раскладка одной эпохи — общая для всех
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(select(SchedulerWorker).order_by(SchedulerWorker.worker_id))).scalars().all()
+    assert {row.epoch for row in rows} == {a.epoch}
+    assert [(row.slot, row.workers) for row in rows] == [(0, 4), (1, 4), (2, 4), (3, 4)]
+
+    # Когда новую эпоху подтвердили все, прежние партиции отпускаются
+    for worker in live:
+        await worker.refresh()
+    assert [w.partitions for w in live] == [((k, 4),) for k in range(4)]
+
+
+async def test_worker_leaving_hands_over_partition(db):
+    workers = [PartitionMembership(worker_id) for worker_id in "abc"]
+    for _ in range(2):
+        for worker in workers:
+            await worker.refresh()
+
+    await workers[1].leave()
+    live = [workers[0], workers[2]]
+    for _ in range(2):
+        for worker in live:
+            await worker.refresh()
+
+    assert unowned(live) == []
+    assert [w.partitions for w in live] == [((0, 2),), ((1, 2),)]
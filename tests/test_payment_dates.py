@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import ReminderLog, Subscription
+from bot.db.repository import shift_payment_dates
+from update_payment_date import update_payment_dates
+
+
+async def _remind(sub_id: int, next_payment: datetime):
+    async with AsyncSessionLocal() as session:
+        session.add(ReminderLog(subscription_id=sub_id, next_payment_date=next_payment.date(), offset_days=1))
+        await session.commit()
+
+
+async def _state(sub_id: int) -> tuple[datetime, int]:
+    async with AsyncSessionLocal() as session:
+        next_payment = await session.scalar(select(Subscription.next_payment).where(Subscription.id == sub_id))
+        reminders = await session.scalar(
+            select(func.count()).select_from(ReminderLog).where(ReminderLog.subscription_id == sub_id)
+        )
+    return next_payment, reminders
+
+
+async def test_shift_without_filter_is_rejected(db):
+    async with AsyncSessionLocal() as session:
+        with pytest.raises(ValueError):
+            await shift_payment_dates(session, shift=timedelta(days=1))
+
+
+async def test_batch_update_rearms_reminders(make_user):
+    next_payment = datetime.now(timezone.utc) + timedelta(days=1)
+    _, sub_id = await make_user(601, next_payment=next_payment)
+    await _remind(sub_id, next_payment)
+
+    await update_payment_dates(telegram_ids=[601], shift_days=0)
+
+    assert await _state(sub_id) == (next_payment, 0)
+
+
+async def test_dry_run_changes_and_locks_nothing(make_user):
+    next_payment = datetime.now(timezone.utc) + timedelta(days=1)
+    _, sub_id = await make_user(602, next_payment=next_payment)
+    await _remind(sub_id, next_payment)
+
+    async with AsyncSessionLocal() as holder:
+        # Чужая транзакция держит строку: пробный запуск не должен её ждать
+        await holder.execute(select(Subscription).where(Subscription.id == sub_id).with_for_update())
+        await asyncio.wait_for(update_payment_dates(telegram_ids=[602], shift_days=3, dry_run=True), 5)
+        await holder.rollback()
+
+    assert await _state(sub_id) == (next_payment, 1)
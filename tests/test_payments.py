@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, text
+
+from bot.db.base import AsyncSessionLocal, engine
+from bot.db.migrations import run_migrations
+from bot.db.models import Payment, Subscription
+from bot.db.repository import confirm_payments, create_payment_request
+
+
+async def _request(user_id: int, created_at: datetime, started: asyncio.Barrier):
+    async with AsyncSessionLocal() as session:
+        await started.wait()
+        payment_id = await create_payment_request(session, user_id, created_at)
+        await session.commit()
+        return payment_id
+
+
+@pytest.mark.parametrize("burst", [2, 100])
+async def test_concurrent_requests_create_one_payment(make_user, burst):
+    user_id, _ = await make_user(701)
+    now = datetime.now(timezone.utc)
+    started = asyncio.Barrier(burst)
+
+    # Остальные транзакции ждут первую на уникальном индексе и получают конфликт, а не IntegrityError
+    results = await asyncio.gather(*(
+        _request(user_id, now + timedelta(milliseconds=i), started) for i in range(burst)
+    ))
+
+    assert len([payment_id for payment_id in results if payment_id is not None]) == 1
+    async with AsyncSessionLocal() as session:
+        count = await session.scalar(select(func.count()).select_from(Payment).where(Payment.user_id == user_id))
+    assert count == 1
+
+
+async def test_migration_reports_duplicate_requests(make_user, caplog):
+    user_id, _ = await make_user(702)
+    async with engine.begin() as conn:
+        # Состояние до миграции 4: индекса нет, за день накопились три заявки
+        await conn.execute(text("DROP INDEX ux_payments_requested_per_day"))
+        await conn.execute(text("DELETE FROM schema_migrations WHERE version = 4"))
+        await conn.execute(
+            text(
+                "INSERT INTO payments (user_id, status, created_at)"
+                " SELECT :user_id, 'requested', now() FROM generate_series(1, 3)"
+            ),
+            {"user_id": user_id},
+        )
+
+    with caplog.at_level(logging.WARNING, logger="bot.db.migrations"):
+        assert await run_migrations() == [4]
+
+    assert "Миграция 4: изменено строк — 2" in caplog.text
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(Payment.status, func.count()).group_by(Payment.status))
+        assert dict(result.all()) == {"requested": 1, "duplicate": 2}
+
+
+async def _requested_payment(user_id: int, created_at: datetime) -> int:
+    async with AsyncSessionLocal() as session:
+        payment_id = await create_payment_request(session, user_id, created_at)
+        await session.commit()
+        return payment_id
+
+
+async def test_concurrent_confirms_create_one_subscription(make_user):
+    user_id, _ = await make_user(703)
+    now = datetime.now(timezone.utc)
+    first = await _requested_payment(user_id, now - timedelta(days=1))
+    second = await _requested_payment(user_id, now)
+
+    async with AsyncSessionLocal() as holder:
+        # Первое подтверждение создало подписку, но ещё не закоммитило её
+        await confirm_payments(holder, [first])
+
+        async def confirm_second():
+            async with AsyncSessionLocal() as session:
+                rows = await confirm_payments(session, [second])
+                await session.commit()
+                return rows
+
+        racing = asyncio.create_task(confirm_second())
+        await asyncio.sleep(0.3)
+        await holder.commit()
+        rows = await asyncio.wait_for(racing, 5)
+
+    assert [row.months for row in rows] == [1]
+    async with AsyncSessionLocal() as session:
+        subs = (await session.execute(select(Subscription).where(Subscription.user_id == user_id))).scalars().all()
+    assert len(subs) == 1
+    # Вторая заявка продлила подписку, созданную первой: два месяца от сегодня
+    assert (subs[0].next_payment - now).days >= 58
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from bot.db.base import AsyncSessionLocal
+from bot.db.profiling import UpdateProfile, current_profile, set_profiling, settings
+
+
+@pytest.fixture
+def profiling():
+    enabled = settings.enabled
+    set_profiling(True)
+    yield
+    set_profiling(enabled)
+
+
+async def test_failed_statement_leaves_no_timing_behind(db, profiling):
+    async with AsyncSessionLocal() as session:
+        with pytest.raises(DBAPIError):
+            await session.execute(text("SELECT 1 / 0"))
+        await session.rollback()
+
+        # Выключенное профилирование не должно досчитывать чужой старт
+        set_profiling(False)
+        profile = UpdateProfile("test")
+        token = current_profile.set(profile)
+        try:
+            await session.execute(text("SELECT 1"))
+        finally:
+            current_profile.reset(token)
+
+    assert profile.statements == 0
+
+
+async def test_statements_are_timed_per_update(db, profiling):
+    profile = UpdateProfile("test")
+    token = current_profile.set(profile)
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SELECT 1"))
+            await session.execute(text("SELECT 2"))
+    finally:
+        current_profile.reset(token)
+
+    assert profile.statements == 2
+    assert 0 < profile.db_time < 5
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, func, select, update
+
+from bot.config import DELIVERY_WINDOW_END, DELIVERY_WINDOW_START
+from bot.db.base import AsyncSessionLocal, engine
+from bot.db.models import Notification, ReminderLog, Subscription, User
+from bot.services.delivery_window import delivery_window, send_slot
+from bot.services.reminder_queue import ReminderQueue
+from bot.services.scheduler import process_due
+
+
+def zone_inside_window(now: datetime) -> str:
+    """Etc/GMT-пояс, в котором сейчас середина окна доставки"""
+    offset = ((DELIVERY_WINDOW_START + DELIVERY_WINDOW_END) // 2 - now.hour) % 24
+    if offset > 14:
+        offset -= 24
+    # В именах Etc/GMT знак обратный: Etc/GMT-3 — это UTC+3
+    return f"Etc/GMT{-offset:+d}"
+
+
+async def _due_subscriptions(make_user, first_telegram_id: int, count: int) -> list[int]:
+    """count подписок с напоминанием на завтра и count просроченных"""
+    now = datetime.now(timezone.utc)
+    zone = zone_inside_window(now)
+    ids = []
+    for i in range(count):
+        _, remind_id = await make_user(first_telegram_id + 2 * i, next_payment=now + timedelta(days=1), timezone_name=zone)
+        _, expire_id = await make_user(first_telegram_id + 2 * i + 1, next_payment=now - timedelta(days=2), timezone_name=zone)
+        ids += [remind_id, expire_id]
+    return ids
+
+
+async def test_process_due_uses_fixed_number_of_statements(make_user, sql_log):
+    commits = []
+
+    def _on_commit(conn):
+        commits.append(conn)
+
+    event.listen(engine.sync_engine, "commit", _on_commit)
+    try:
+        measured = []
+        for first_telegram_id, count in ((1000, 1), (2000, 25)):
+            ids = await _due_subscriptions(make_user, first_telegram_id, count)
+            sql_log.clear()
+            commits.clear()
+
+            await process_due(ReminderQueue(), ids)
+
+            measured.append((len(sql_log), len(commits)))
+    finally:
+        event.remove(engine.sync_engine, "commit", _on_commit)
+
+    # Число запросов и транзакций тика не зависит от числа подписок
+    assert measured[0] == measured[1]
+    assert measured[1][1] == 1
+
+    async with AsyncSessionLocal() as session:
+        notifications = await session.scalar(select(func.count()).select_from(Notification))
+        expired = await session.scalar(
+            select(func.count()).select_from(Subscription).where(Subscription.status == "expired")
+        )
+    assert notifications == 2 * 26
+    assert expired == 26
+
+
+async def test_process_due_does_not_repeat_reminders(make_user):
+    ids = await _due_subscriptions(make_user, 3000, 3)
+
+    await process_due(ReminderQueue(), ids)
+    await process_due(ReminderQueue(), ids)
+
+    async with AsyncSessionLocal() as session:
+        notifications = await session.scalar(select(func.count()).select_from(Notification))
+    assert notifications == 6
+
+
+async def test_reminder_waits_for_delivery_pause_inside_window(make_user):
+    now = datetime.now(timezone.utc)
+    zone = zone_inside_window(now)
+    _, sub_id = await make_user(3100, next_payment=now + timedelta(days=1), timezone_name=zone)
+    # «chat not found» недавно: писать можно через пару секунд, окно ещё идёт
+    retry_at = now + timedelta(seconds=2)
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(User).where(User.telegram_id == 3100).values(delivery_retry_at=retry_at))
+        await session.commit()
+
+    queue = ReminderQueue()
+    await process_due(queue, [sub_id])
+
+    # Напоминание за день не занято и ждёт конца паузы, а не завтрашнего окна
+    today = now.astimezone(ZoneInfo(zone)).date()
+    assert queue.earliest() == max(retry_at, send_slot(sub_id, today, ZoneInfo(zone)))
+    assert queue.earliest() < delivery_window(today, ZoneInfo(zone))[1]
+
+    await asyncio.sleep((retry_at - datetime.now(timezone.utc)).total_seconds() + 0.1)
+    await process_due(queue, [sub_id])
+
+    async with AsyncSessionLocal() as session:
+        offsets = (await session.execute(select(ReminderLog.offset_days))).scalars().all()
+    assert offsets == [1]
+    # Отправленное напоминание больше не ставится на сегодня
+    assert queue.earliest() > delivery_window(today, ZoneInfo(zone))[1]
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, text, update
+
+from bot.db import repository
+from bot.db.base import AsyncSessionLocal, engine
+from bot.db.migrations import run_migrations
+from bot.db.models import Notification, ReminderLog, User
+from bot.db.repository import set_user_timezone, user_timezone
+from bot.services import delivery_window
+from bot.services.delivery_window import get_zone, is_valid_timezone
+from bot.services.reminder_queue import ReminderQueue
+from bot.services.scheduler import process_due
+from tests.test_scheduler import zone_inside_window
+
+# zoneinfo открывает эти файлы, а timezone() в Postgres — нет
+SYSTEM_ZONES = ["posixrules", "localtime", "right/Europe/Moscow", "posix/Europe/Moscow"]
+
+
+@pytest.fixture
+def default_zone_in_window(monkeypatch):
+    """DEFAULT_TIMEZONE, в котором сейчас идёт окно доставки"""
+    zone = zone_inside_window(datetime.now(timezone.utc))
+    monkeypatch.setattr(repository, "DEFAULT_TIMEZONE", zone)
+    monkeypatch.setattr(delivery_window, "DEFAULT_TIMEZONE", zone)
+    get_zone.cache_clear()
+    yield zone
+    get_zone.cache_clear()
+
+
+async def _set_raw_timezone(telegram_id: int, name: str):
+    """Пояс в обход проверок — как у строк, сохранённых до них"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(User).where(User.telegram_id == telegram_id).values(timezone=name))
+        await session.commit()
+
+
+@pytest.mark.parametrize("name", SYSTEM_ZONES)
+def test_system_zone_files_are_rejected(name):
+    assert not is_valid_timezone(name)
+
+
+def test_iana_zones_are_accepted():
+    assert is_valid_timezone("Europe/Moscow")
+    assert is_valid_timezone("Asia/Novosibirsk")
+
+
+async def test_set_user_timezone_checks_postgres(make_user):
+    await make_user(901)
+    async with AsyncSessionLocal() as session:
+        assert not await set_user_timezone(session, 901, "posixrules")
+        assert await set_user_timezone(session, 901, "Asia/Novosibirsk")
+        await session.commit()
+        assert await session.scalar(select(User.timezone).where(User.telegram_id == 901)) == "Asia/Novosibirsk"
+
+
+async def test_unknown_zone_falls_back_in_sql(make_user):
+    await make_user(902)
+    await _set_raw_timezone(902, "posixrules")
+    async with AsyncSessionLocal() as session:
+        zone = await session.scalar(select(user_timezone(User)).where(User.telegram_id == 902))
+    assert zone == repository.DEFAULT_TIMEZONE
+
+
+async def test_one_broken_zone_does_not_fail_the_tick(make_user, default_zone_in_window):
+    now = datetime.now(timezone.utc)
+    ids = []
+    for telegram_id in (903, 904):
+        _, remind_id = await make_user(telegram_id, next_payment=now + timedelta(days=1), timezone_name=default_zone_in_window)
+        _, expire_id = await make_user(telegram_id + 10, next_payment=now - timedelta(days=2))
+        ids += [remind_id, expire_id]
+    await _set_raw_timezone(903, "right/Europe/Moscow")
+    await _set_raw_timezone(913, "localtime")
+
+    await process_due(ReminderQueue(), ids)
+
+    async with AsyncSessionLocal() as session:
+        assert await session.scalar(select(func.count()).select_from(ReminderLog)) == 2
+        assert await session.scalar(select(func.count()).select_from(Notification)) == 4
+
+
+async def test_reminder_backfill_uses_local_dates(make_user):
+    # Владивосток (UTC+10): напоминание ушло 17.10 в 23:00 по местному,
+    # платёж 21.10 в 01:00 по местному — за 4 дня, хотя в UTC разница 3 дня
+    next_payment = datetime(2026, 10, 20, 15, tzinfo=timezone.utc)
+    reminded = datetime(2026, 10, 17, 13, tzinfo=timezone.utc)
+    _, sub_id = await make_user(905, next_payment=next_payment, timezone_name="Asia/Vladivostok")
+    async with engine.begin() as conn:
+        # Схема до миграции 3
+        await conn.execute(text("ALTER TABLE subscriptions ADD COLUMN last_reminder_sent TIMESTAMPTZ"))
+        await conn.execute(
+            text("UPDATE subscriptions SET last_reminder_sent = :reminded WHERE id = :sub_id"),
+            {"reminded": reminded, "sub_id": sub_id},
+        )
+        await conn.execute(text("DELETE FROM schema_migrations WHERE version IN (3, 7)"))
+
+    # Миграция 3 переносит журнал в UTC, миграция 7 пересчитывает по поясу пользователя
+    assert await run_migrations() == [3, 7]
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(ReminderLog.next_payment_date, ReminderLog.offset_days))
+        assert result.all() == [(next_payment.date(), 4)]
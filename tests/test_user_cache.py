@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, update
+
+from bot.db.base import AsyncSessionLocal
+from bot.db.models import User
+from bot.services.user_cache import UserSnapshot, register_user, user_cache
+
+
+def snapshot(telegram_id: int, state: str = "ok", retry_at=None) -> UserSnapshot:
+    return UserSnapshot(
+        id=1,
+        telegram_id=telegram_id,
+        username=None,
+        subscription=None,
+        delivery_state=state,
+        delivery_retry_at=retry_at,
+    )
+
+
+async def _set_state(telegram_id: int, state: str, retry_at=None):
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(delivery_state=state, delivery_retry_at=retry_at)
+        )
+        await session.commit()
+
+
+async def _state(telegram_id: int):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(User.delivery_state, User.delivery_retry_at).where(User.telegram_id == telegram_id)
+        )
+        return tuple(result.one())
+
+
+def test_deliverable_after_retry_pause():
+    now = datetime.now(timezone.utc)
+    assert snapshot(1).deliverable
+    assert snapshot(1, retry_at=now - timedelta(minutes=1)).deliverable
+    assert not snapshot(1, retry_at=now + timedelta(hours=1)).deliverable
+    assert not snapshot(1, state="blocked").deliverable
+
+
+async def test_start_resets_blocked_user_despite_cache(make_user):
+    await make_user(801)
+    await _set_state(801, "blocked")
+    user_cache.put(snapshot(801, state="blocked"))
+
+    user, created = await register_user(801, None)
+
+    assert not created and user.deliverable
+    assert await _state(801) == ("ok", None)
+
+
+async def test_start_clears_expired_retry_pause(make_user):
+    # Пауза прошла — писать уже можно, но отметка в БД всё равно снимается
+    retry_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    await make_user(802)
+    await _set_state(802, "ok", retry_at)
+    user_cache.put(snapshot(802, retry_at=retry_at))
+
+    await register_user(802, None)
+
+    assert await _state(802) == ("ok", None)
+
+
+async def test_start_uses_cache_when_nothing_to_reset(make_user, sql_log):
+    await make_user(803)
+    user_cache.put(snapshot(803))
+    sql_log.clear()
+
+    user, created = await register_user(803, None)
+
+    assert user == snapshot(803) and not created
+    assert sql_log == []
+
+
+@pytest.mark.parametrize("burst", [2, 100])
+async def test_concurrent_start_registers_once(db, burst):
+    started = asyncio.Barrier(burst)
+
+    async def start():
+        await started.wait()
+        return await register_user(804, "newcomer")
+
+    results = await asyncio.gather(*(start() for _ in range(burst)))
+
+    assert sum(created for _, created in results) == 1
+    assert len({user.id for user, _ in results}) == 1
+    async with AsyncSessionLocal() as session:
+        assert await session.scalar(select(func.count()).select_from(User)) == 1
+
+
+async def test_start_updates_changed_username_despite_cache(make_user):
+    await make_user(805, username="old_name")
+    user_cache.put(snapshot(805))
+
+    user, _ = await register_user(805, "new_name")
+
+    assert user.username == "new_name"
+    async with AsyncSessionLocal() as session:
+        assert await session.scalar(select(User.username).where(User.telegram_id == 805)) == "new_name"
@@ -1,10 +1,22 @@
 import asyncio
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 from bot.db.base import AsyncSessionLocal
-from bot.db.models import User, Subscription
+from bot.db.notify import (
+    notify_subscription_changed,
+    notify_subscriptions_changed,
+    notify_subscriptions_reload,
+    subscription_payload,
+)
+from bot.db.repository import (
+    clear_reminder_log,
+    get_user_with_subscription,
+    shift_payment_dates,
+    stream_users_with_subscription,
+)
+
+# Больше изменённых подписок — одно сообщение о перезагрузке вместо NOTIFY на каждую
+NOTIFY_BATCH_LIMIT = 1000
 
 async def update_payment_date(telegram_id: int, days_from_now: int = 1):
     """
@@ -15,12 +27,7 @@ async def update_payment_date(telegram_id: int, days_from_now: int = 1):
     """
     async with AsyncSessionLocal() as session:
         # Находим пользователя
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_with_subscription(session, telegram_id)
         
         if not user:
             print(f"❌ Пользователь с telegram_id={telegram_id} не найден")
@@ -35,8 +42,10 @@ async def update_payment_date(telegram_id: int, days_from_now: int = 1):
         
         # Обновляем дату
         user.subscription.next_payment = new_date
-        user.subscription.last_reminder_sent = None  # Сбрасываем напоминания
+        await clear_reminder_log(session, [user.subscription.id])  # Сбрасываем напоминания
         
+        # Сообщаем планировщику бота о новой дате
+        await notify_subscription_changed(session, user.subscription, telegram_id)
         await session.commit()
         
         print(f"✅ Обновлено для пользователя @{user.username or telegram_id}")
@@ -52,36 +61,109 @@ async def update_payment_date(telegram_id: int, days_from_now: int = 1):
 async def list_all_users():
     """Показать всех пользователей"""
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User)
-            .options(selectinload(User.subscription))
-            .order_by(User.created_at.desc())
-        )
-        users = result.scalars().all()
-        
+        # Потоком, чтобы не держать всю таблицу в памяти
+        result = await stream_users_with_subscription(session)
+        now = datetime.now(timezone.utc)
+
         print("\n📋 Все пользователи:")
         print("=" * 70)
-        for user in users:
-            has_sub = "✅" if user.subscription else "❌"
+        async for telegram_id, username, next_payment in result:
+            has_sub = "✅" if next_payment else "❌"
             sub_info = ""
-            if user.subscription:
-                now = datetime.now(timezone.utc)
-                days_left = (user.subscription.next_payment - now).days
-                sub_info = f" | Платеж: {user.subscription.next_payment:%d.%m.%Y} | Дней: {days_left}"
-            
-            print(f"{has_sub} ID: {user.telegram_id} | @{user.username or 'нет'}{sub_info}")
+            if next_payment:
+                days_left = (next_payment - now).days
+                sub_info = f" | Платеж: {next_payment:%d.%m.%Y} | Дней: {days_left}"
+
+            print(f"{has_sub} ID: {telegram_id} | @{username or 'нет'}{sub_info}")
         print("=" * 70)
 
+async def update_payment_dates(
+    telegram_ids=None,
+    due_within=None,
+    days_from_now=None,
+    shift_days=None,
+    dry_run=False,
+):
+    """
+    Пакетно обновить даты платежей одним UPDATE в одной транзакции
+
+    :param telegram_ids: список ID пользователей в Telegram
+    :param due_within: все активные подписки с платежом в ближайшие N дней
+    :param days_from_now: поставить платёж через N дней от сегодня
+    :param shift_days: сдвинуть текущую дату платежа на N дней
+    :param dry_run: только показать итог: ничего не меняет и не блокирует
+    """
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as session:
+        rows = await shift_payment_dates(
+            session,
+            telegram_ids=telegram_ids,
+            due_before=now + timedelta(days=due_within) if due_within is not None else None,
+            set_to=now + timedelta(days=days_from_now) if days_from_now is not None else None,
+            shift=timedelta(days=shift_days) if shift_days is not None else None,
+            dry_run=dry_run,
+        )
+
+        if not dry_run:
+            # Сбрасываем напоминания, как и при обновлении одного пользователя
+            await clear_reminder_log(session, [row.id for row in rows])
+            # Небольшие пачки — точечными NOTIFY, крупные — одной перезагрузкой
+            if len(rows) > NOTIFY_BATCH_LIMIT:
+                await notify_subscriptions_reload(session)
+            else:
+                await notify_subscriptions_changed(session, [subscription_payload(*row) for row in rows])
+            await session.commit()
+
+    print(f"{'🧪 Пробный запуск' if dry_run else '✅ Готово'}: обновлено подписок {len(rows)}")
+    if telegram_ids is not None:
+        missing = len(set(telegram_ids)) - len({row.telegram_id for row in rows})
+        if missing:
+            print(f"   ⚠️ Без подписки или не найдено: {missing}")
+    if rows:
+        dates = [row.next_payment for row in rows]
+        print(f"   Новые даты платежа: {min(dates):%d.%m.%Y} — {max(dates):%d.%m.%Y}")
+
+
+def read_ids(path: str) -> list[int]:
+    """ID из файла: по одному на строку, пустые строки и # пропускаются"""
+    with open(path) as f:
+        return [int(line) for line in (l.strip() for l in f) if line and not line.startswith("#")]
+
+
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обновление дат платежей")
+    parser.add_argument("telegram_id", nargs="?", type=int)
+    parser.add_argument("days", nargs="?", type=int, default=1)
+    parser.add_argument("--ids", nargs="+", type=int, help="несколько telegram_id")
+    parser.add_argument("--file", help="файл с telegram_id, по одному на строку")
+    parser.add_argument("--due-within", type=int, metavar="N", help="активные подписки с платежом в ближайшие N дней")
+    date = parser.add_mutually_exclusive_group()
+    date.add_argument("--days", dest="set_days", type=int, metavar="N", help="платёж через N дней от сегодня")
+    date.add_argument("--shift", type=int, metavar="N", help="сдвинуть дату платежа на N дней")
+    parser.add_argument("--dry-run", action="store_true", help="показать итог без изменений")
+    args = parser.parse_args()
+
+    if args.ids or args.file or args.due_within is not None:
+        # Пакетный режим
+        ids = None
+        if args.ids or args.file:
+            ids = (args.ids or []) + (read_ids(args.file) if args.file else [])
+        if args.set_days is None and args.shift is None:
+            parser.error("в пакетном режиме нужен --days или --shift")
+
+        asyncio.run(update_payment_dates(
+            telegram_ids=ids,
+            due_within=args.due_within,
+            days_from_now=args.set_days,
+            shift_days=args.shift,
+            dry_run=args.dry_run,
+        ))
+    elif args.telegram_id is not None:
         # Использование: python update_payment_date.py TELEGRAM_ID DAYS_FROM_NOW
-        telegram_id = int(sys.argv[1])
-        days = int(sys.argv[2]) if len(sys.argv) > 2 else 1
-        
-        print(f"🔄 Обновление даты платежа для пользователя {telegram_id}")
-        asyncio.run(update_payment_date(telegram_id, days))
+        print(f"🔄 Обновление даты платежа для пользователя {args.telegram_id}")
+        asyncio.run(update_payment_date(args.telegram_id, args.days))
     else:
         # Показать всех пользователей
         asyncio.run(list_all_users())
@@ -89,4 +171,8 @@ if __name__ == "__main__":
         print("  python update_payment_date.py TELEGRAM_ID [DAYS_FROM_NOW]")
         print("  Пример: python update_payment_date.py 123456789 1  (платеж через 1 день)")
         print("  Пример: python update_payment_date.py 123456789 0  (платеж сегодня)")
-        print("  Пример: python update_payment_date.py 123456789 -1 (просроченный платеж)")
\ No newline at end of file
+        print("  Пример: python update_payment_date.py 123456789 -1 (просроченный платеж)")
+        print("\n  Пакетно (один UPDATE):")
+        print("  python update_payment_date.py --ids 1 2 3 --days 1")
+        print("  python update_payment_date.py --file ids.txt --shift 3")
+        print("  python update_payment_date.py --due-within 7 --shift 3 --dry-run")